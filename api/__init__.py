@@ -0,0 +1,221 @@
+import asyncio
+import hmac
+import importlib
+import logging
+import os
+import signal
+import azure.functions as func
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from shared.database import precalentarPool, cerrarEngines, leerConfig
+from shared.bitacora import bitacora
+from shared.diario import diarioVotos, HABILITADO as ESCRITURA_DIFERIDA
+from shared.codec import aJson, MAX_CUERPO_BYTES
+from shared.instrumentacion import medirPeticion, registrarMedicion
+from shared.models import configurarMappers
+
+# (método, ruta, módulo del endpoint, requiere clave de función)
+RUTAS = [
+    ("POST", "/api/votar", "votar", False),
+    ("POST", "/api/votarBoleta", "votarBoleta", False),
+    ("POST", "/api/sesionVotacion", "sesionVotacion", False),
+    ("GET", "/api/recibos/{tokenGUID}", "verificarRecibo", False),
+    ("GET", "/api/resultados/{votacionID}", "resultadosVotacion", False),
+    ("GET", "/api/participacion/{votacionID}", "participacionVotacion", True),
+    ("GET", "/api/exportacion/{votacionID}", "exportarVotacion", True),
+    ("POST", "/api/listarVotos", "listarVotos", True),
+    ("POST", "/api/comentar", "comentar", True),
+    ("POST", "/api/configurarVotacion", "configurarVotacion", False),
+    ("POST", "/api/crearActualizarPropuesta", "crearActualizarPropuesta", False),
+    ("POST", "/api/revisarPropuesta", "revisarPropuesta", False),
+    ("POST", "/api/invertir", "invertir", True),
+    ("POST", "/api/repartirDividendos", "repartirDividendos", False),
+    ("GET", "/api/health/pool", "healthPool", True),
+]
+
+# Reemplaza el authLevel "function" que tenían las rutas por separado. Sin la
+# setting las rutas protegidas se rechazan; para desarrollar en local sin clave
+# hay que pedirlo explícitamente con `ApiPermitirSinClave=true`.
+CLAVE_FUNCIONES = leerConfig("ApiClaveFunciones", None)
+PERMITIR_SIN_CLAVE = leerConfig("ApiPermitirSinClave", False, bool)
+
+if not CLAVE_FUNCIONES and not PERMITIR_SIN_CLAVE:
+    logging.error("ApiClaveFunciones no está configurada: las rutas protegidas responderán 401")
+
+
+@asynccontextmanager
+async def ciclo(app: FastAPI):
+    configurarMappers()
+    await precalentarPool()
+    if ESCRITURA_DIFERIDA:
+        diarioVotos.iniciar()
+    yield
+    await diarioVotos.vaciar()
+    await bitacora.vaciar()
+    await cerrarEngines()
+
+
+app = FastAPI(title="Voto Pura Vida", lifespan=ciclo)
+
+
+def claveValida(request: Request) -> bool:
+    if not CLAVE_FUNCIONES:
+        return PERMITIR_SIN_CLAVE
+    clave = request.headers.get("x-functions-key") or request.query_params.get("code") or ""
+    return hmac.compare_digest(clave, CLAVE_FUNCIONES)
+
+
+def montarRuta(metodo: str, ruta: str, modulo: str, protegida: bool):
+    """
+    Expone el `main(req)` de una carpeta de función como ruta de FastAPI. El
+    módulo se importa en la primera petición para no cargar los ocho endpoints
+    en el arranque en frío.
+    """
+    async def endpoint(request: Request) -> Response:
+        if protegida and not claveValida(request):
+            return Response(
+                content=aJson({"error": "No autorizado"}),
+                status_code=401,
+                media_type="application/json",
+            )
+        cuerpo = await request.body()
+        if len(cuerpo) > MAX_CUERPO_BYTES:
+            return Response(
+                content=aJson({"error": f"El cuerpo de la solicitud supera el máximo de {MAX_CUERPO_BYTES} bytes"}),
+                status_code=413,
+                media_type="application/json",
+            )
+        handler = importlib.import_module(modulo).main
+        with medirPeticion(modulo) as medicion:
+            respuesta = await handler(func.HttpRequest(
+                method=request.method,
+                url=str(request.url),
+                headers=dict(request.headers),
+                params=dict(request.query_params),
+                route_params=dict(request.path_params),
+                body=cuerpo,
+            ))
+        headers = dict(respuesta.headers)
+        if medicion is not None:
+            headers["Server-Timing"] = medicion.serverTiming()
+            registrarMedicion(medicion, respuesta.status_code)
+        return Response(
+            content=respuesta.get_body(),
+            status_code=respuesta.status_code,
+            headers=headers,
+            media_type=respuesta.mimetype,
+        )
+
+    app.add_api_route(ruta, endpoint, methods=[metodo], name=modulo, include_in_schema=False)
+
+
+for _ruta in RUTAS:
+    montarRuta(*_ruta)
+
+
+middleware = func.AsgiMiddleware(app)
+_inicio = asyncio.Lock()
+_iniciada = False
+
+
+async def asegurarInicio():
+    """Corre el startup del lifespan una sola vez por worker."""
+    global _iniciada
+    if _iniciada:
+        return
+    async with _inicio:
+        if not _iniciada:
+            await middleware.notify_startup()
+            _iniciada = True
+            registrarApagado()
+
+
+async def apagar():
+    """Corre el shutdown del lifespan (vacía diario y bitácora, cierra engines) una sola vez."""
+    global _iniciada
+    async with _inicio:
+        if _iniciada:
+            _iniciada = False
+            await middleware.notify_shutdown()
+
+
+def registrarApagado():
+    """
+    El host de Functions no llama al shutdown del lifespan: detiene el worker
+    con SIGTERM. Se atiende la señal en el loop del worker, se corre `apagar()`
+    y luego se restaura el manejador anterior y se reenvía la señal para que el
+    proceso termine como lo habría hecho.
+    """
+    loop = asyncio.get_running_loop()
+    anterior = signal.getsignal(signal.SIGTERM) or signal.SIG_DFL
+
+    async def terminar():
+        try:
+            await apagar()
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            signal.signal(signal.SIGTERM, anterior)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(terminar()))
+    except (NotImplementedError, RuntimeError, ValueError) as e:
+        # Windows o un loop fuera del hilo principal: quedan el archivo del diario y
+        # el respaldo de la bitácora (atexit), que se reprocesan en el siguiente arranque
+        logging.warning(f"No se pudo registrar el apagado con SIGTERM: {str(e)}")
+
+
+async def main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
+    await asegurarInicio()
+    return await middleware.handle_async(req, context)
+
+"""
+Función principal: main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse
+Nombre: api
+
+Descripción general:
+    Punto de entrada único. Todas las rutas HTTP (`/api/{*ruta}`) llegan a esta
+    función y se despachan con una app FastAPI montada sobre el adaptador ASGI
+    de Azure Functions. Así todos los endpoints comparten un engine, un pool de
+    conexiones, los caches de sentencias y la bitácora del mismo proceso.
+
+Rutas (ver `RUTAS`):
+    - POST /api/votar
+    - POST /api/votarBoleta
+    - POST /api/sesionVotacion
+    - GET  /api/recibos/{tokenGUID}
+    - GET  /api/resultados/{votacionID}
+    - GET  /api/participacion/{votacionID}   (requiere clave)
+    - GET  /api/exportacion/{votacionID}     (requiere clave)
+    - POST /api/listarVotos              (requiere clave)
+    - POST /api/comentar                 (requiere clave)
+    - POST /api/configurarVotacion
+    - POST /api/crearActualizarPropuesta
+    - POST /api/revisarPropuesta
+    - POST /api/invertir                 (requiere clave)
+    - POST /api/repartirDividendos
+    - GET  /api/health/pool              (requiere clave)
+
+    Las rutas "requiere clave" tenían authLevel "function"; ahora se valida el
+    header `x-functions-key` (o `?code=`) contra la setting `ApiClaveFunciones`.
+    Sin esa setting responden 401, salvo con `ApiPermitirSinClave=true`
+    (solo para desarrollo local).
+    Los bodies de más de `MaxCuerpoBytes` se rechazan con 413 antes de llegar
+    al endpoint.
+
+Instrumentación:
+    Con `InstrumentacionHabilitada=true` cada respuesta trae `Server-Timing`
+    (etapas, tiempo en SQL, sentencias e idas a la base de datos) y se escribe
+    una línea de log JSON por petición (ver `shared/instrumentacion.py`).
+
+Ciclo de vida:
+    - Inicio (primera petición o función `warmup`): configura mappers y
+      precalienta el pool.
+    - Apagado (SIGTERM del host, ver `registrarApagado`): vacía el diario de
+      votos y la bitácora de logs y cierra los engines. Si la señal no se puede
+      atender, lo pendiente queda en el archivo del diario y en el respaldo de
+      la bitácora y se escribe en el siguiente arranque.
+
+Agregar un endpoint:
+    Crear la carpeta con su `main(req)` (sin function.json) y sumarla a `RUTAS`.
+"""
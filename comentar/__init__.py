@@ -1,6 +1,6 @@
-import json
 import random
 import azure.functions as func
+from shared.codec import leerDto, aJson
 from datetime import datetime
 from shared.dtos import ComentarioDTO
 from shared.database import get_session
@@ -8,13 +8,21 @@ from shared.models import (
     DetalleComentarios, ComentarioPropuesta, Propuesta, Documento,
     IaAnalisis, Log, EstadoComentario, Usuario, UsuarioPermiso, Permiso
 )
-from cryptography.fernet import Fernet
 from sqlalchemy import select
 import hashlib
 import re
 
-# Clave de cifrado simulada (en práctica debe estar segura)
-CLAVE_CIFRADO = Fernet.generate_key()
+# Clave de cifrado simulada (en práctica debe estar segura). Se genera en el
+# primer comentario sensible para no cargar `cryptography` al importar.
+_claveCifrado = None
+
+
+def obtenerClaveCifrado() -> bytes:
+    global _claveCifrado
+    if _claveCifrado is None:
+        from cryptography.fernet import Fernet
+        _claveCifrado = Fernet.generate_key()
+    return _claveCifrado
 
 
 def generarChecksum(valor: str) -> bytes:
@@ -22,6 +30,7 @@ def generarChecksum(valor: str) -> bytes:
 
 
 def cifrarContenido(texto: str, clave: bytes) -> str:
+    from cryptography.fernet import Fernet
     fernet = Fernet(clave)
     return fernet.encrypt(texto.encode()).decode()
 
@@ -53,10 +62,10 @@ async def usuarioEsValido(session, usuarioId: int) -> bool:
 
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        dto = ComentarioDTO(**req.get_json())
+        dto = leerDto(req, ComentarioDTO)
     except Exception as e:
         return func.HttpResponse(
-            json.dumps({"error": str(e)}), status_code=400, mimetype="application/json"
+            aJson({"error": str(e)}), status_code=400, mimetype="application/json"
         )
 
     async with get_session() as session:
@@ -64,7 +73,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
             if not await usuarioEsValido(session, dto.usuarioId):
                 return func.HttpResponse(
-                    json.dumps({"error": "Usuario no autorizado"}),
+                    aJson({"error": "Usuario no autorizado"}),
                     mimetype="application/json",
                     status_code=403,
                 )
@@ -72,7 +81,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             propuesta = await session.get(Propuesta, dto.propuestaId)
             if not propuesta or not bool(propuesta.comentarios):
                 return func.HttpResponse(
-                    json.dumps({"error": "La propuesta no permite comentarios"}),
+                    aJson({"error": "La propuesta no permite comentarios"}),
                     mimetype="application/json",
                     status_code=403,
                 )
@@ -86,7 +95,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             estado = estadoQuery.scalar_one()
             ahora = datetime.utcnow()
 
-            cuerpoAlmacenar = cifrarContenido(dto.cuerpo, CLAVE_CIFRADO) if resultado.get("sensible") else dto.cuerpo
+            cuerpoAlmacenar = cifrarContenido(dto.cuerpo, obtenerClaveCifrado()) if resultado.get("sensible") else dto.cuerpo
 
             detalle = DetalleComentarios(
                 titulo=dto.titulo,
@@ -153,13 +162,13 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
             if not resultado["valido"]:
                 return func.HttpResponse(
-                    json.dumps({"msg": "Comentario rechazado", "razon": resultado["razon"]}),
+                    aJson({"msg": "Comentario rechazado", "razon": resultado["razon"]}),
                     mimetype="application/json",
                     status_code=400,
                 )
 
     return func.HttpResponse(
-        json.dumps({"msg": "Comentario registrado correctamente"}),
+        aJson({"msg": "Comentario registrado correctamente"}),
         mimetype="application/json",
         status_code=201,
     )
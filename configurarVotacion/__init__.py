@@ -5,7 +5,9 @@ from shared.database import get_session
 from shared.models import Propuesta, SegmentoPropuesta, UsuarioPermiso, Votacion, PropuestaVotacion, Segmento, VotacionPregunta
 from shared.dtos import CrearConfiguracionVotacionDTO
 import azure.functions as func
-from fastapi import Header, HTTPException
+from shared.codec import leerDto, aJson
+from shared.boletas import cacheBoletas
+from shared.restricciones import compilarRestricciones
 
 async def validar_permiso(session, usuario_id: int, permiso_code: str, propuesta_id: int) -> bool:
     """
@@ -36,9 +38,14 @@ async def validar_permiso(session, usuario_id: int, permiso_code: str, propuesta
     return True
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        dto = CrearConfiguracionVotacionDTO(**req.get_json())
+        dto = leerDto(req, CrearConfiguracionVotacionDTO)
     except Exception as e:
         return func.HttpResponse(f"Error en los datos recibidos: {str(e)}", status_code=400)
+    try:
+        # Se compilan aquí solo para validarlas; la boleta las vuelve a compilar al cargarse
+        compilarRestricciones(dto.restriccionesIP, dto.horariosPermitidos)
+    except ValueError as e:
+        return func.HttpResponse(f"Restricciones inválidas: {str(e)}", status_code=400)
 
     async with get_session() as session:
         # Validar que el usuario tiene permiso sobre la propuesta
@@ -46,6 +53,22 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         if not tiene_permiso:
             return func.HttpResponse("No tiene permiso para configurar esta propuesta", status_code=403)
 
+        # Una pregunta pertenece a una sola votación: la boleta se busca por pregunta y los
+        # contadores de resultados van por (pregunta, respuesta). El bloqueo de rango impide
+        # que otra configuración concurrente asocie la misma pregunta antes del commit
+        preguntaIDs = [pregunta.preguntaID for pregunta in dto.preguntas]
+        enUso = []
+        if preguntaIDs:
+            enUso = (await session.execute(
+                select(VotacionPregunta.preguntaID, VotacionPregunta.votacionID)
+                .with_hint(VotacionPregunta, "WITH (UPDLOCK, HOLDLOCK)", "mssql")
+                .where(VotacionPregunta.preguntaID.in_(preguntaIDs))
+                .order_by(VotacionPregunta.preguntaID)
+            )).all()
+        if enUso:
+            detalle = ", ".join(f"{fila.preguntaID} (votación {fila.votacionID})" for fila in enUso)
+            return func.HttpResponse(f"Preguntas ya asociadas a otra votación: {detalle}", status_code=409)
+
         # 1. Crear o actualizar la votación
         now = datetime.utcnow()
         nuevaVotacion = Votacion(
@@ -57,7 +80,9 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             estadoVotacionId=1,  # Estado: Preparado
             ultimaModificacion=now,
             privada=dto.privada,
-            esSecreta=dto.esSecreta
+            esSecreta=dto.esSecreta,
+            restriccionesIP=json.dumps(dto.restriccionesIP) if dto.restriccionesIP else None,
+            horariosPermitidos=json.dumps(dto.horariosPermitidos) if dto.horariosPermitidos else None,
         )
         session.add(nuevaVotacion)
         await session.flush()  # Para obtener el ID generado
@@ -90,8 +115,9 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             session.add(pregRow)
 
         await session.commit()
+        cacheBoletas.invalidar(pregunta.preguntaID for pregunta in dto.preguntas)
 
-        return func.HttpResponse(json.dumps({"mensaje": "Votación configurada", "votacionID": nuevaVotacion.votacionID}), mimetype="application/json", status_code=201)
+        return func.HttpResponse(aJson({"mensaje": "Votación configurada", "votacionID": nuevaVotacion.votacionID}), mimetype="application/json", status_code=201)
 """
 Función principal: main(req: func.HttpRequest) -> func.HttpResponse  
 Nombre: configurarVotacion
@@ -115,16 +141,26 @@ Lógica interna:
         - Es dueño de la propuesta (`Propuesta.userId == usuarioID`).
         - Tiene asignado el permiso específico (`permisoID == 6`), esté habilitado y no eliminado.
     3. Se crea un nuevo registro en la tabla `pv_votacion` con estado "Preparado".
+        - `restriccionesIP` (CIDR) y `horariosPermitidos` ("HH:mm-HH:mm", zona `HorariosZonaHoraria`)
+          se validan compilándolas con `shared.restricciones` y se guardan como JSON; `votar` y
+          `votarBoleta` las aplican (ver `scripts/sql/restricciones_votacion.sql`).
     4. Se vincula la votación con la propuesta mediante `pv_propuestaVotacion`.
     5. Se asocian los segmentos seleccionados como población objetivo, insertando en `pv_segmentoPropuesta`.
     6. Se validan los IDs de preguntas recibidos y se insertan las relaciones en `pv_votacionPregunta`.
         - Si alguna pregunta no existe en la base de datos (`pv_preguntas`), se omite o se rechaza toda la transacción.
+        - Antes de crear la votación se rechaza con `409` si alguna pregunta ya está en otra votación
+          (con `UPDLOCK, HOLDLOCK` hasta el commit): `votar` busca la boleta por pregunta y
+          `pv_conteoRespuesta` cuenta por (pregunta, respuesta), así que una pregunta compartida
+          mezclaría los resultados de ambas votaciones.
     7. Se realiza el `commit()` de la transacción para persistir los cambios.
+    8. Se invalidan en el cache de boletas (`shared.boletas.cacheBoletas`) las preguntas asociadas,
+       para que `votar` no use la configuración anterior en este worker.
 
 Respuesta esperada:
     - 201 Created con `votacionID` generado si la operación fue exitosa.
-    - 400 Bad Request si los datos están mal estructurados o hay preguntas inválidas.
+    - 400 Bad Request si los datos están mal estructurados, hay preguntas inválidas o un CIDR/horario inválido.
     - 403 Forbidden si el usuario no tiene permiso o no es dueño de la propuesta.
+    - 409 Conflict si alguna pregunta ya está asociada a otra votación.
 
 Ejemplo de entrada:
 {
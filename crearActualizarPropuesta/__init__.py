@@ -1,23 +1,14 @@
-import json
 import logging
-import base64
 import azure.functions as func
+from shared.codec import leerDto, aJson
 from shared.dtos import CrearActualizarPropuestaDTO
 from shared.database import get_session
 from sqlalchemy import text
 from pydantic import ValidationError
 
-def bytesAString(b: bytes) -> str:
-    return base64.b64encode(b).decode('utf-8')
-
-def json_bytes_serializer(obj):
-    if isinstance(obj, bytes):
-        return base64.b64encode(obj).decode('utf-8')
-    raise TypeError(f"Type {type(obj)} not serializable")
-
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        dto = CrearActualizarPropuestaDTO(**req.get_json())
+        dto = leerDto(req, CrearActualizarPropuestaDTO)
     except ValidationError as e:
         return func.HttpResponse(e.json(), status_code=400, mimetype="application/json")
 
@@ -41,30 +32,25 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         async with get_session() as session:
-            params = dto.dict()
+            params = dto.model_dump()
             params['Comentarios'] = int(params['Comentarios'])
             result = await session.execute(sp_call, params)
             await session.commit()
             rows = result.fetchall()
             print(f"Rows returned: {len(rows)}")
 
-            resultList = []
-            for row in rows:
-                rowDict = dict(row._mapping)
-                # Convierte checksum si existe
-                if 'checksum' in rowDict and isinstance(rowDict['checksum'], bytes): # para debug solamente
-                    rowDict['checksum'] = bytesAString(rowDict['checksum'])
-                resultList.append(rowDict)
+            # aJson codifica en base64 las columnas binarias (checksum)
+            resultList = [dict(row._mapping) for row in rows]
         logging.info(f"Result from SP: {resultList}")
         return func.HttpResponse(
-            json.dumps({"result": resultList}, default=json_bytes_serializer),
+            aJson({"result": resultList}),
             mimetype="application/json",
             status_code=200,
         )
 
     except Exception as ex:
         return func.HttpResponse(
-            json.dumps({"error": str(ex)}),
+            aJson({"error": str(ex)}),
             mimetype="application/json",
             status_code=500,
         )
@@ -129,7 +115,7 @@ select * from pv_propuestas
 
 Bitácora de lo acontecido:
 - Se implementó la ejecución del procedimiento almacenado `crearActualizarPropuesta` usando `sqlalchemy.text`.
-- Se incluyó soporte para codificación Base64 en campos tipo `bytes` para compatibilidad con JSON.
+- Las columnas `bytes` se codifican en Base64 al serializar la respuesta con `shared.codec.aJson`.
 - Se validan los campos usando Pydantic (`CrearActualizarPropuestaDTO`), retornando errores de validación detallados.
 - Se controla la transacción con `await session.commit()` y se captura cualquier excepción del proceso.
 - Se utiliza `get_session` para obtener una sesión `AsyncSession` con contexto seguro.
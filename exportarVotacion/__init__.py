@@ -0,0 +1,118 @@
+import json
+import logging
+import azure.functions as func
+from shared.codec import aJson
+from shared.database import get_read_session, leerConfig
+from shared.exportacion import FILAS, TAMANO_BLOQUE, exportarBoletas, votacionCerrada
+from shared.resultados import consultaVotacion
+
+# Votos por petición: el adaptador ASGI de Azure Functions arma la respuesta
+# completa en memoria, así que cada petición devuelve un tramo acotado
+FILAS_POR_PETICION = leerConfig("ExportacionFilasPorPeticion", 100000, int)
+
+
+def respuestaError(mensaje: str, status_code: int, codigo: str = None) -> func.HttpResponse:
+    cuerpo = {"error": mensaje}
+    if codigo:
+        cuerpo["codigo"] = codigo
+    return func.HttpResponse(aJson(cuerpo), status_code=status_code, mimetype="application/json")
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        votacionID = int(req.route_params.get("votacionID") or req.params.get("votacionID") or "")
+        desde = int(req.params.get("desde") or 0)
+        bloque = int(req.params.get("bloque") or min(TAMANO_BLOQUE, FILAS_POR_PETICION))
+    except ValueError:
+        return respuestaError("votacionID, desde y bloque deben ser enteros", 400)
+    try:
+        clave = json.loads(req.params["clave"]) if req.params.get("clave") else None
+    except ValueError:
+        return respuestaError("clave debe ser el arreglo JSON de la línea de control", 400)
+    formato = req.params.get("formato") or FILAS
+    if bloque < 1 or bloque > FILAS_POR_PETICION:
+        return respuestaError(f"bloque debe estar entre 1 y {FILAS_POR_PETICION}", 400)
+    limite = FILAS_POR_PETICION // bloque * bloque
+
+    try:
+        async with get_read_session() as lectura:
+            votacion = (await lectura.execute(consultaVotacion, {"votacionID": votacionID})).first()
+            if votacion is None:
+                return respuestaError("Votación no encontrada", 404, "404")
+            if not votacionCerrada(votacion):
+                return respuestaError("Las boletas se exportan al cerrar la votación", 403, "EXPORTACION_NO_DISPONIBLE")
+            try:
+                contenido = bytearray()
+                async for fragmento in exportarBoletas(lectura, votacion, formato, desde, bloque, limite, clave=clave):
+                    contenido += fragmento
+            except ValueError as e:
+                return respuestaError(str(e), 400)
+        return func.HttpResponse(bytes(contenido), status_code=200, mimetype="application/x-ndjson")
+    except Exception as e:
+        logging.error(f"Error al exportar boletas: {str(e)}", exc_info=True)
+        return respuestaError("Error interno del servidor", 500)
+
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: exportarVotacion
+
+Ruta: GET /api/exportacion/{votacionID}?formato=filas&desde=0&bloque=10000[&clave=[...]]
+(requiere clave de función: es para los auditores de la votación)
+
+Descripción general:
+    Exporta las boletas anonimizadas de una votación cerrada en NDJSON, por
+    bloques con su hash SHA-256, para auditar el conteo (ver
+    `shared/exportacion.py` para el formato completo).
+
+Parámetros (query string):
+    - formato: filas (un voto por línea, por defecto) o columnas (un bloque
+      por línea, con un arreglo por campo)
+    - desde: primer voto a exportar; múltiplo de bloque (por defecto 0)
+    - clave: con `desde` distinto de 0, la `clave` (arreglo JSON) de la línea
+      de control o de cierre de ese voto
+    - bloque: votos por bloque (por defecto `ExportacionTamanoBloque`, hasta
+      `ExportacionFilasPorPeticion`)
+
+Lógica interna:
+    1. Verifica que la votación existe y ya cerró.
+    2. Lee los votos de la réplica de lectura con un cursor del lado del
+       servidor (`yield_per`) y arma los bloques a medida que llegan.
+    3. Se detiene a las `ExportacionFilasPorPeticion` filas (redondeado a
+       bloques completos); la última línea indica en `siguiente` el `desde`
+       de la próxima petición, o null si ya no quedan votos, y en `clave`
+       la clave con la que pedirla.
+
+Respuesta exitosa (200, application/x-ndjson):
+    {"exportacion": "boletas", "votacion_id": 1, "titulo": "...", "formato": "filas",
+     "bloque": 10000, "desde": 0, "columnas": ["pregunta_id", "respuesta_id", "valor", "peso_id", "minuto"],
+     "pesos": {"1": 1.0}, "resultados": [{"pregunta_id": 1, "respuesta_id": 11, "votos": 5400, ...}]}
+    [1, 11, "v", 1, "2025-06-20T08:01:00"]
+    ...
+    {"bloque": 0, "desde": 0, "filas": 10000, "sha256": "9f2c...", "clave": [1, 11, "v", 1, "2025-06-20T08:04:00", 3]}
+    ...
+    {"fin": false, "filas": 100000, "siguiente": 100000, "clave": [2, 21, "v", 1, "2025-06-20T09:12:00", 1]}
+
+Flujo de respuesta:
+    - 200 OK: tramo de la exportación
+    - 400 Bad Request: parámetros inválidos (desde debe ser múltiplo de bloque
+      y, si no es 0, ir con su clave)
+    - 403 Forbidden: la votación sigue abierta (EXPORTACION_NO_DISPONIBLE)
+    - 404 Not Found: la votación no existe
+    - 500 Internal Server Error: error inesperado
+
+Consideraciones:
+    - Para votaciones grandes conviene `scripts/exportar_votacion.py`, que
+      escribe la exportación completa en un archivo sin armarla en memoria y
+      puede retomar una descarga cortada (`--continuar`).
+    - Un bloque cortado o con hash distinto se descarta y se vuelve a pedir
+      con `desde` igual a las filas de los bloques verificados y la `clave`
+      del último control válido: los bloques se numeran desde el primer voto,
+      así que los hashes no cambian.
+    - Cada tramo empieza a leer en su clave (keyset) en vez de saltar con
+      OFFSET los votos anteriores, así que todas las peticiones cuestan lo
+      mismo sin importar el `desde`.
+    - Los votos no llevan ID, token, huella ni fecha exacta, y salen ordenados
+      por las columnas exportadas, no por orden de inserción (ver
+      `shared/exportacion.py`).
+"""
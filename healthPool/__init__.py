@@ -0,0 +1,51 @@
+import azure.functions as func
+from shared.codec import aJson
+from shared.database import estadoPool
+from shared.statements import estadisticasCache
+from shared.boletas import cacheBoletas
+from shared.diario import diarioVotos
+from shared.recibos import indiceRecibos
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    return func.HttpResponse(
+        aJson({**estadoPool(), "cacheSentencias": estadisticasCache(), "cacheBoletas": cacheBoletas.estadisticas(), "diarioVotos": diarioVotos.estadisticas(), "recibos": indiceRecibos.estadisticas()}),
+        mimetype="application/json",
+        status_code=200,
+    )
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: healthPool
+
+Ruta: GET /api/health/pool
+
+Descripción general:
+    Reporta el estado del pool de conexiones del worker que atiende la petición,
+    para dimensionar `SqlPoolSize` / `SqlPoolMaxOverflow` con datos reales.
+
+Respuesta (200):
+{
+    "tamano": 20,               # conexiones base del pool
+    "enUso": 3,                 # conexiones prestadas (checked-out)
+    "libres": 17,               # conexiones abiertas esperando en el pool
+    "overflow": 0,              # conexiones extra abiertas sobre el tamaño base
+    "maxOverflow": 10,
+    "timeoutSegundos": 30.0,
+    "adquisiciones": 1520,      # checkouts desde que arrancó el worker
+    "timeouts": 0,              # checkouts que agotaron SqlPoolTimeout
+    "esperaPromedioMs": 0.41,
+    "esperaMaximaMs": 12.7,
+    "cacheSentencias": {        # hits/misses del cache de compilación por sentencia
+        "credenciales": {"hits": 1519, "misses": 1, "sinCache": 0}
+    },
+    "cacheBoletas": {"entradas": 12, "hits": 1490, "misses": 30},
+    "diarioVotos": {"habilitado": true, "sinConfirmar": 37, "enCola": 12},  # votos aún no insertados
+    "recibos": {"tokens": 120000, "bytes": 1797010, "ultimoID": 120412,   # filtro de Bloom de verificarRecibo
+                "rechazadosSinConsulta": 3120, "consultas": 845, "noEncontrados": 1}
+}
+
+Consideraciones:
+    - Cada instancia tiene su propio pool; los números son por worker.
+    - Más de un miss por sentencia indica que se está recompilando SQL en cada petición.
+"""
@@ -1,20 +1,18 @@
-from datetime import datetime
-from typing import List
-from pydantic import BaseModel, SecretStr
+import heapq
+from itertools import islice
+from typing import List, Optional, Tuple
 from pydantic import ValidationError
-from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import select, desc, text
-from sqlalchemy.orm import selectinload, joinedload
-from shared.database import get_session
-from shared.dtos import ListaVotosInputDTO
-import json
+from sqlalchemy import select, desc, text, bindparam, and_, or_
+from shared.database import unidadDeTrabajo, get_read_session
+from shared.auth import autenticarVotante, CredencialesInvalidas, ErrorVerificacion
+from shared.bitacora import insertarLog
+from shared.statements import etiquetar
+from shared.huella import huellaUsuario, huellasDeUsuario, RESPALDO_LEGADO
+from shared.dtos import ListaVotosInputDTO, CursorVotosDTO
 import logging
-import hashlib
 import azure.functions as func
+from shared.codec import leerDto, aJson
 from shared.models import (
-    Usuario, 
-    LlaveUsuario,
     PropuestaVotacion,
     Propuesta,
     Votacion,
@@ -23,123 +21,61 @@ from shared.models import (
     RespuestaParticipante,
     Pregunta,
     VotacionPregunta,
-    Log,
-    Documento
 )
 
+TAMANO_PAGINA = 5
+HUELLAS_POR_CONSULTA = 1000
+
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Iniciando procesamiento de listaVotos")
-    ahora = datetime.now()
     try:
-        auth_data = ListaVotosInputDTO(**req.get_json())
+        auth_data = leerDto(req, ListaVotosInputDTO)
         logging.info(f"Solicitud recibida para cédula: {auth_data.cedula[:3]}******")
-        async with get_session() as session:
-            usuario = await obtenerUsuario(session, auth_data.cedula) 
-            if not usuario:
-                await insertarLog(
-                    session=session,
-                    descripcion="Usuario no encontrado en autenticación",
-                    computador="listarVotos/endpoint",
-                    usuario=auth_data.cedula,
-                    tipologid=1,
-                    origenlogid=2,
-                    logseveridadid=2
+        async with unidadDeTrabajo() as session, get_read_session(session) as lectura:
+            try:
+                usuario, llave_desencriptada = await autenticarVotante(
+                    session,
+                    auth_data.cedula,
+                    auth_data.contrasenna.get_secret_value(),
+                    auth_data.prueba_vida,
+                    "listarVotos/endpoint",
                 )
-                logging.warning(f"Usuario no encontrado: {auth_data.cedula[:3]}******")
+            except CredencialesInvalidas as e:
+                logging.warning(f"Credenciales inválidas: {auth_data.cedula[:3]}******")
                 return func.HttpResponse(
-                    json.dumps({"error": "Credenciales inválidas"}),
+                    aJson({"error": str(e), "codigo": e.codigo} if e.codigo else {"error": str(e)}),
                     status_code=401,
                     mimetype="application/json"
                 )
-                logging.info(f"Usuario encontrado: ID {usuario.userid}")
-            logging.info(f"Usuario encontrado: ID {usuario.userid}")
-            llaveActiva = await obtenerLlave(session, usuario.userid)
-            documento = Documento(
-                    nombre=f"{usuario.userid}-PruebaVida",
-                    fechaCreacion=ahora,
-                    tipoDocumentoID=10,
-                    estadoDocumentoID=4,
-                    ultimaModificacion=ahora,
-                    esActual=True,
-                    idLegal=f"{usuario.userid}_PV",
-                    checksum=generarChecksum(auth_data.prueba_vida),
-                )
-            session.add(documento)
-            await session.commit()
-            await insertarLog(
-                    session=session,
-                    descripcion="Insercion Prueba de Vida",
-                    computador="listarVotos/endpoint",
-                    usuario=str(usuario.userid),
-                    tipologid=1,
-                    origenlogid=2,
-                    logseveridadid=2
-                )
-            try:
-                resultado = await session.execute(
-                    text("""
-                        SELECT DECRYPTBYPASSPHRASE(:pass, :llave) AS llave_desencriptada
-                        WHERE :llave IS NOT NULL
-                    """),
-                    {
-                        "pass": auth_data.contrasenna.get_secret_value(),
-                        "llave": llaveActiva.llaveCifrada
-                    }
-                )
-                llave_desencriptada = resultado.scalar_one_or_none()
-                if llave_desencriptada is None:
-                    await insertarLog(
-                        session=session,
-                        descripcion="Fallo de descifrado de llave",
-                        computador="listarVotos/endpoint",
-                        usuario=str(usuario.userid),
-                        refId1=usuario.userid,
-                        tipologid=2,
-                        origenlogid=2,
-                        logseveridadid=3
-                    )
-                    logging.warning(f"Fallo de descifrado para usuario ID: {usuario.userid}")
-                    return func.HttpResponse(
-                        json.dumps({
-                            "error": "Credenciales inválidas",
-                            "codigo": "AUTH_FAILED"
-                        }),
-                        status_code=401,
-                        mimetype="application/json"
-                    )
-                llave_desencriptada = llave_desencriptada.decode('utf-8')
-                logging.info(f"Autenticación exitosa para usuario ID: {usuario.userid}")
-            except Exception as e:
-                await insertarLog(
-                    session=session,
-                    descripcion="Error técnico en verificación de contraseña",
-                    computador="listarVotos/endpoint",
-                    usuario=str(usuario.userid),
-                    refId1=usuario.userid,
-                    trace=str(e),
-                    tipologid=2,
-                    origenlogid=2,
-                    logseveridadid=5
-                )
-                logging.error(f"Error técnico al verificar contraseña: {str(e)}", exc_info=True)
+            except ErrorVerificacion:
                 return func.HttpResponse(
-                    json.dumps({
+                    aJson({
                         "error": "Error interno en verificación",
                         "codigo": "INTERNAL_ERROR"
                     }),
                     status_code=500,
                     mimetype="application/json"
-                )        
-            respuestas = await obtenerRespuestasParticipantes(session, llave_desencriptada, usuario.userid)
+                )
+            await insertarLog(
+                descripcion="Insercion Prueba de Vida",
+                computador="listarVotos/endpoint",
+                usuario=str(usuario.userid),
+                tipologid=1,
+                origenlogid=2,
+                logseveridadid=2
+            )
+            respuestas, siguiente = await obtenerRespuestasParticipantes(
+                lectura, llave_desencriptada, usuario.userid, auth_data.tamano_pagina, auth_data.cursor
+            )
             response_data = {
                 "user_id": usuario.userid,
                 "nombre" : usuario.nombre,
                 "primerApellido": usuario.primerApellido,
                 "segundoApellido": usuario.segundoApellido,
-                "respuestas": respuestas
+                "respuestas": respuestas,
+                "siguiente": siguiente
             }
             await insertarLog(
-                session=session,
                 descripcion="Respuestas obtenidas exitosamente",
                 computador="listarVotos/endpoint",
                 usuario=str(usuario.userid),
@@ -149,7 +85,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                 logseveridadid=1,
             )
             return func.HttpResponse(
-                json.dumps(response_data, default=str),
+                aJson(response_data),
                 status_code=200,
                 mimetype="application/json"
             )
@@ -163,153 +99,143 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         logging.error(f"Error inesperado: {str(e)}", exc_info=True)
         return func.HttpResponse(
-            json.dumps({"error": "Error interno del servidor"}),
+            aJson({"error": "Error interno del servidor"}),
             status_code=500,
             mimetype="application/json"
         )
 
-async def obtenerUsuario(session, cedula) -> Usuario | None:
-    try:
-        result = await session.execute(
-            select(Usuario)
-            .where(Usuario.identificacion == cedula)
-            .options(selectinload(Usuario.llaves))
-        )
-        return result.scalar_one_or_none()
-    except Exception as e:
-        logging.error(f"Error en consulta de usuario: {str(e)}", exc_info=True)
-        raise ValueError("Error al consultar usuario en la base de datos")
 
-async def obtenerRespuestasParticipantes(session, llaveCifrada, usuario) -> List[dict]:
+_consultaRespuestas = (
+    select(
+        RespuestaParticipante.respuestaParticipanteID,
+        RespuestaParticipante.preguntaID,
+        RespuestaParticipante.respuestaID,
+        RespuestaParticipante.valor,
+        RespuestaParticipante.fechaRespuesta,
+        RespuestaParticipante.tokenGUID,
+        RespuestaParticipante.pesoRespuesta,
+        Pregunta.enunciado,
+        Respuesta.respuesta,
+        Respuesta.value,
+        Votacion.titulo.label("titulo_votacion")
+    )
+    .select_from(RespuestaParticipante)
+    .join(Pregunta, RespuestaParticipante.preguntaID == Pregunta.preguntaID)
+    .join(Respuesta, RespuestaParticipante.respuestaID == Respuesta.respuestaID)
+    .join(VotacionPregunta, VotacionPregunta.preguntaID == Pregunta.preguntaID)
+    .join(Votacion, Votacion.votacionID == VotacionPregunta.votacionID)
+    .order_by(desc(RespuestaParticipante.fechaRespuesta), desc(RespuestaParticipante.respuestaParticipanteID))
+    .limit(bindparam("limite"))
+)
+
+# Página siguiente: votos estrictamente anteriores al último de la página
+# previa en el orden (fechaRespuesta, respuestaParticipanteID)
+_despuesDelCursor = or_(
+    RespuestaParticipante.fechaRespuesta < bindparam("fechaCursor"),
+    and_(
+        RespuestaParticipante.fechaRespuesta == bindparam("fechaCursor"),
+        RespuestaParticipante.respuestaParticipanteID < bindparam("idCursor"),
+    ),
+)
+
+# Votos del usuario: una búsqueda en el índice de huellaUsuario, que ya viene
+# ordenado por (fechaRespuesta, respuestaParticipanteID)
+_porUsuario = _consultaRespuestas.where(RespuestaParticipante.huellaUsuario == bindparam("huellaUsuario"))
+consultaRespuestasPorUsuario = etiquetar(_porUsuario, "listarVotos.respuestasPorUsuario")
+consultaRespuestasPorUsuarioCursor = etiquetar(
+    _porUsuario.where(_despuesDelCursor), "listarVotos.respuestasPorUsuarioCursor"
+)
+
+# Respaldo legado, votos con huellaVotante pero sin huellaUsuario: búsqueda por
+# el índice único de huellaVotante con las huellas de todo el catálogo
+_porHuella = _consultaRespuestas.where(
+    RespuestaParticipante.huellaUsuario.is_(None),
+    RespuestaParticipante.huellaVotante.in_(bindparam("huellas", expanding=True)),
+)
+consultaRespuestasPorHuella = etiquetar(_porHuella, "listarVotos.respuestasPorHuella")
+consultaRespuestasPorHuellaCursor = etiquetar(
+    _porHuella.where(_despuesDelCursor), "listarVotos.respuestasPorHuellaCursor"
+)
+
+# Respaldo legado, votos anteriores a huellaVotante: se descifran y comparan en SQL Server
+_legadas = (
+    _consultaRespuestas
+    .where(RespuestaParticipante.huellaVotante.is_(None))
+    .where(text("DECRYPTBYPASSPHRASE(:llave, pv_respuestaParticipante.ncRespuesta) = CONVERT(VARBINARY(256), :usuario)"))
+)
+consultaRespuestasLegadas = etiquetar(_legadas, "listarVotos.respuestasLegadas")
+consultaRespuestasLegadasCursor = etiquetar(
+    _legadas.where(_despuesDelCursor), "listarVotos.respuestasLegadasCursor"
+)
+
+consultaPreguntas = etiquetar(select(Pregunta.preguntaID, Pregunta.maxSelecciones), "listarVotos.preguntas")
+
+
+def _orden(row):
+    return (row.fechaRespuesta, row.respuestaParticipanteID)
+
+
+async def obtenerRespuestasParticipantes(
+    session, llaveCifrada, usuario, tamanoPagina: int = TAMANO_PAGINA, cursor: Optional[CursorVotosDTO] = None
+) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Una página de los votos del usuario, del más reciente al más antiguo, y el
+    cursor de la siguiente (None si no hay más). Los votos salen de una sola
+    consulta por `huellaUsuario`, ya ordenada y limitada por SQL Server. Con
+    `HuellaVotanteRespaldoLegado` se suman los votos sin `huellaUsuario` (por
+    huellas de pregunta y descifrando en SQL Server) y aquí solo se mezclan
+    esos grupos, que aportan a lo sumo una página cada uno.
+    """
     try:
-        query = (
-            select(
-                RespuestaParticipante.respuestaParticipanteID,
-                RespuestaParticipante.preguntaID,
-                RespuestaParticipante.respuestaID,
-                RespuestaParticipante.valor,
-                RespuestaParticipante.fechaRespuesta,
-                RespuestaParticipante.ncRespuesta,
-                RespuestaParticipante.tokenGUID,
-                RespuestaParticipante.pesoRespuesta,
-                Pregunta.enunciado,
-                Respuesta.respuesta,
-                Respuesta.value,
-                Votacion.titulo.label("titulo_votacion")
+        parametros = {"limite": tamanoPagina + 1}
+        if cursor is not None:
+            parametros.update(fechaCursor=cursor.fecha_respuesta, idCursor=cursor.respuesta_participante_id)
+        porUsuario = consultaRespuestasPorUsuario if cursor is None else consultaRespuestasPorUsuarioCursor
+
+        result = await session.execute(porUsuario, {**parametros, "huellaUsuario": huellaUsuario(usuario)})
+        grupos = [result.all()]
+        if RESPALDO_LEGADO:
+            porHuella = consultaRespuestasPorHuella if cursor is None else consultaRespuestasPorHuellaCursor
+            legadas = consultaRespuestasLegadas if cursor is None else consultaRespuestasLegadasCursor
+            preguntas = (await session.execute(consultaPreguntas)).all()
+            huellas = huellasDeUsuario(usuario, preguntas)
+            # SQL Server admite como máximo 2100 parámetros por sentencia
+            for inicio in range(0, len(huellas), HUELLAS_POR_CONSULTA):
+                result = await session.execute(
+                    porHuella,
+                    {**parametros, "huellas": huellas[inicio:inicio + HUELLAS_POR_CONSULTA]},
+                )
+                grupos.append(result.all())
+            result = await session.execute(
+                legadas,
+                {**parametros, "llave": llaveCifrada, "usuario": str(usuario)},
             )
-            .select_from(RespuestaParticipante)
-            .join(Pregunta, RespuestaParticipante.preguntaID == Pregunta.preguntaID)
-            .join(Respuesta, RespuestaParticipante.respuestaID == Respuesta.respuestaID)
-            .join(VotacionPregunta, VotacionPregunta.preguntaID == Pregunta.preguntaID)
-            .join(Votacion, Votacion.votacionID == VotacionPregunta.votacionID)
-        )
-        result = await session.execute(query)
-        respuestas = []
-        for row in result:
-            respuesta = {
+            grupos.append(result.all())
+        filas = list(islice(heapq.merge(*grupos, key=_orden, reverse=True), tamanoPagina + 1))
+        siguiente = None
+        if len(filas) > tamanoPagina:
+            filas = filas[:tamanoPagina]
+            siguiente = {
+                "fecha_respuesta": filas[-1].fechaRespuesta.isoformat(),
+                "respuesta_participante_id": filas[-1].respuestaParticipanteID,
+            }
+        respuestas = [
+            {
                 "respuesta_participante_id": row.respuestaParticipanteID,
                 "pregunta_id": row.preguntaID,
                 "respuesta_id": row.respuestaID,
-                "fecha_respuesta": row.fechaRespuesta,
-                "nc_respuesta": row.ncRespuesta, 
+                "fecha_respuesta": row.fechaRespuesta.isoformat(),
                 "titulo_votacion": row.titulo_votacion,
                 "enunciado_pregunta": row.enunciado,
                 "texto_respuesta": row.respuesta
             }
-            if await verificarRespuesta(session, respuesta['nc_respuesta'], llaveCifrada, usuario):
-                respuestas.append(respuesta)
-        respuestas_recientes = sorted(
-            respuestas,
-            key=lambda x: x['fecha_respuesta'],
-            reverse=True
-        )[:5]
-        for respuesta in respuestas_recientes:
-            respuesta['fecha_respuesta'] = respuesta['fecha_respuesta'].isoformat()
-            del respuesta['nc_respuesta']
-        return respuestas_recientes
+            for row in filas
+        ]
+        return respuestas, siguiente
     except Exception as e:
         logging.error(f"Error al consultar respuestas de participantes: {str(e)}", exc_info=True)
         raise ValueError("Error al obtener respuestas de participantes")
 
-async def verificarRespuesta(session, ncRespuesta, llaveCifrada, usuario) -> bool:
-    try:
-        if not ncRespuesta:
-            return False
-        result = await session.execute(
-            text("""
-                SELECT DECRYPTBYPASSPHRASE(:llaveCifrada, :nc_respuesta) AS nc_desencriptado
-            """),
-            {
-                "llaveCifrada": llaveCifrada,
-                "nc_respuesta": ncRespuesta
-            }
-        )
-        nc_desencriptado = result.scalar_one_or_none()
-        if nc_desencriptado != None:
-            logging.info(nc_desencriptado)
-            logging.info(usuario)
-            return nc_desencriptado.decode('utf-8') == str(usuario)
-        return False
-    except Exception as e:
-        logging.error(f"Error desencriptando ncRespuesta: {str(e)}")
-        return False
-
-async def obtenerLlave(session, usuario_id: int) -> LlaveUsuario:
-    try:
-        result = await session.execute(
-            select(LlaveUsuario)
-            .where(
-                LlaveUsuario.usuarioID == usuario_id,
-                LlaveUsuario.esActiva == True 
-            )
-            .order_by(desc(LlaveUsuario.ultimaModificacion))
-        )
-        
-        llave = result.scalar_one_or_none()
-        if not llave:
-            logging.warning(f"No hay llave activa para usuario ID: {usuario_id}")
-            raise ValueError("No se encontró llave criptográfica activa")
-        logging.info(f"Llave encontrada para usuario ID: {usuario_id}")
-        return llave
-    except Exception as e:
-        logging.error(f"Error al consultar llave: {str(e)}", exc_info=True)
-        raise ValueError("Error al verificar credenciales")
-
-
-def generarChecksum(valor: str) -> bytes:
-    return hashlib.sha256(valor.encode()).digest()
-
-async def insertarLog(
-    session: Session,
-    descripcion: str,
-    computador: str,
-    usuario: str,
-    trace: str = "API/ENDPOINT/listarVotos",  
-    refId1: int = None,
-    refId2: int = None,
-    valor1: str = None,
-    valor2: str = None,
-    checksum: str = "2025API/20END25OINT06/listarVotos26",  
-    tipologid: int = 1,     
-    origenlogid: int = 1,   
-    logseveridadid: int = 1 ):
-    log_entry = Log(
-        descripcion=descripcion,
-        timestamp=datetime.utcnow(),
-        computador=computador,
-        usuario=usuario,
-        trace=trace,
-        refId1=refId1,
-        refId2=refId2,
-        valor1=valor1,
-        valor2=valor2,
-        checksum=generarChecksum(checksum),
-        tipologid=tipologid,
-        origenlogid=origenlogid,
-        logseveridadid=logseveridadid
-    )
-    session.add(log_entry)
-    await session.commit()
 
 
 """
@@ -320,22 +246,37 @@ Parámetros de entrada (JSON en el body):
     - cedula (str): Cédula de identidad del usuario
     - contrasenna (SecretStr): Contraseña del usuario
     - prueba_vida (str): Texto de prueba de vida para verificación
+    - tamano_pagina (int, opcional): Votos por página, de 1 a 100 (por defecto 5)
+    - cursor (objeto, opcional): Campo `siguiente` de la respuesta anterior
+      para pedir la página siguiente
 
 Lógica interna:
     1. Autenticación:
        - Valida credenciales usando ListaVotosInputDTO
-       - Verifica usuario en pv_usuarios
-       - Obtiene llave criptográfica activa del usuario
-       - Registra prueba de vida en pv_documento (tipoDocumentoID=10)
+       - Autentica con shared.auth.autenticarVotante, igual que votar: busca
+         el usuario y su llave activa en una sola consulta y la descifra con
+         DECRYPTBYPASSPHRASE, siempre en el primario (una réplica atrasada
+         rechazaría una llave recién rotada)
+       - Cédula inexistente, sin llave activa o contraseña que no abre la
+         llave: 401 (AUTH_FAILED en los dos últimos casos); falla técnica del
+         descifrado: 500 INTERNAL_ERROR
     
-    2. Verificación:
-       - Desencripta llave usando DECRYPTBYPASSPHRASE
-       - Valida coincidencia de credenciales
+    2. Prueba de vida:
+       - Ya verificadas las credenciales, registra la prueba de vida en
+         pv_documento (tipoDocumentoID=10, shared.auth.registrarPruebaVida)
     
-    3. Consulta:
-       - Obtiene respuestas de votaciones públicas del usuario
-       - Filtra las 5 más recientes por fecha
-       - Verifica pertenencia mediante desencriptación de ncRespuesta
+    3. Consulta (en la réplica de lectura si está configurada, ver get_read_session):
+       - Busca los votos del usuario por huellaUsuario (HMAC del usuario, ver
+         shared/huella.py): una sola búsqueda en su índice
+       - Con HuellaVotanteRespaldoLegado (apagado por defecto), agrega los
+         votos sin huellaUsuario: los que tienen huellaVotante, por las huellas
+         de cada pregunta del catálogo, y los que no tienen huella, cuyo
+         ncRespuesta descifrado en SQL Server coincide con el usuario
+       - Cada consulta ordena por (fechaRespuesta, respuestaParticipanteID)
+         descendente, aplica el cursor (solo filas anteriores a él) y trae a
+         lo sumo tamano_pagina + 1 filas; en Python solo se mezclan esos
+         grupos ya ordenados. El costo de cada página no depende de cuántos
+         votos tenga el usuario antes del cursor
     
     4. Respuesta:
        - Devuelve datos básicos del usuario
@@ -364,8 +305,12 @@ Estructura de respuesta exitosa (200):
             "enunciado_pregunta": str,
             "texto_respuesta": str
         },
-        (máximo 5)
-    ]
+        (máximo tamano_pagina)
+    ],
+    "siguiente": {
+        "fecha_respuesta": str (ISO format),
+        "respuesta_participante_id": int
+    } | null
 }
 
 Ejemplo de uso:
@@ -376,6 +321,15 @@ POST /api/listarVotos
     "prueba_vida": "video_123.mp3"
 }
 
+Página siguiente: mismo body con "cursor" igual al "siguiente" recibido
+{
+    "cedula": "100000000",
+    "contrasenna": "JUGAHE0000",
+    "prueba_vida": "video_123.mp3",
+    "tamano_pagina": 20,
+    "cursor": {"fecha_respuesta": "2025-06-20T08:01:12.347000", "respuesta_participante_id": 1843}
+}
+
 Tablas relacionadas:
     - pv_usuarios
     - pv_llaveUsuario
@@ -397,5 +351,8 @@ Seguridad:
 Consideraciones:
     - Requiere llave criptográfica activa
     - Las fechas se devuelven en formato ISO 8601
-    - Máximo 5 respuestas recientes
+    - Votos del más reciente al más antiguo; "siguiente" es null en la última
+      página
+    - El cursor es estable: los votos nuevos no desplazan las páginas
+      siguientes, aparecen al volver a pedir la primera
 """
\ No newline at end of file
@@ -0,0 +1,123 @@
+import logging
+from datetime import datetime
+import azure.functions as func
+from sqlalchemy import select
+from shared.codec import aJson
+from shared.database import get_read_session
+from shared.models import Segmento, Votacion
+from shared.participacion import serieParticipacion, TOTAL
+
+
+def respuestaInvalida(mensaje: str) -> func.HttpResponse:
+    return func.HttpResponse(aJson({"error": mensaje}), status_code=400, mimetype="application/json")
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        votacionID = int(req.route_params.get("votacionID") or req.params.get("votacionID") or "")
+        segmentos = [int(s) for s in (req.params.get("segmentos") or "").split(",") if s.strip()]
+        desde = datetime.fromisoformat(req.params["desde"]) if req.params.get("desde") else None
+    except ValueError:
+        return respuestaInvalida("votacionID y segmentos deben ser enteros y desde una fecha ISO 8601")
+    if desde is not None and desde.tzinfo is not None:
+        return respuestaInvalida("desde se interpreta en la hora del servidor y no debe llevar zona")
+    granularidad = req.params.get("granularidad") or "minuto"
+    if granularidad not in ("minuto", "hora"):
+        return respuestaInvalida("granularidad debe ser minuto u hora")
+
+    try:
+        async with get_read_session() as lectura:
+            votacion = (await lectura.execute(
+                select(Votacion.votacionID, Votacion.titulo).where(Votacion.votacionID == votacionID)
+            )).first()
+            if votacion is None:
+                return func.HttpResponse(
+                    aJson({"error": "Votación no encontrada", "codigo": "404"}),
+                    status_code=404,
+                    mimetype="application/json"
+                )
+            series = await serieParticipacion(lectura, votacionID, segmentos, desde, granularidad == "hora")
+            nombres = dict((await lectura.execute(
+                select(Segmento.segmentoID, Segmento.nombre).where(Segmento.segmentoID.in_(segmentos))
+            )).all()) if segmentos else {}
+        return func.HttpResponse(
+            aJson({
+                "votacion_id": votacion.votacionID,
+                "titulo": votacion.titulo,
+                "granularidad": granularidad,
+                "total": series.get(TOTAL, []),
+                "segmentos": [
+                    {"segmento_id": segmentoID, "nombre": nombres.get(segmentoID), "serie": series.get(segmentoID, [])}
+                    for segmentoID in segmentos
+                ],
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"Error al obtener participación: {str(e)}", exc_info=True)
+        return func.HttpResponse(
+            aJson({"error": "Error interno del servidor"}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: participacionVotacion
+
+Ruta: GET /api/participacion/{votacionID}?segmentos=1,3&desde=2025-06-20T08:00&granularidad=minuto
+(requiere clave de función: es para los operadores de la votación)
+
+Descripción general:
+    Serie de tiempo de la participación de una votación: votos registrados
+    por minuto (o por hora), en total y, si se piden, por segmento dirigido.
+
+Parámetros (query string):
+    - segmentos: IDs de segmento separados por coma (opcional)
+    - desde: solo los puntos desde esa fecha y hora, en la hora del servidor
+      (opcional; para refrescar un tablero sin volver a leer toda la serie)
+    - granularidad: minuto (por defecto) u hora
+
+Lógica interna:
+    1. Lee `pv_participacion` (ver `shared.participacion`), que `votar`,
+       `votarBoleta` y el diario de escritura diferida actualizan en la misma
+       transacción que insertan cada voto. No se recorre
+       `pv_respuestaParticipante`.
+    2. Suma las cubetas de cada minuto. Si la votación ya se compactó
+       (`scripts/compactar_participacion.py`), los puntos son por hora aunque
+       se pida minuto; cada punto indica su duración en `minutos`.
+
+Respuesta exitosa (200):
+{
+    "votacion_id": 1,
+    "titulo": "Presupuesto participativo 2025",
+    "granularidad": "minuto",
+    "total": [
+        {"inicio": "2025-06-20T08:00:00", "minutos": 1, "votos": 42},
+        {"inicio": "2025-06-20T08:01:00", "minutos": 1, "votos": 57}
+    ],
+    "segmentos": [
+        {"segmento_id": 3, "nombre": "Jóvenes", "serie": [
+            {"inicio": "2025-06-20T08:00:00", "minutos": 1, "votos": 11}
+        ]}
+    ]
+}
+
+Flujo de respuesta:
+    - 200 OK: serie (los minutos sin votos no aparecen)
+    - 400 Bad Request: parámetros inválidos
+    - 404 Not Found: la votación no existe
+    - 500 Internal Server Error: error inesperado
+
+Consideraciones:
+    - Cuenta votos registrados (filas de `pv_respuestaParticipante`), igual
+      que agrupar esa tabla por minuto de `fechaRespuesta`: una boleta de tres
+      preguntas suma tres.
+    - Un voto cuenta en un segmento si el votante pertenece a él
+      (`pv_usuarioSegmento`) y el segmento es uno de los dirigidos de la
+      votación al momento de votar.
+    - Con `VotosEscrituraDiferida=true` los votos aparecen cuando el diario los
+      inserta, en el minuto de su `fechaRespuesta`.
+"""
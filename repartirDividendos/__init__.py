@@ -1,21 +1,10 @@
-import json
 import logging
-import base64
 import azure.functions as func
+from shared.codec import aJson
 from shared.database import get_session
 from sqlalchemy import text
 
 
-def bytes_to_base64(b: bytes) -> str:
-    return base64.b64encode(b).decode('utf-8')
-
-
-def json_bytes_serializer(obj):
-    if isinstance(obj, bytes):
-        return bytes_to_base64(obj)
-    raise TypeError(f"Type {type(obj)} not serializable")
-
-
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Procesando petición para repartir dividendos...")
 
@@ -27,7 +16,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             await session.commit()
 
         return func.HttpResponse(
-            json.dumps({"mensaje": "Dividendos repartidos exitosamente"}),
+            aJson({"mensaje": "Dividendos repartidos exitosamente"}),
             mimetype="application/json",
             status_code=200
         )
@@ -35,7 +24,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as ex:
         logging.exception("Error al ejecutar el stored procedure")
         return func.HttpResponse(
-            json.dumps({"error": str(ex)}),
+            aJson({"error": str(ex)}),
             mimetype="application/json",
             status_code=500
         )
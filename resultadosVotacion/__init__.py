@@ -0,0 +1,138 @@
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+import azure.functions as func
+from shared.codec import aJson
+from shared.database import get_read_session, leerConfig
+from shared.resultados import obtenerResultados
+
+# Con false, los resultados se publican solo cuando la votación cerró
+RESULTADOS_PARCIALES = leerConfig("ResultadosParciales", False, bool)
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        votacionID = int(req.route_params.get("votacionID") or req.params.get("votacionID") or "")
+    except ValueError:
+        return func.HttpResponse(
+            aJson({"error": "votacionID debe ser un entero"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+    try:
+        async with get_read_session() as lectura:
+            votacion, filas = await obtenerResultados(lectura, votacionID)
+        if votacion is None:
+            return func.HttpResponse(
+                aJson({"error": "Votación no encontrada", "codigo": "404"}),
+                status_code=404,
+                mimetype="application/json"
+            )
+        # Las fechas de pv_votacion se guardan sin zona y se interpretan como UTC
+        cerrada = votacion.fechaFin.replace(tzinfo=timezone.utc) < datetime.now(timezone.utc)
+        if not cerrada and not RESULTADOS_PARCIALES:
+            return func.HttpResponse(
+                aJson({"error": "Los resultados se publican al cerrar la votación", "codigo": "RESULTADOS_NO_DISPONIBLES"}),
+                status_code=403,
+                mimetype="application/json"
+            )
+
+        preguntas = {}
+        for fila in filas:
+            pregunta = preguntas.setdefault(fila.preguntaID, {
+                "pregunta_id": fila.preguntaID,
+                "enunciado": fila.enunciado,
+                "votos": 0,
+                "votos_ponderados": Decimal(0),
+                "respuestas": [],
+            })
+            # Numeric(18, 2) exacto hasta el JSON; SQLite devuelve float en las sumas
+            votosPonderados = Decimal(str(fila.votosPonderados))
+            pregunta["votos"] += int(fila.votos)
+            pregunta["votos_ponderados"] += votosPonderados
+            pregunta["respuestas"].append({
+                "respuesta_id": fila.respuestaID,
+                "respuesta": fila.respuesta,
+                "votos": int(fila.votos),
+                "votos_ponderados": votosPonderados,
+            })
+        return func.HttpResponse(
+            aJson({
+                "votacion_id": votacion.votacionID,
+                "titulo": votacion.titulo,
+                "fecha_inicio": votacion.fechaInicio,
+                "fecha_fin": votacion.fechaFin,
+                "cerrada": cerrada,
+                "preguntas": list(preguntas.values()),
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"Error al obtener resultados: {str(e)}", exc_info=True)
+        return func.HttpResponse(
+            aJson({"error": "Error interno del servidor"}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: resultadosVotacion
+
+Ruta: GET /api/resultados/{votacionID}
+
+Descripción general:
+    Devuelve los resultados de una votación: por pregunta y por respuesta, la
+    cantidad de votos y los votos ponderados (suma del `multiplicador` de
+    `pv_pesoRespuesta` de cada voto; un peso sin multiplicador cuenta 1).
+
+Lógica interna:
+    1. Lee la votación y sus respuestas en la réplica de lectura.
+    2. Los totales salen de `pv_conteoRespuesta`, los contadores que `votar`,
+       `votarBoleta` y el diario de escritura diferida actualizan en la misma
+       transacción que insertan cada voto (ver `shared.resultados`). No se
+       agrupa `pv_respuestaParticipante`: el costo depende de la cantidad de
+       respuestas y no de la de votos.
+    3. Mientras la votación está abierta responde `403`, salvo con
+       `ResultadosParciales=true`.
+
+Respuesta exitosa (200):
+{
+    "votacion_id": 1,
+    "titulo": "Presupuesto participativo 2025",
+    "fecha_inicio": "2025-06-01T00:00:00",
+    "fecha_fin": "2025-06-30T23:59:59",
+    "cerrada": true,
+    "preguntas": [
+        {
+            "pregunta_id": 1,
+            "enunciado": "¿Aprueba el proyecto?",
+            "votos": 1520,
+            "votos_ponderados": "1710.00",
+            "respuestas": [
+                {"respuesta_id": 11, "respuesta": "Sí", "votos": 1000, "votos_ponderados": "1150.00"},
+                {"respuesta_id": 12, "respuesta": "No", "votos": 520, "votos_ponderados": "560.00"}
+            ]
+        }
+    ]
+}
+
+Flujo de respuesta:
+    - 200 OK: resultados
+    - 400 Bad Request: votacionID no es un entero
+    - 403 Forbidden: la votación sigue abierta (RESULTADOS_NO_DISPONIBLES)
+    - 404 Not Found: la votación no existe
+    - 500 Internal Server Error: error inesperado
+
+Consideraciones:
+    - En una pregunta de selección múltiple `votos` cuenta selecciones, no votantes.
+    - `votos_ponderados` se suma como `Decimal` y se serializa como texto
+      (`shared.codec.aJson`), igual que en la exportación: un float perdería
+      centésimos en votaciones grandes.
+    - Con `VotosEscrituraDiferida=true` los votos todavía en el diario no se
+      cuentan hasta que se insertan.
+    - `scripts/recontar_resultados.py` verifica los contadores contra los votos
+      y puede reconstruirlos.
+"""
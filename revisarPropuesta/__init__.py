@@ -1,7 +1,7 @@
 # revisarPropuesta/__init__.py
 import logging
-import json
 import azure.functions as func
+from shared.codec import leerDto, aJson
 from shared.dtos import RevisarPropuestaDTO # Importa el nuevo DTO
 from shared.database import get_session
 from sqlalchemy import text
@@ -12,7 +12,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('HTTP trigger function processed a request to revise a proposal using SQLAlchemy.')
 
     try:
-        dto = RevisarPropuestaDTO(**req.get_json())
+        dto = leerDto(req, RevisarPropuestaDTO)
     except ValidationError as e:
         logging.error(f"Error de validación del DTO: {str(e)}")
         return func.HttpResponse(
@@ -41,7 +41,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         async with get_session() as session:
-            params = dto.dict()
+            params = dto.model_dump()
 
             logging.info(f"Executing SP usp_RevisarPropuesta with params: {params}")
             result = await session.execute(sp_call, params)
@@ -50,7 +50,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
             if not rows:
                 return func.HttpResponse(
-                    json.dumps({"error": "No se recibieron resultados esperados del stored procedure usp_RevisarPropuesta"}),
+                    aJson({"error": "No se recibieron resultados esperados del stored procedure usp_RevisarPropuesta"}),
                     mimetype="application/json",
                     status_code=500
                 )
@@ -73,7 +73,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code = 400 
             
             return func.HttpResponse(
-                json.dumps(response_payload),
+                aJson(response_payload),
                 mimetype="application/json",
                 status_code=status_code
             )
@@ -81,7 +81,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as ex:
         logging.exception("Error al ejecutar el stored procedure usp_RevisarPropuesta.")
         return func.HttpResponse(
-            json.dumps({"error": f"Error interno del servidor al procesar la revisión: {str(ex)}"}),
+            aJson({"error": f"Error interno del servidor al procesar la revisión: {str(ex)}"}),
             mimetype="application/json",
             status_code=500
         )
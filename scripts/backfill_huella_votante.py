@@ -0,0 +1,140 @@
+"""
+Backfill de `huellaVotante` y `huellaUsuario` en pv_respuestaParticipante.
+
+Los votos anteriores a la columna solo identifican al votante en `ncRespuesta`,
+cifrado con la llave descifrada de cada usuario, que el servidor no guarda. El
+job recibe esas llaves en un archivo JSON por línea
+(`{"usuarioID": 1, "llave": "..."}`), por ejemplo exportado durante una
+ventana de mantenimiento, y por cada usuario asigna la huella a sus votos sin
+huella (`shared.huella.completarHuellas`). Cada lote de usuarios se confirma en
+su propia transacción; solo se tocan filas con `huellaVotante` en NULL, así que
+se puede interrumpir y volver a correr.
+
+Los usuarios que no estén en el archivo se completan solos al votar de nuevo
+mientras `HuellaVotanteRespaldoLegado=true`.
+
+Con `--usuarios`, asigna `huellaUsuario` a los votos que ya tienen
+`huellaVotante` (`shared.huella.completarHuellaUsuario`). No necesita llaves:
+recorre `pv_usuarios` por ID y, para cada uno, busca sus huellas por pregunta.
+Con `--desde-usuario` se retoma donde quedó.
+
+Requiere haber aplicado scripts/sql/huella_votante.sql y
+scripts/sql/huella_usuario.sql.
+
+Uso:
+    python scripts/backfill_huella_votante.py --llaves llaves.jsonl [--lote 100]
+    python scripts/backfill_huella_votante.py --usuarios [--lote 100] [--desde-usuario 0]
+    python scripts/backfill_huella_votante.py --pendientes
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, or_, select  # noqa: E402
+from shared.database import get_session, unidadDeTrabajo, cerrarEngines  # noqa: E402
+from shared.huella import completarHuellas, completarHuellaUsuario  # noqa: E402
+from shared.models import Pregunta, RespuestaParticipante, Usuario  # noqa: E402
+
+
+async def contarPendientes() -> int:
+    async with get_session() as session:
+        return (await session.execute(
+            select(func.count()).select_from(RespuestaParticipante).where(or_(
+                RespuestaParticipante.huellaVotante.is_(None),
+                RespuestaParticipante.huellaUsuario.is_(None),
+            ))
+        )).scalar_one()
+
+
+def leerLlaves(ruta: str):
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            if linea.strip():
+                registro = json.loads(linea)
+                yield int(registro["usuarioID"]), registro["llave"]
+
+
+async def backfill(ruta: str, tamanoLote: int) -> int:
+    total = 0
+    usuarios = 0
+    inicio = time.perf_counter()
+    lote = []
+
+    async def procesar(lote):
+        actualizadas = 0
+        async with unidadDeTrabajo() as session:
+            for usuarioID, llave in lote:
+                actualizadas += await completarHuellas(session, usuarioID, llave)
+        return actualizadas
+
+    for usuario in leerLlaves(ruta):
+        lote.append(usuario)
+        if len(lote) >= tamanoLote:
+            total += await procesar(lote)
+            usuarios += len(lote)
+            lote = []
+            print(f"{usuarios} usuarios, {total} votos con huella ({time.perf_counter() - inicio:.1f}s)")
+    if lote:
+        total += await procesar(lote)
+        usuarios += len(lote)
+    print(f"Listo: {usuarios} usuarios, {total} votos con huella ({time.perf_counter() - inicio:.1f}s)")
+    return total
+
+
+async def backfillUsuarios(tamanoLote: int, desde: int) -> int:
+    total = 0
+    usuarios = 0
+    inicio = time.perf_counter()
+    async with get_session() as session:
+        preguntas = (await session.execute(select(Pregunta.preguntaID, Pregunta.maxSelecciones))).all()
+    while True:
+        async with unidadDeTrabajo() as session:
+            lote = (await session.execute(
+                select(Usuario.userid).where(Usuario.userid > desde).order_by(Usuario.userid).limit(tamanoLote)
+            )).scalars().all()
+            for usuarioID in lote:
+                total += await completarHuellaUsuario(session, usuarioID, preguntas)
+        if not lote:
+            break
+        usuarios += len(lote)
+        desde = lote[-1]
+        print(f"{usuarios} usuarios (hasta {desde}), {total} votos con huellaUsuario ({time.perf_counter() - inicio:.1f}s)")
+    print(f"Listo: {usuarios} usuarios, {total} votos con huellaUsuario ({time.perf_counter() - inicio:.1f}s)")
+    return total
+
+
+async def ejecutar(args) -> int:
+    try:
+        if args.llaves:
+            await backfill(args.llaves, args.lote)
+        if args.usuarios:
+            await backfillUsuarios(args.lote, args.desde_usuario)
+        pendientes = await contarPendientes()
+        print(f"Votos sin huella: {pendientes}")
+        if pendientes == 0:
+            print("Se puede desactivar HuellaVotanteRespaldoLegado")
+    finally:
+        await cerrarEngines()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--llaves", help="Archivo JSON por línea con usuarioID y llave")
+    parser.add_argument("--usuarios", action="store_true", help="Asignar huellaUsuario a los votos con huellaVotante")
+    parser.add_argument("--desde-usuario", type=int, default=0, help="Retomar --usuarios después de este usuarioID")
+    parser.add_argument("--lote", type=int, default=100, help="Usuarios por transacción")
+    parser.add_argument("--pendientes", action="store_true", help="Solo contar votos sin huella")
+    args = parser.parse_args()
+    if not args.llaves and not args.usuarios and not args.pendientes:
+        parser.error("indique --llaves, --usuarios o --pendientes")
+    return asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
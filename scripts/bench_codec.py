@@ -0,0 +1,76 @@
+"""
+Microbenchmark del codec de peticiones/respuestas.
+
+Compara, por petición, el camino anterior (`req.get_json()` + `Dto(**dict)` +
+`json.dumps(default=...)`) contra `shared.codec` (`model_validate_json` +
+orjson) con un body de `votar` y una respuesta de `listarVotos`.
+
+Uso:
+    python scripts/bench_codec.py [--iteraciones 50000]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import azure.functions as func
+from shared.codec import leerDto, aJson
+from shared.dtos import VotoDTO
+
+CUERPO = json.dumps({
+    "preguntaID": 1,
+    "respuestaID": 1,
+    "valor": "Mejorar el transporte público",
+    "pesoRespuesta": 2,
+    "cedulaUsuario": "100000000",
+    "contrasenia": "JUGAHE0000",
+    "prueba_vida": "Prueba de Vida",
+}).encode()
+
+RESPUESTA = {
+    "user_id": 1,
+    "nombre": "Ana",
+    "respuestas": [
+        {
+            "respuesta_participante_id": i,
+            "fecha_respuesta": datetime(2025, 7, 1, 8, i),
+            "monto": Decimal("1500.25"),
+            "checksum": bytes(range(32)),
+            "titulo_votacion": "Consulta sobre políticas públicas 2025",
+        }
+        for i in range(20)
+    ],
+}
+
+
+def serializadorAnterior(obj):
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("utf-8")
+    return str(obj)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iteraciones", type=int, default=50000)
+    n = parser.parse_args().iteraciones
+
+    req = func.HttpRequest("POST", "http://localhost/api/votar", body=CUERPO, headers={})
+    casos = {
+        "entrada anterior (get_json + Dto(**d))": lambda: VotoDTO(**req.get_json()),
+        "entrada codec    (model_validate_json)": lambda: leerDto(req, VotoDTO),
+        "salida  anterior (json.dumps default)": lambda: json.dumps(RESPUESTA, default=serializadorAnterior).encode(),
+        "salida  codec    (orjson)": lambda: aJson(RESPUESTA),
+    }
+    for nombre, caso in casos.items():
+        segundos = min(timeit.repeat(caso, number=n, repeat=3))
+        print(f"{nombre:<42} {segundos / n * 1e6:8.2f} µs/petición")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark del escrutinio vectorizado (shared/escrutinio.py) con datos sintéticos.
+
+Genera boletas reproducibles (`--semilla`) en lotes de `--lote`: preferencias
+sesgadas entre `--candidatos` respuestas, pesos 1 / 1.5 / 2, notas del 1 al 5
+(con algunas inválidas) y órdenes de preferencia parciales para la segunda
+vuelta. Por cada método mide boletas por segundo del conteo con NumPy (sin
+contar la generación) y la memoria pico, y lo compara con un conteo fila por
+fila en Python puro sobre las primeras `--boletas-python` boletas, verificando
+que ambos den el mismo resultado.
+
+Uso:
+    python scripts/bench_escrutinio.py [--boletas 2000000] [--lote 100000] [--candidatos 6]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from itertools import permutations
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import numpy as np  # noqa: E402
+from shared.escrutinio import METODOS, MAYORIA, APROBACION, CALIFICACION, SEGUNDA_VUELTA  # noqa: E402
+
+PESOS = np.array([1.0, 1.5, 2.0])
+PROBABILIDAD_PESOS = [0.8, 0.15, 0.05]
+NOTAS = np.array(["1", "2", "3", "4", "5", "n/a"])
+PROBABILIDAD_NOTAS = [0.1, 0.15, 0.25, 0.3, 0.19, 0.01]
+
+
+class Datos:
+    def __init__(self, candidatos: int, semilla: int):
+        self.semilla = semilla
+        self.candidatos = np.arange(11, 11 + candidatos, dtype=np.int64)
+        rng = np.random.default_rng(semilla)
+        self.preferencias = rng.dirichlet(np.ones(candidatos))
+        # Órdenes parciales posibles, de 1 a 3 preferencias, con popularidad desigual
+        self.ordenes = np.array([
+            ">".join(str(c) for c in orden)
+            for largo in range(1, min(3, candidatos) + 1)
+            for orden in permutations(self.candidatos.tolist(), largo)
+        ])
+        self.probabilidadOrdenes = rng.dirichlet(np.full(len(self.ordenes), 0.3))
+
+    def lotes(self, metodo: str, boletas: int, lote: int):
+        rng = np.random.default_rng(self.semilla + 1)
+        for inicio in range(0, boletas, lote):
+            cantidad = min(lote, boletas - inicio)
+            respuestaIDs = rng.choice(self.candidatos, cantidad, p=self.preferencias)
+            pesos = rng.choice(PESOS, cantidad, p=PROBABILIDAD_PESOS)
+            if metodo == CALIFICACION:
+                valores = rng.choice(NOTAS, cantidad, p=PROBABILIDAD_NOTAS)
+            elif metodo == SEGUNDA_VUELTA:
+                valores = rng.choice(self.ordenes, cantidad, p=self.probabilidadOrdenes)
+            else:
+                valores = np.full(cantidad, "")
+            yield respuestaIDs, pesos, valores
+
+
+# --- referencia fila por fila ---
+
+def pythonPuro(metodo: str, candidatos: list, lotes) -> dict:
+    votos = {c: 0 for c in candidatos}
+    ponderados = {c: 0.0 for c in candidatos}
+    notas = {c: [0, 0.0, 0.0, 0.0] for c in candidatos}
+    boletas = []
+    for respuestaIDs, pesos, valores in lotes:
+        for respuestaID, peso, valor in zip(respuestaIDs.tolist(), pesos.tolist(), valores.tolist()):
+            if metodo in (MAYORIA, APROBACION):
+                votos[respuestaID] += 1
+                ponderados[respuestaID] += peso
+            elif metodo == CALIFICACION:
+                try:
+                    nota = float(valor)
+                except ValueError:
+                    continue
+                acumulado = notas[respuestaID]
+                acumulado[0] += 1
+                acumulado[1] += nota
+                acumulado[2] += peso
+                acumulado[3] += nota * peso
+            else:
+                boletas.append(([int(parte) for parte in valor.split(">")], peso))
+    if metodo == MAYORIA:
+        return {"ganadores": [c for c in candidatos if votos[c] == max(votos.values())], "votos": votos}
+    if metodo == APROBACION:
+        maximo = max(ponderados.values())
+        return {"ganadores": [c for c in candidatos if ponderados[c] == maximo], "votos": votos}
+    if metodo == CALIFICACION:
+        promedios = {c: a[3] / a[2] for c, a in notas.items() if a[0]}
+        maximo = max(promedios.values())
+        return {"ganadores": [c for c in promedios if promedios[c] == maximo], "votos": {c: a[0] for c, a in notas.items()}}
+    activos = set(candidatos)
+    rondas = 0
+    while True:
+        rondas += 1
+        conteo = {c: 0.0 for c in activos}
+        for orden, peso in boletas:
+            for preferencia in orden:
+                if preferencia in activos:
+                    conteo[preferencia] += peso
+                    break
+        total = sum(conteo.values())
+        if max(conteo.values()) * 2 > total:
+            return {"ganadores": [c for c in conteo if conteo[c] == max(conteo.values())], "rondas": rondas}
+        minimo = min(conteo.values())
+        eliminados = {c for c in activos if conteo[c] == minimo}
+        if eliminados == activos:
+            return {"ganadores": sorted(activos), "rondas": rondas}
+        activos -= eliminados
+
+
+def vectorizado(metodo: str, candidatos: list, lotes):
+    conteo = METODOS[metodo](candidatos)
+    tiempo = 0.0
+    for lote in lotes:
+        inicio = time.perf_counter()
+        conteo.agregar(*lote)
+        tiempo += time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    resultado = conteo.resultado()
+    return resultado, tiempo + time.perf_counter() - inicio
+
+
+def coinciden(metodo: str, resultado: dict, referencia: dict) -> bool:
+    if sorted(resultado["ganadores"]) != sorted(referencia["ganadores"]):
+        return False
+    if metodo == SEGUNDA_VUELTA:
+        return len(resultado["rondas"]) == referencia["rondas"]
+    return {r["respuestaID"]: r["votos"] for r in resultado["respuestas"]} == referencia["votos"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--boletas", type=int, default=2_000_000)
+    parser.add_argument("--lote", type=int, default=100_000)
+    parser.add_argument("--candidatos", type=int, default=6)
+    parser.add_argument("--boletas-python", type=int, default=200_000, help="Boletas del conteo de referencia")
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    datos = Datos(args.candidatos, args.semilla)
+    candidatos = datos.candidatos.tolist()
+    referencia = min(args.boletas_python, args.boletas)
+    print(f"{args.boletas} boletas en lotes de {args.lote}, {args.candidatos} respuestas, semilla {args.semilla}")
+    correcto = True
+    for metodo in (MAYORIA, APROBACION, CALIFICACION, SEGUNDA_VUELTA):
+        tracemalloc.start()
+        resultado, tiempo = vectorizado(metodo, candidatos, datos.lotes(metodo, args.boletas, args.lote))
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        inicio = time.perf_counter()
+        esperado = pythonPuro(metodo, candidatos, datos.lotes(metodo, referencia, args.lote))
+        tiempoPython = time.perf_counter() - inicio
+        verificado, _ = vectorizado(metodo, candidatos, datos.lotes(metodo, referencia, args.lote))
+        ok = coinciden(metodo, verificado, esperado)
+        correcto &= ok
+
+        print(f"  {metodo:<14} numpy {args.boletas / tiempo / 1e6:6.2f} M boletas/s ({tiempo:5.2f} s)"
+              f"   python {referencia / tiempoPython / 1e6:5.2f} M boletas/s"
+              f"   memoria pico {pico / 2**20:6.1f} MiB   ganadores {resultado['ganadores']}"
+              f"   {'ok' if ok else 'DIFERENTE de la referencia'}")
+    return 0 if correcto else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Microbenchmark de las restricciones de IP y horario de `votar`.
+
+Compara, con `--redes` rangos CIDR aleatorios (IPv4 e IPv6), la verificación
+compilada de `shared.restricciones` (intervalos fusionados + bisect) contra
+recorrer la lista de `ipaddress.ip_network` con `in`, que es lo que haría una
+implementación directa. También mide el costo de compilar y el de la
+verificación de horario.
+
+Uso:
+    python scripts/bench_restricciones.py [--redes 5000] [--consultas 20000]
+"""
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def redesAleatorias(cantidad: int, semilla: int = 7) -> list:
+    aleatorio = random.Random(semilla)
+    redes = []
+    for _ in range(cantidad):
+        if aleatorio.random() < 0.8:
+            prefijo = aleatorio.randint(16, 30)
+            direccion = ipaddress.IPv4Address(aleatorio.getrandbits(32))
+        else:
+            prefijo = aleatorio.randint(32, 64)
+            direccion = ipaddress.IPv6Address(aleatorio.getrandbits(128))
+        redes.append(str(ipaddress.ip_network(f"{direccion}/{prefijo}", strict=False)))
+    return redes
+
+
+def ipsAleatorias(redes: list, cantidad: int, semilla: int = 11) -> list:
+    """Mitad dentro de alguna red y mitad al azar (casi todas fuera)."""
+    aleatorio = random.Random(semilla)
+    ips = []
+    for numero in range(cantidad):
+        if numero % 2:
+            red = ipaddress.ip_network(aleatorio.choice(redes))
+            ips.append(str(red.network_address + aleatorio.randrange(red.num_addresses)))
+        else:
+            ips.append(str(ipaddress.IPv4Address(aleatorio.getrandbits(32))))
+    return ips
+
+
+def medir(funcion, valores: list) -> tuple:
+    inicio = time.perf_counter()
+    aciertos = sum(1 for valor in valores if funcion(valor))
+    return (time.perf_counter() - inicio) / len(valores), aciertos
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--redes", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=20000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SqlConnectionString", "sqlite+aiosqlite://")
+    from shared.restricciones import Horario, RangosIP
+
+    redes = redesAleatorias(args.redes)
+    ips = ipsAleatorias(redes, args.consultas)
+
+    inicio = time.perf_counter()
+    rangos = RangosIP(redes)
+    compilar = time.perf_counter() - inicio
+    compilado, aciertosCompilado = medir(lambda ip: ip in rangos, ips)
+
+    objetos = [ipaddress.ip_network(red) for red in redes]
+
+    def directo(ip):
+        direccion = ipaddress.ip_address(ip)
+        return any(direccion in red for red in objetos)
+
+    muestra = ips[:max(1, args.consultas // 20)]
+    lineal, aciertosLineal = medir(directo, muestra)
+    aciertosEsperados = sum(1 for ip in muestra if ip in rangos)
+    if aciertosLineal != aciertosEsperados:
+        print(f"ERROR: resultados distintos ({aciertosLineal} vs {aciertosEsperados})")
+        return 1
+
+    horario = Horario(["08:00-12:00", "13:00-17:30", "22:00-02:00"])
+    instantes = [datetime.fromtimestamp(1_700_000_000 + segundos * 37, timezone.utc) for segundos in range(args.consultas)]
+    porHorario, _ = medir(horario.permite, instantes)
+
+    print(f"{args.redes} redes CIDR ({len(rangos)} intervalos tras fusionar), compiladas en {compilar * 1000:.1f} ms")
+    print(f"  compilado (bisect)   {compilado * 1e6:8.2f} µs/IP   ({aciertosCompilado} de {len(ips)} dentro)")
+    print(f"  lineal (ip_network)  {lineal * 1e6:8.2f} µs/IP   ({len(muestra)} consultas)")
+    print(f"  horario              {porHorario * 1e6:8.2f} µs/consulta")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Benchmark de latencia de `votar` (p50/p99): lecturas en secuencia vs. en paralelo.
+
+Llama a `votar.main` de punta a punta con credenciales (sin token de sesión)
+y mide la latencia de cada voto con `VotarLecturasConcurrentes` apagado y
+encendido, con la boleta en cache y sin ella (TTL 0, como un worker frío). La
+lectura en paralelo solo ocurre con réplica, así que la misma base se
+configura también como réplica (otro engine, con su propio pool).
+
+Usa una base SQLite temporal con `ENCRYPTBYPASSPHRASE` /
+`DECRYPTBYPASSPHRASE` simulados, y agrega `--latencia-ms` a cada ida a la base
+de datos para representar la red hasta SQL Server; sin esa latencia no hay
+nada que paralelizar. Las sentencias dentro de la transacción de escritura no
+suman latencia, porque SQLite la serializa entre todas las peticiones.
+
+El p99 queda dominado por la espera del único escritor de SQLite y varía entre
+corridas más que la diferencia entre modos (los dos modos con cache, que hacen
+lo mismo, difieren tanto como los demás): compare el p50, o mida el p99 contra
+SQL Server.
+
+Uso:
+    python scripts/bench_votar.py [--votos 300] [--concurrencia 4] [--latencia-ms 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+MODOS = [
+    # (nombre, lecturas concurrentes, boleta en cache, preguntaID)
+    ("secuencial, sin cache", False, False, 1),
+    ("paralelo,   sin cache", True, False, 2),
+    ("secuencial, con cache", False, True, 3),
+    ("paralelo,   con cache", True, True, 4),
+]
+
+
+def _cifrar(frase, texto):
+    if frase is None or texto is None:
+        return None
+    return str(frase).encode() + b"|" + (texto if isinstance(texto, bytes) else str(texto).encode())
+
+
+def _descifrar(frase, datos):
+    if frase is None or datos is None:
+        return None
+    prefijo = str(frase).encode() + b"|"
+    return datos[len(prefijo):] if datos.startswith(prefijo) else None
+
+
+def simularSqlServer(latencia: float):
+    from sqlalchemy import event
+
+    def instalar(engine):
+        @event.listens_for(engine.sync_engine, "connect")
+        def conectar(dbapi, registro):
+            dbapi.create_function("ENCRYPTBYPASSPHRASE", 2, _cifrar)
+            dbapi.create_function("DECRYPTBYPASSPHRASE", 2, _descifrar)
+            cursor = dbapi.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.close()
+            conexion = dbapi.driver_connection._conn
+
+            def red(sentencia):
+                # SQLite tiene un solo escritor: esperar con la transacción abierta mediría
+                # la cola de ese bloqueo y no la latencia de votar
+                if not conexion.in_transaction:
+                    time.sleep(latencia)
+
+            # El trace de sqlite3 corre en el hilo de aiosqlite de cada conexión, así
+            # que la espera no bloquea el event loop (los eventos de SQLAlchemy sí)
+            conexion.set_trace_callback(red)
+
+    return instalar
+
+
+async def sembrar(usuarios: int):
+    from shared.database import obtenerEngine, get_session
+    from shared import models as m
+
+    async with obtenerEngine().begin() as conn:
+        await conn.run_sync(m.Base.metadata.create_all)
+    ahora = datetime.now()
+    async with get_session() as session:
+        session.add(m.Votacion(
+            votacionID=1, tipoVotacionId=1, titulo="bench", fechaInicio=ahora - timedelta(days=1),
+            fechaFin=ahora + timedelta(days=1), estadoVotacionId=1, ultimaModificacion=ahora,
+            privada=False, esSecreta=False,
+        ))
+        for _, _, _, preguntaID in MODOS:
+            session.add(m.Pregunta(
+                preguntaID=preguntaID, enunciado=f"P{preguntaID}", tipoPreguntaID=1, maxSelecciones=1,
+                fechaPublicacion=ahora, deleted=False, order=preguntaID, checksum=b"bench",
+            ))
+            session.add(m.VotacionPregunta(votacionID=1, preguntaID=preguntaID))
+            session.add(m.Respuesta(
+                respuestaID=preguntaID * 10, preguntaID=preguntaID, respuesta="Sí", value="1",
+                order=1, deleted=False, checksum=b"bench",
+            ))
+        for usuario in range(1, usuarios + 1):
+            session.add(m.Usuario(
+                userid=usuario, nombre="Bench", primerApellido="Votante", fechaNacimiento=datetime(1990, 1, 1),
+                identificacion=f"{usuario:09d}", nacional=True, sexo=True,
+            ))
+            session.add(m.LlaveUsuario(
+                llaveCifrada=_cifrar(f"clave{usuario}", f"LLAVE{usuario}"), usuarioID=usuario,
+                esActiva=True, ultimaModificacion=ahora,
+            ))
+        await session.commit()
+
+
+def percentil(muestras: list, p: int) -> float:
+    return statistics.quantiles(muestras, n=100, method="inclusive")[p - 1]
+
+
+async def medirModo(votos: int, concurrencia: int, concurrente: bool, enCache: bool, preguntaID: int) -> list:
+    import azure.functions as func
+    import votar
+    from shared.boletas import cacheBoletas
+
+    votar.LECTURAS_CONCURRENTES = concurrente
+    cacheBoletas.invalidar()
+    cacheBoletas.ttl = 3600 if enCache else 0
+    if enCache:
+        await votar.obtenerBoleta(None, preguntaID)
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+    errores = 0
+
+    async def uno(usuario):
+        nonlocal errores
+        cuerpo = json.dumps({
+            "preguntaID": preguntaID, "respuestaID": preguntaID * 10, "valor": "Sí", "pesoRespuesta": 1,
+            "cedulaUsuario": f"{usuario:09d}", "contrasenia": f"clave{usuario}", "prueba_vida": "bench",
+        }).encode()
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await votar.main(func.HttpRequest("POST", "/api/votar", body=cuerpo))
+            latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 300:
+            errores += 1
+
+    await asyncio.gather(*(uno(usuario) for usuario in range(1, votos + 1)))
+    if errores:
+        print(f"  ({errores} votos con error)")
+    return latencias
+
+
+async def ejecutar(args):
+    from shared.database import alCrearEngine, cerrarEngines, POOL_SIZE
+
+    alCrearEngine(simularSqlServer(args.latencia_ms / 1000))
+    await sembrar(args.votos)
+    print(f"{args.votos} votos por modo, concurrencia {args.concurrencia}, pool {POOL_SIZE}, "
+          f"latencia simulada {args.latencia_ms} ms por ida")
+    try:
+        for nombre, concurrente, enCache, preguntaID in MODOS:
+            latencias = await medirModo(args.votos, args.concurrencia, concurrente, enCache, preguntaID)
+            print(f"  {nombre}   p50 {percentil(latencias, 50) * 1000:7.1f} ms"
+                  f"   p99 {percentil(latencias, 99) * 1000:7.1f} ms")
+    finally:
+        await cerrarEngines()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--votos", type=int, default=300)
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--latencia-ms", type=float, default=5.0, help="Latencia simulada por ida a la base de datos")
+    args = parser.parse_args()
+
+    temporal = tempfile.mkdtemp(prefix="bench_votar_")
+    # shared.* lee la configuración al importarse
+    os.environ["SqlConnectionString"] = f"sqlite+aiosqlite:///{os.path.join(temporal, 'votar.db')}"
+    os.environ["SqlReadConnectionString"] = os.environ["SqlConnectionString"]
+    os.environ["SqlReplicaConsultaRetraso"] = "SELECT 0"
+    os.environ.setdefault("HuellaVotanteSecreto", "bench")
+    os.environ.setdefault("HuellaVotanteRespaldoLegado", "false")
+    os.environ.setdefault("VotosEscrituraDiferida", "false")
+    asyncio.run(ejecutar(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
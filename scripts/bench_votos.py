@@ -0,0 +1,134 @@
+"""
+Benchmark de ingesta de votos: síncrona vs. escritura diferida.
+
+Mide votos por segundo de la capa de persistencia de `votar`, sin
+autenticación ni cifrado, con `--concurrencia` peticiones simultáneas:
+
+- sincrono: cada voto en su propia transacción (INSERT + commit), como
+  `votar` con `VotosEscrituraDiferida=false`.
+- diferido: cada voto se anexa al diario con fsync (`shared.diario`) y se
+  confirma al cliente; el tiempo incluye vaciar el diario a la base de datos.
+
+Por defecto usa una base SQLite temporal; con `--url` se puede apuntar a una
+base de pruebas de SQL Server con el esquema creado (los votos se insertan de
+verdad).
+
+Uso:
+    python scripts/bench_votos.py [--votos 5000] [--concurrencia 50] [--url ...]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def fila(numero: int) -> dict:
+    return {
+        "preguntaID": 1,
+        "respuestaID": 1,
+        "checksum": hashlib.sha256(b"RespuestaParticipante").digest(),
+        "valor": "bench",
+        "fechaRespuesta": datetime.now(),
+        "ncRespuesta": os.urandom(64),
+        "tokenGUID": str(uuid.uuid4()),
+        "pesoRespuesta": 1,
+        "huellaVotante": hashlib.sha256(f"bench:{numero}:{uuid.uuid4()}".encode()).digest(),
+    }
+
+
+async def enParalelo(total: int, concurrencia: int, votar):
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def uno(numero):
+        async with semaforo:
+            await votar(numero)
+
+    await asyncio.gather(*(uno(numero) for numero in range(total)))
+
+
+async def benchSincrono(total: int, concurrencia: int) -> float:
+    from shared.database import unidadDeTrabajo
+    from shared.models import RespuestaParticipante
+
+    async def votar(numero):
+        async with unidadDeTrabajo() as session:
+            session.add(RespuestaParticipante(**fila(numero)))
+
+    inicio = time.perf_counter()
+    await enParalelo(total, concurrencia, votar)
+    return time.perf_counter() - inicio
+
+
+async def benchDiferido(total: int, concurrencia: int, archivo: str) -> tuple:
+    from shared.diario import DiarioVotos
+
+    diario = DiarioVotos(archivo)
+
+    async def votar(numero):
+        await diario.registrar(fila(numero))
+
+    inicio = time.perf_counter()
+    await enParalelo(total, concurrencia, votar)
+    confirmados = time.perf_counter() - inicio
+    await diario.vaciar()
+    return confirmados, time.perf_counter() - inicio
+
+
+async def contarVotos() -> int:
+    from sqlalchemy import func, select
+    from shared.database import get_session
+    from shared.models import RespuestaParticipante
+
+    async with get_session() as session:
+        return (await session.execute(select(func.count()).select_from(RespuestaParticipante))).scalar_one()
+
+
+async def ejecutar(args):
+    from shared.database import obtenerEngine, cerrarEngines, POOL_SIZE
+    from shared.models import Base
+
+    if args.url.startswith("sqlite"):
+        async with obtenerEngine().begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    try:
+        antes = await contarVotos()
+        sincrono = await benchSincrono(args.votos, args.concurrencia)
+        confirmados, diferido = await benchDiferido(args.votos, args.concurrencia, args.diario)
+        insertados = await contarVotos() - antes
+    finally:
+        await cerrarEngines()
+
+    print(f"{args.votos} votos, concurrencia {args.concurrencia}, pool {POOL_SIZE}")
+    print(f"  sincrono              {args.votos / sincrono:10.0f} votos/s   ({sincrono:.2f}s)")
+    print(f"  diferido (confirmado) {args.votos / confirmados:10.0f} votos/s   ({confirmados:.2f}s)")
+    print(f"  diferido (en la base) {args.votos / diferido:10.0f} votos/s   ({diferido:.2f}s)")
+    print(f"  filas insertadas: {insertados} de {args.votos * 2}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--votos", type=int, default=5000)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--url", default=None, help="URL de SQLAlchemy (por defecto SQLite temporal)")
+    parser.add_argument("--diario", default=None, help="Archivo del diario (por defecto temporal)")
+    args = parser.parse_args()
+
+    temporal = tempfile.mkdtemp(prefix="bench_votos_")
+    args.url = args.url or f"sqlite+aiosqlite:///{os.path.join(temporal, 'votos.db')}"
+    args.diario = args.diario or os.path.join(temporal, "diario.jsonl")
+    # shared.database lee la cadena de conexión al importarse
+    os.environ["SqlConnectionString"] = args.url
+    asyncio.run(ejecutar(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
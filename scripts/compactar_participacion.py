@@ -0,0 +1,69 @@
+"""
+Compacta la participación por minuto de las votaciones cerradas en horas.
+
+`pv_participacion` guarda una fila por minuto, segmento y cubeta mientras la
+votación está abierta (ver shared/participacion.py). Una vez cerrada, esa
+resolución ya no se consulta: el job reemplaza las filas de cada votación
+cerrada hace más de `--margen-minutos` por una fila por hora y segmento, en una
+transacción por votación. El margen deja terminar los lotes que el diario de
+escritura diferida todavía esté insertando; lo que llegue después queda como
+minutos sueltos y se compacta en la siguiente corrida.
+
+Uso:
+    python scripts/compactar_participacion.py [--votacion 1] [--margen-minutos 10]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from shared.database import get_session, unidadDeTrabajo, cerrarEngines  # noqa: E402
+from shared.models import Participacion, Votacion  # noqa: E402
+from shared.participacion import MINUTO, compactar  # noqa: E402
+
+
+async def votacionesPorCompactar(limite: datetime, votacionID=None):
+    consulta = (
+        select(Votacion.votacionID, Votacion.titulo)
+        .where(
+            Votacion.fechaFin < limite,
+            Votacion.votacionID.in_(select(Participacion.votacionID).where(Participacion.minutos == MINUTO)),
+        )
+        .order_by(Votacion.votacionID)
+    )
+    if votacionID is not None:
+        consulta = consulta.where(Votacion.votacionID == votacionID)
+    async with get_session() as session:
+        return (await session.execute(consulta)).all()
+
+
+async def ejecutar(args) -> int:
+    # Las fechas de pv_votacion se guardan sin zona y se interpretan como UTC
+    limite = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=args.margen_minutos)
+    try:
+        votaciones = await votacionesPorCompactar(limite, args.votacion)
+        if not votaciones:
+            print("No hay votaciones cerradas con participación por minuto")
+        for votacion in votaciones:
+            async with unidadDeTrabajo() as session:
+                minutos, horas = await compactar(session, votacion.votacionID)
+            print(f"Votación {votacion.votacionID} ({votacion.titulo}): {minutos} filas por minuto -> {horas} por hora")
+    finally:
+        await cerrarEngines()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--votacion", type=int, help="Solo esta votación (por defecto, todas las cerradas)")
+    parser.add_argument("--margen-minutos", type=int, default=10, help="Minutos desde el cierre antes de compactar")
+    args = parser.parse_args()
+    return asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
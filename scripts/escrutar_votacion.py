@@ -0,0 +1,79 @@
+"""
+Escrutinio completo de una votación con el motor vectorizado (shared/escrutinio.py).
+
+Cada pregunta se cuenta con `--metodo`, o si no se indica, con el que
+corresponde al `tipoVotacionId` de la votación (`METODO_POR_TIPO`); si el tipo
+no está en el catálogo, las preguntas con `maxSelecciones > 1` se cuentan por
+aprobación y las demás por mayoría. Imprime el resultado como JSON.
+
+Lee de la réplica de lectura, en lotes de `EscrutinioTamanoLote` votos.
+
+Uso:
+    python scripts/escrutar_votacion.py --votacion 1 [--metodo segundaVuelta]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from shared.codec import aJson  # noqa: E402
+from shared.database import get_read_session, cerrarEngines  # noqa: E402
+from shared.escrutinio import METODOS, METODO_POR_TIPO, MAYORIA, APROBACION, escrutarPregunta  # noqa: E402
+from shared.models import Pregunta, Votacion, VotacionPregunta  # noqa: E402
+
+
+async def escrutar(votacionID: int, metodo: str = None) -> int:
+    async with get_read_session() as lectura:
+        votacion = (await lectura.execute(
+            select(Votacion.votacionID, Votacion.titulo, Votacion.tipoVotacionId).where(Votacion.votacionID == votacionID)
+        )).first()
+        if votacion is None:
+            print(f"No existe la votación {votacionID}", file=sys.stderr)
+            return 1
+        preguntas = (await lectura.execute(
+            select(Pregunta.preguntaID, Pregunta.maxSelecciones)
+            .join(VotacionPregunta, VotacionPregunta.preguntaID == Pregunta.preguntaID)
+            .where(VotacionPregunta.votacionID == votacionID)
+            .order_by(Pregunta.order, Pregunta.preguntaID)
+        )).all()
+        resultados = []
+        inicio = time.perf_counter()
+        for pregunta in preguntas:
+            metodoPregunta = metodo or METODO_POR_TIPO.get(
+                votacion.tipoVotacionId, APROBACION if pregunta.maxSelecciones > 1 else MAYORIA
+            )
+            try:
+                resultados.append(await escrutarPregunta(lectura, pregunta.preguntaID, metodoPregunta))
+            except ValueError as e:
+                print(f"Pregunta {pregunta.preguntaID}: {e}", file=sys.stderr)
+                return 1
+    sys.stdout.buffer.write(aJson({
+        "votacionID": votacion.votacionID,
+        "titulo": votacion.titulo,
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "preguntas": resultados,
+    }) + b"\n")
+    return 0
+
+
+async def ejecutar(args) -> int:
+    try:
+        return await escrutar(args.votacion, args.metodo)
+    finally:
+        await cerrarEngines()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--votacion", type=int, required=True)
+    parser.add_argument("--metodo", choices=sorted(METODOS), help="Por defecto, según tipoVotacionId")
+    args = parser.parse_args()
+    return asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Exporta las boletas anonimizadas de una votación cerrada a un archivo NDJSON.
+
+Escribe los bloques a medida que llegan del cursor del servidor
+(shared/exportacion.py), sin cargar la votación en memoria. Con `--continuar`,
+verifica los bloques de un archivo existente, descarta lo que siga al último
+bloque válido y retoma la exportación desde la clave de ese bloque (sin releer
+los votos anteriores) con el mismo formato y tamaño de bloque. Con `--verificar`, solo revisa los hashes del archivo.
+
+Uso:
+    python scripts/exportar_votacion.py --votacion 1 --salida votacion1.ndjson [--formato columnas] [--bloque 10000]
+    python scripts/exportar_votacion.py --votacion 1 --salida votacion1.ndjson --continuar
+    python scripts/exportar_votacion.py --salida votacion1.ndjson --verificar
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.database import get_read_session, cerrarEngines  # noqa: E402
+from shared.exportacion import FORMATOS, FILAS, TAMANO_BLOQUE, exportarBoletas, verificarExportacion, votacionCerrada  # noqa: E402
+from shared.resultados import consultaVotacion  # noqa: E402
+
+
+def verificar(ruta: str):
+    with open(ruta, "rb") as archivo:
+        return verificarExportacion(archivo)
+
+
+async def exportar(args) -> int:
+    formato, bloque, desde, clave, modo = args.formato, args.bloque, 0, None, "wb"
+    if args.continuar and os.path.exists(args.salida):
+        cabecera, desde, posicion, completa, clave = verificar(args.salida)
+        if completa:
+            print(f"{args.salida} ya está completa ({desde} votos)")
+            return 0
+        if cabecera is not None:
+            if cabecera["votacion_id"] != args.votacion:
+                print(f"{args.salida} es de la votación {cabecera['votacion_id']}", file=sys.stderr)
+                return 1
+            formato, bloque, modo = cabecera["formato"], cabecera["bloque"], "r+b"
+            print(f"Retomando desde el voto {desde} ({posicion} bytes verificados)")
+    async with get_read_session() as lectura:
+        votacion = (await lectura.execute(consultaVotacion, {"votacionID": args.votacion})).first()
+        if votacion is None:
+            print(f"No existe la votación {args.votacion}", file=sys.stderr)
+            return 1
+        if not votacionCerrada(votacion):
+            print(f"La votación {args.votacion} sigue abierta", file=sys.stderr)
+            return 1
+        with open(args.salida, modo) as salida:
+            if modo == "r+b":
+                salida.seek(posicion)
+                salida.truncate()
+            async for fragmento in exportarBoletas(lectura, votacion, formato, desde, bloque,
+                                                   conEncabezado=modo == "wb", clave=clave):
+                salida.write(fragmento)
+    _, filas, _, completa, _ = verificar(args.salida)
+    print(f"Votación {args.votacion}: {filas} votos exportados en {args.salida}")
+    return 0 if completa else 1
+
+
+async def ejecutar(args) -> int:
+    if args.verificar:
+        cabecera, filas, posicion, completa, _ = verificar(args.salida)
+        estado = "completa" if completa else f"incompleta, retomar con --continuar desde el voto {filas}"
+        print(f"{args.salida}: {filas} votos en bloques válidos ({posicion} bytes), {estado}")
+        return 0 if completa else 1
+    if args.votacion is None:
+        print("Falta --votacion", file=sys.stderr)
+        return 2
+    try:
+        return await exportar(args)
+    finally:
+        await cerrarEngines()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--votacion", type=int, help="Votación a exportar")
+    parser.add_argument("--salida", required=True, help="Archivo NDJSON de salida")
+    parser.add_argument("--formato", choices=FORMATOS, default=FILAS, help="filas (un voto por línea) o columnas (un bloque por línea)")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE, help="Votos por bloque con hash")
+    parser.add_argument("--continuar", action="store_true", help="Retoma un archivo cortado desde su último bloque válido")
+    parser.add_argument("--verificar", action="store_true", help="Solo verifica los hashes del archivo")
+    args = parser.parse_args()
+    return asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
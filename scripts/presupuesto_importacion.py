@@ -0,0 +1,79 @@
+"""
+Presupuesto de importación en frío por función.
+
+Importa cada función y cada endpoint montado en `api` (cada carpeta con
+`__init__.py` en la raíz, salvo `shared`) en un intérprete nuevo con
+`python -X importtime` y falla (código de salida 1) si el tiempo acumulado
+de alguna supera el presupuesto. Pensado para correr en CI antes de publicar.
+
+Uso:
+    python scripts/presupuesto_importacion.py [--presupuesto-ms 1200] [--top 5]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINEA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def funciones() -> list:
+    return sorted(
+        nombre for nombre in os.listdir(RAIZ)
+        if nombre != "shared" and os.path.isfile(os.path.join(RAIZ, nombre, "__init__.py"))
+    )
+
+
+def medirImportacion(modulo: str) -> tuple:
+    """Retorna (ms acumulados del módulo, [(ms propios, paquete), ...])."""
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ,
+        capture_output=True,
+        text=True,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{proceso.stderr[-2000:]}")
+    total = None
+    propios = []
+    for linea in proceso.stderr.splitlines():
+        coincidencia = LINEA.match(linea)
+        if not coincidencia:
+            continue
+        propio, acumulado, _, paquete = coincidencia.groups()
+        propios.append((int(propio) / 1000, paquete))
+        if paquete == modulo:
+            total = int(acumulado) / 1000
+    return total or 0.0, sorted(propios, reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--presupuesto-ms",
+        type=float,
+        default=float(os.getenv("PRESUPUESTO_IMPORTACION_MS", "1200")),
+    )
+    parser.add_argument("--top", type=int, default=5, help="Importaciones más caras a mostrar")
+    args = parser.parse_args()
+
+    excedidas = []
+    for funcion in funciones():
+        total, propios = medirImportacion(funcion)
+        estado = "OK " if total <= args.presupuesto_ms else "EXC"
+        print(f"{estado} {funcion:<28} {total:8.1f} ms")
+        if total > args.presupuesto_ms:
+            excedidas.append(funcion)
+            for ms, paquete in propios[:args.top]:
+                print(f"      {ms:8.1f} ms  {paquete}")
+
+    if excedidas:
+        print(f"\nSuperan {args.presupuesto_ms:.0f} ms: {', '.join(excedidas)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
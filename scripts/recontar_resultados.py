@@ -0,0 +1,88 @@
+"""
+Recuento completo de resultados desde pv_respuestaParticipante.
+
+Los contadores de `pv_conteoRespuesta` (ver shared/resultados.py) se mantienen
+voto a voto. Este job recuenta cada votación desde los votos, con los
+multiplicadores de `pv_pesoRespuesta`, y lista las respuestas cuyo contador no
+coincide. Termina con código 1 si encontró diferencias, para usarlo como
+verificación al cierre de una votación.
+
+Con `--corregir` reemplaza los contadores de las votaciones con diferencias
+por el recuento, en la misma transacción en que recuenta. Un voto que se
+confirma entre el recuento y el reemplazo se perdería del contador, así que
+solo corrige votaciones cerradas salvo con `--forzar` (por ejemplo, la primera
+vez, después de crear la tabla con scripts/sql/resultados_votacion.sql).
+
+Uso:
+    python scripts/recontar_resultados.py [--votacion 1] [--corregir [--forzar]]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from shared.database import get_session, unidadDeTrabajo, cerrarEngines  # noqa: E402
+from shared.models import Votacion  # noqa: E402
+from shared.resultados import recontar, reconstruir  # noqa: E402
+
+
+async def listarVotaciones(votacionID=None):
+    consulta = select(Votacion.votacionID, Votacion.titulo, Votacion.fechaFin).order_by(Votacion.votacionID)
+    if votacionID is not None:
+        consulta = consulta.where(Votacion.votacionID == votacionID)
+    async with get_session() as session:
+        return (await session.execute(consulta)).all()
+
+
+async def verificar(votacion, corregir: bool, forzar: bool) -> bool:
+    """True si los contadores de la votación quedaron iguales al recuento."""
+    async with unidadDeTrabajo() as session:
+        recuento, diferencias = await recontar(session, votacion.votacionID)
+        votos = sum(v for v, _ in recuento.values())
+        if not diferencias:
+            print(f"Votación {votacion.votacionID} ({votacion.titulo}): {votos} votos, contadores correctos")
+            return True
+        print(f"Votación {votacion.votacionID} ({votacion.titulo}): {len(diferencias)} respuestas con diferencias")
+        for d in diferencias:
+            print(f"  pregunta {d.preguntaID} respuesta {d.respuestaID}: "
+                  f"votos {d.votos} (contador {d.votosContador}), "
+                  f"ponderados {d.votosPonderados} (contador {d.votosPonderadosContador})")
+        if not corregir:
+            return False
+        if votacion.fechaFin >= datetime.now(timezone.utc).replace(tzinfo=None) and not forzar:
+            print("  La votación sigue abierta: no se corrige sin --forzar")
+            return False
+        await reconstruir(session, votacion.votacionID, recuento)
+        print("  Contadores reconstruidos desde los votos")
+        return True
+
+
+async def ejecutar(args) -> int:
+    try:
+        votaciones = await listarVotaciones(args.votacion)
+        if not votaciones:
+            print("No hay votaciones para recontar")
+            return 1
+        correctas = True
+        for votacion in votaciones:
+            correctas &= await verificar(votacion, args.corregir, args.forzar)
+    finally:
+        await cerrarEngines()
+    return 0 if correctas else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--votacion", type=int, help="Solo esta votación (por defecto, todas)")
+    parser.add_argument("--corregir", action="store_true", help="Reemplazar los contadores con diferencias")
+    parser.add_argument("--forzar", action="store_true", help="Corregir también votaciones abiertas")
+    args = parser.parse_args()
+    return asyncio.run(ejecutar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+-- Huella del usuario en pv_respuestaParticipante (ver shared/huella.py).
+-- listarVotos busca los votos de un usuario por huellaUsuario en un solo
+-- índice, ya ordenado por (fechaRespuesta, respuestaParticipanteID), en vez de
+-- enumerar una huellaVotante por pregunta del catálogo.
+-- Ejecutar después de huella_votante.sql y antes de desplegar la versión de
+-- votar/listarVotos que la usa; luego completar los votos existentes con
+-- scripts/backfill_huella_votante.py --usuarios.
+
+IF COL_LENGTH('dbo.pv_respuestaParticipante', 'huellaUsuario') IS NULL
+BEGIN
+    ALTER TABLE dbo.pv_respuestaParticipante ADD huellaUsuario VARBINARY(32) NULL;
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_pv_respuestaParticipante_huellaUsuario'
+      AND object_id = OBJECT_ID('dbo.pv_respuestaParticipante')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_pv_respuestaParticipante_huellaUsuario
+        ON dbo.pv_respuestaParticipante (huellaUsuario, fechaRespuesta, respuestaParticipanteID)
+        WHERE huellaUsuario IS NOT NULL;
+END
+GO
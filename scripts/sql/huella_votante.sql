@@ -0,0 +1,37 @@
+-- Huella del votante en pv_respuestaParticipante (ver shared/huella.py).
+-- Ejecutar antes de desplegar la versión de votar/listarVotos que la usa y
+-- luego completar los votos existentes con scripts/backfill_huella_votante.py.
+
+IF COL_LENGTH('dbo.pv_respuestaParticipante', 'huellaVotante') IS NULL
+BEGIN
+    ALTER TABLE dbo.pv_respuestaParticipante ADD huellaVotante VARBINARY(32) NULL;
+END
+GO
+
+-- Único solo entre filas con huella: los votos anteriores quedan en NULL
+-- hasta el backfill. También sirve para las búsquedas de listarVotos.
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'UX_pv_respuestaParticipante_huellaVotante'
+      AND object_id = OBJECT_ID('dbo.pv_respuestaParticipante')
+)
+BEGIN
+    CREATE UNIQUE NONCLUSTERED INDEX UX_pv_respuestaParticipante_huellaVotante
+        ON dbo.pv_respuestaParticipante (huellaVotante)
+        WHERE huellaVotante IS NOT NULL;
+END
+GO
+
+-- Filas pendientes del backfill
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_pv_respuestaParticipante_sinHuella'
+      AND object_id = OBJECT_ID('dbo.pv_respuestaParticipante')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_pv_respuestaParticipante_sinHuella
+        ON dbo.pv_respuestaParticipante (preguntaID)
+        INCLUDE (ncRespuesta)
+        WHERE huellaVotante IS NULL;
+END
+GO
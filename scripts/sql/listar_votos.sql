@@ -0,0 +1,25 @@
+-- Paginación de listarVotos por (fechaRespuesta, respuestaParticipanteID).
+-- Agrega fechaRespuesta al índice de huellaVotante (creado en
+-- huella_votante.sql): las búsquedas por huella ordenan y aplican el cursor
+-- desde el índice y solo leen la fila completa de los votos de la página.
+-- La clave del índice clustered (respuestaParticipanteID) ya viaja en él.
+
+IF EXISTS (
+    SELECT 1 FROM sys.indexes i
+    WHERE i.name = 'UX_pv_respuestaParticipante_huellaVotante'
+      AND i.object_id = OBJECT_ID('dbo.pv_respuestaParticipante')
+      AND NOT EXISTS (
+          SELECT 1 FROM sys.index_columns ic
+          JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+          WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id
+            AND ic.is_included_column = 1 AND c.name = 'fechaRespuesta'
+      )
+)
+BEGIN
+    CREATE UNIQUE NONCLUSTERED INDEX UX_pv_respuestaParticipante_huellaVotante
+        ON dbo.pv_respuestaParticipante (huellaVotante)
+        INCLUDE (fechaRespuesta)
+        WHERE huellaVotante IS NOT NULL
+        WITH (DROP_EXISTING = ON);
+END
+GO
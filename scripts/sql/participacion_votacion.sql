@@ -0,0 +1,40 @@
+-- Participación por minuto/hora (ver shared/participacion.py) y pertenencia de
+-- usuarios a segmentos. Ejecutar antes de desplegar la versión de
+-- votar/votarBoleta que actualiza la participación.
+
+IF OBJECT_ID('dbo.pv_usuarioSegmento', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.pv_usuarioSegmento (
+        usuarioID INT NOT NULL,
+        segmentoID INT NOT NULL,
+        CONSTRAINT PK_pv_usuarioSegmento PRIMARY KEY CLUSTERED (usuarioID, segmentoID),
+        CONSTRAINT FK_pv_usuarioSegmento_usuario FOREIGN KEY (usuarioID) REFERENCES dbo.pv_usuarios (userid),
+        CONSTRAINT FK_pv_usuarioSegmento_segmento FOREIGN KEY (segmentoID) REFERENCES dbo.pv_segmento (segmentoID)
+    );
+END
+GO
+
+-- minutos = 1 mientras la votación está abierta, 60 después de compactar.
+-- segmentoID = 0 es el total de la votación.
+IF OBJECT_ID('dbo.pv_participacion', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.pv_participacion (
+        votacionID INT NOT NULL,
+        segmentoID INT NOT NULL,
+        inicio DATETIME NOT NULL,
+        minutos INT NOT NULL,
+        cubeta INT NOT NULL,
+        votos BIGINT NOT NULL,
+        CONSTRAINT PK_pv_participacion PRIMARY KEY CLUSTERED (votacionID, segmentoID, inicio, minutos, cubeta),
+        CONSTRAINT FK_pv_participacion_votacion FOREIGN KEY (votacionID) REFERENCES dbo.pv_votacion (votacionID)
+    );
+
+    -- Votos existentes, solo en el total: los votos no guardan quién votó,
+    -- así que no se pueden repartir por segmento
+    INSERT INTO dbo.pv_participacion (votacionID, segmentoID, inicio, minutos, cubeta, votos)
+    SELECT vp.votacionID, 0, DATEADD(minute, DATEDIFF(minute, 0, rp.fechaRespuesta), 0), 1, 0, COUNT_BIG(*)
+    FROM dbo.pv_respuestaParticipante rp
+    JOIN dbo.pv_votacionPregunta vp ON vp.preguntaID = rp.preguntaID
+    GROUP BY vp.votacionID, DATEADD(minute, DATEDIFF(minute, 0, rp.fechaRespuesta), 0);
+END
+GO
@@ -0,0 +1,15 @@
+-- Restricciones de IP y horario por votación (ver shared/restricciones.py).
+-- Ejecutar antes de desplegar la versión de configurarVotacion/votar que las usa.
+-- Ambas columnas guardan una lista JSON; NULL significa sin restricción.
+
+IF COL_LENGTH('dbo.pv_votacion', 'restriccionesIP') IS NULL
+BEGIN
+    ALTER TABLE dbo.pv_votacion ADD restriccionesIP NVARCHAR(MAX) NULL;
+END
+GO
+
+IF COL_LENGTH('dbo.pv_votacion', 'horariosPermitidos') IS NULL
+BEGIN
+    ALTER TABLE dbo.pv_votacion ADD horariosPermitidos NVARCHAR(MAX) NULL;
+END
+GO
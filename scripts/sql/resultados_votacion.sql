@@ -0,0 +1,28 @@
+-- Contadores incrementales de resultados (ver shared/resultados.py).
+-- Ejecutar antes de desplegar la versión de votar/votarBoleta que los actualiza.
+-- Cada respuesta se reparte en varias cubetas (ResultadosCubetas) para que los
+-- votos concurrentes no esperen el bloqueo de una sola fila.
+
+IF OBJECT_ID('dbo.pv_conteoRespuesta', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.pv_conteoRespuesta (
+        preguntaID INT NOT NULL,
+        respuestaID INT NOT NULL,
+        cubeta INT NOT NULL,
+        votos BIGINT NOT NULL,
+        votosPonderados DECIMAL(18, 2) NOT NULL,
+        ultimaModificacion DATETIME NOT NULL,
+        CONSTRAINT PK_pv_conteoRespuesta PRIMARY KEY CLUSTERED (preguntaID, respuestaID, cubeta),
+        CONSTRAINT FK_pv_conteoRespuesta_pregunta FOREIGN KEY (preguntaID) REFERENCES dbo.pv_preguntas (preguntaID),
+        CONSTRAINT FK_pv_conteoRespuesta_respuesta FOREIGN KEY (respuestaID) REFERENCES dbo.pv_respuestas (respuestaID)
+    );
+
+    -- Votos existentes en la cubeta 0. Los que lleguen entre este script y el
+    -- despliegue se corrigen con: python scripts/recontar_resultados.py --corregir --forzar
+    INSERT INTO dbo.pv_conteoRespuesta (preguntaID, respuestaID, cubeta, votos, votosPonderados, ultimaModificacion)
+    SELECT rp.preguntaID, rp.respuestaID, 0, COUNT_BIG(*), SUM(COALESCE(pr.multiplicador, 1)), GETDATE()
+    FROM dbo.pv_respuestaParticipante rp
+    LEFT JOIN dbo.pv_pesoRespuesta pr ON pr.pesoID = rp.pesoRespuesta
+    GROUP BY rp.preguntaID, rp.respuestaID;
+END
+GO
@@ -0,0 +1,28 @@
+-- Índice para verificar recibos de voto por tokenGUID (ver shared/recibos.py).
+-- Cubre la consulta de verificarRecibo sin ir a la tabla base.
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'UX_pv_respuestaParticipante_tokenGUID'
+      AND object_id = OBJECT_ID('dbo.pv_respuestaParticipante')
+)
+BEGIN
+    CREATE UNIQUE NONCLUSTERED INDEX UX_pv_respuestaParticipante_tokenGUID
+        ON dbo.pv_respuestaParticipante (tokenGUID)
+        INCLUDE (preguntaID, fechaRespuesta);
+END
+GO
+
+-- Refresco del filtro de recibos por ventana de fechaRespuesta: relee los
+-- votos recientes aunque su ID haya quedado por debajo del último leído.
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_pv_respuestaParticipante_fechaRespuesta'
+      AND object_id = OBJECT_ID('dbo.pv_respuestaParticipante')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_pv_respuestaParticipante_fechaRespuesta
+        ON dbo.pv_respuestaParticipante (fechaRespuesta)
+        INCLUDE (tokenGUID);
+END
+GO
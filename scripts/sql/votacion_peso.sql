@@ -0,0 +1,21 @@
+-- Peso de los votos por votación y segmento (ver shared/boletas.py). votar y
+-- votarBoleta ya no aceptan el pesoRespuesta que manda el cliente: lo resuelven
+-- con esta tabla. Ejecutar antes de desplegar esa versión.
+--
+-- segmentoID = 0 es el peso de todos los votantes de la votación; una fila
+-- con un segmento de pv_usuarioSegmento lo reemplaza para sus miembros (si el
+-- votante está en varios, el de mayor multiplicador). Sin filas, cada voto
+-- lleva el pesoID de la setting VotosPesoPorDefecto.
+
+IF OBJECT_ID('dbo.pv_votacionPeso', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.pv_votacionPeso (
+        votacionID INT NOT NULL,
+        segmentoID INT NOT NULL,
+        pesoID INT NOT NULL,
+        CONSTRAINT PK_pv_votacionPeso PRIMARY KEY CLUSTERED (votacionID, segmentoID),
+        CONSTRAINT FK_pv_votacionPeso_votacion FOREIGN KEY (votacionID) REFERENCES dbo.pv_votacion (votacionID),
+        CONSTRAINT FK_pv_votacionPeso_peso FOREIGN KEY (pesoID) REFERENCES dbo.pv_pesoRespuesta (pesoID)
+    );
+END
+GO
@@ -0,0 +1,135 @@
+import logging
+from datetime import datetime, timezone
+import azure.functions as func
+from pydantic import ValidationError
+from sqlalchemy import select, bindparam
+from shared.codec import leerDto, aJson
+from shared.dtos import SesionVotacionDTO
+from shared.database import unidadDeTrabajo, get_read_session
+from shared.auth import autenticarVotante, CredencialesInvalidas, ErrorVerificacion
+from shared.sesion import emitirToken
+from shared.statements import etiquetar
+from shared.models import Votacion
+
+consultaVigenciaVotacion = etiquetar(
+    select(Votacion.fechaInicio, Votacion.fechaFin)
+    .where(Votacion.votacionID == bindparam("votacionID")),
+    "sesionVotacion.vigencia",
+)
+
+
+def _utc(fecha: datetime) -> datetime:
+    return fecha.replace(tzinfo=timezone.utc) if fecha.tzinfo is None else fecha
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        dto = leerDto(req, SesionVotacionDTO)
+    except ValidationError as e:
+        return func.HttpResponse(e.json(), status_code=400, mimetype="application/json")
+
+    try:
+        async with unidadDeTrabajo() as session:
+            async with get_read_session(session) as lectura:
+                vigencia = (await lectura.execute(consultaVigenciaVotacion, {"votacionID": dto.votacionID})).first()
+            ahora = datetime.now(timezone.utc)
+            if vigencia is None or not (_utc(vigencia.fechaInicio) <= ahora <= _utc(vigencia.fechaFin)):
+                return func.HttpResponse(
+                    aJson({"error": "Votación inexistente o fuera de fechas", "codigo": "VOTACION_CERRADA"}),
+                    status_code=404,
+                    mimetype="application/json"
+                )
+            try:
+                usuario, llave = await autenticarVotante(
+                    session,
+                    dto.cedulaUsuario,
+                    dto.contrasenia.get_secret_value(),
+                    dto.prueba_vida,
+                    "sesionVotacion/endpoint",
+                )
+            except CredencialesInvalidas as e:
+                return func.HttpResponse(
+                    aJson({"error": str(e), "codigo": e.codigo} if e.codigo else {"error": str(e)}),
+                    status_code=401,
+                    mimetype="application/json"
+                )
+            except ErrorVerificacion:
+                return func.HttpResponse(
+                    aJson({"error": "Error interno en verificación", "codigo": "INTERNAL_ERROR"}),
+                    status_code=500,
+                    mimetype="application/json"
+                )
+        # El token se emite solo después del commit de la prueba de vida
+        token, expira = emitirToken(usuario.userid, dto.votacionID, llave, _utc(vigencia.fechaFin).timestamp())
+        return func.HttpResponse(
+            aJson({
+                "tokenSesion": token,
+                "votacionID": dto.votacionID,
+                "expira": datetime.fromtimestamp(expira, timezone.utc),
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"Error al emitir sesión de votación: {str(e)}", exc_info=True)
+        return func.HttpResponse(
+            aJson({"error": "Error interno del servidor"}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: sesionVotacion
+
+Ruta: POST /api/sesionVotacion
+
+Descripción general:
+    Autentica una sola vez al votante (cédula, contraseña y prueba de vida) y
+    emite un token de sesión de vida corta para una votación. Con ese token,
+    `votar` no repite la búsqueda de usuario y llave, el DECRYPTBYPASSPHRASE de
+    la contraseña ni el registro de prueba de vida en cada pregunta.
+
+Parámetros de entrada (JSON en el body, `SesionVotacionDTO`):
+    - votacionID (int): Votación para la que vale el token
+    - cedulaUsuario (str)
+    - contrasenia (SecretStr)
+    - prueba_vida (str)
+
+Lógica interna:
+    1. Verifica que la votación exista y esté dentro de sus fechas.
+    2. Autentica con `shared.auth.autenticarVotante` y registra la prueba de
+       vida en `pv_documento`.
+    3. Confirma la transacción y emite el token (`shared.sesion.emitirToken`):
+       AES-256-GCM con `SesionVotacionSecreto`, con el usuario, la votación, la
+       llave descifrada del usuario y el vencimiento. Vence a los
+       `SesionVotacionTtlSegundos` (5 minutos por defecto, 15 como máximo) o
+       al cierre de la votación.
+
+Respuesta exitosa (200):
+{
+    "tokenSesion": "oQ3x...",
+    "votacionID": 1,
+    "expira": "2025-06-20T15:30:00+00:00"
+}
+
+Uso en votar:
+    POST /api/votar
+    Authorization: Bearer oQ3x...
+    {"preguntaID": 1, "respuestaID": 1, "valor": "...", "pesoRespuesta": 2}
+
+Flujo de respuesta:
+    - 200 OK: token emitido
+    - 400 Bad Request: error de validación
+    - 401 Unauthorized: credenciales inválidas
+    - 404 Not Found: votación inexistente o cerrada
+    - 500 Internal Server Error: error inesperado
+
+Consideraciones:
+    - El token no se puede revocar antes de vencer; el voto duplicado lo sigue
+      impidiendo el índice único de `huellaVotante`.
+    - Transportar siempre por HTTPS: quien tenga el token puede votar en nombre
+      del usuario en esa votación hasta que venza. El token lleva la llave
+      descifrada del usuario; filtrar el token la filtra durante el TTL.
+"""
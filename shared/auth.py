@@ -0,0 +1,187 @@
+import hashlib
+import logging
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+from sqlalchemy import select, desc, and_, bindparam, text
+from .bitacora import insertarLog
+from .instrumentacion import marcarEtapa
+from .models import Usuario, LlaveUsuario, Documento
+from .statements import etiquetar
+
+
+class UsuarioAuth(NamedTuple):
+    userid: int
+    nombre: str
+    primerApellido: str
+    segundoApellido: Optional[str]
+
+
+class LlaveAuth(NamedTuple):
+    llaveUsuarioID: int
+    llaveCifrada: bytes
+
+
+consultaCredenciales = etiquetar(
+    select(
+        Usuario.userid,
+        Usuario.nombre,
+        Usuario.primerApellido,
+        Usuario.segundoApellido,
+        LlaveUsuario.llaveUsuarioID,
+        LlaveUsuario.llaveCifrada,
+    )
+    .select_from(Usuario)
+    .outerjoin(
+        LlaveUsuario,
+        and_(
+            LlaveUsuario.usuarioID == Usuario.userid,
+            LlaveUsuario.esActiva == True,
+        ),
+    )
+    .where(Usuario.identificacion == bindparam("cedula"))
+    .order_by(desc(LlaveUsuario.ultimaModificacion))
+    .limit(1),
+    "credenciales",
+)
+
+
+async def obtenerCredenciales(session, cedula: str) -> Tuple[Optional[UsuarioAuth], Optional[LlaveAuth]]:
+    """
+    Busca al usuario por cédula junto con su llave activa más reciente en una
+    sola consulta (LEFT JOIN + TOP 1), trayendo solo las columnas necesarias.
+
+    Retorna:
+    - (None, None) si la cédula no existe.
+    - (usuario, None) si el usuario existe pero no tiene llave activa.
+    - (usuario, llave) en caso contrario.
+    """
+    try:
+        result = await session.execute(
+            consultaCredenciales, {"cedula": cedula}
+        )
+        row = result.first()
+    except Exception as e:
+        logging.error(f"Error en consulta de credenciales: {str(e)}", exc_info=True)
+        raise ValueError("Error al consultar usuario en la base de datos")
+
+    if row is None:
+        return None, None
+    usuario = UsuarioAuth(row.userid, row.nombre, row.primerApellido, row.segundoApellido)
+    if row.llaveUsuarioID is None:
+        logging.warning(f"No hay llave activa para usuario ID: {usuario.userid}")
+        return usuario, None
+    return usuario, LlaveAuth(row.llaveUsuarioID, row.llaveCifrada)
+
+
+class CredencialesInvalidas(ValueError):
+    def __init__(self, codigo: str = None):
+        super().__init__("Credenciales inválidas")
+        self.codigo = codigo
+
+
+class ErrorVerificacion(Exception):
+    """Falla técnica al verificar la contraseña (no es un rechazo de credenciales)."""
+
+
+consultaDescifrarLlave = etiquetar(
+    text("""
+        SELECT DECRYPTBYPASSPHRASE(:pass, :llave) AS llave_desencriptada
+        WHERE :llave IS NOT NULL
+    """),
+    "descifrarLlave",
+)
+
+
+async def verificarCredenciales(session, cedula: str, contrasenia: str, computador: str) -> Tuple[UsuarioAuth, str]:
+    """
+    Busca las credenciales y descifra la llave activa con la contraseña
+    (DECRYPTBYPASSPHRASE). Solo lee: puede correr en una sesión de lectura
+    aparte, en paralelo con otras consultas. Retorna (usuario, llave
+    descifrada). Lanza `CredencialesInvalidas` si la cédula no existe, no tiene
+    llave activa o la contraseña no abre la llave, y `ErrorVerificacion` ante fallas técnicas del
+    descifrado.
+    """
+    usuario, llaveActiva = await obtenerCredenciales(session, cedula)
+    marcarEtapa("auth")
+    if not usuario:
+        await insertarLog(
+            descripcion="Usuario no encontrado",
+            computador=computador,
+            usuario=cedula,
+            tipologid=1,
+            origenlogid=2,
+            logseveridadid=2
+        )
+        raise CredencialesInvalidas()
+    if not llaveActiva:
+        # Mismo rechazo que una contraseña incorrecta: no revela si la cédula tiene llave
+        await insertarLog(
+            descripcion="Usuario sin llave activa",
+            computador=computador,
+            usuario=str(usuario.userid),
+            refId1=usuario.userid,
+            tipologid=2,
+            origenlogid=2,
+            logseveridadid=3
+        )
+        raise CredencialesInvalidas("AUTH_FAILED")
+    try:
+        resultado = await session.execute(
+            consultaDescifrarLlave,
+            {"pass": contrasenia, "llave": llaveActiva.llaveCifrada},
+        )
+        llave = resultado.scalar_one_or_none()
+    except Exception as e:
+        await insertarLog(
+            descripcion="Error técnico en verificación de contraseña",
+            computador=computador,
+            usuario=str(usuario.userid),
+            refId1=usuario.userid,
+            trace=str(e),
+            tipologid=2,
+            origenlogid=2,
+            logseveridadid=5
+        )
+        logging.error(f"Error técnico al verificar contraseña: {str(e)}", exc_info=True)
+        raise ErrorVerificacion(str(e))
+    if llave is None:
+        await insertarLog(
+            descripcion="Fallo de descifrado de llave",
+            computador=computador,
+            usuario=str(usuario.userid),
+            refId1=usuario.userid,
+            tipologid=2,
+            origenlogid=2,
+            logseveridadid=3
+        )
+        logging.warning(f"Fallo de descifrado para usuario ID: {usuario.userid}")
+        raise CredencialesInvalidas("AUTH_FAILED")
+    marcarEtapa("llave")
+    logging.info(f"Autenticación exitosa para usuario ID: {usuario.userid}")
+    return usuario, llave.decode("utf-8")
+
+
+def registrarPruebaVida(session, usuarioID: int, pruebaVida: str):
+    """Agrega el `Documento` de prueba de vida a la sesión (sin flush ni commit)."""
+    ahora = datetime.now()
+    session.add(Documento(
+        nombre=f"{usuarioID}-PruebaVida",
+        fechaCreacion=ahora,
+        tipoDocumentoID=10,
+        estadoDocumentoID=4,
+        ultimaModificacion=ahora,
+        esActual=True,
+        idLegal=f"{usuarioID}_PV",
+        checksum=hashlib.sha256(pruebaVida.encode()).digest(),
+    ))
+    marcarEtapa("documento")
+
+
+async def autenticarVotante(session, cedula: str, contrasenia: str, pruebaVida: str, computador: str) -> Tuple[UsuarioAuth, str]:
+    """
+    Autentica al votante (`verificarCredenciales`) y registra su prueba de vida
+    en la sesión (sin commit). Retorna (usuario, llave descifrada).
+    """
+    usuario, llave = await verificarCredenciales(session, cedula, contrasenia, computador)
+    registrarPruebaVida(session, usuario.userid, pruebaVida)
+    return usuario, llave
@@ -0,0 +1,201 @@
+"""
+Bitácora asíncrona de `pv_logs`.
+
+`insertarLog` ya no abre una transacción por llamada: encola la fila en memoria
+y una tarea de fondo la escribe junto con las demás en un solo INSERT
+multi-fila, cuando se junta `BitacoraTamanoLote` o pasa
+`BitacoraIntervaloSegundos`. Si la cola se llena o la base de datos falla, las
+filas se anexan a un archivo local (JSON por línea) que se reprocesa en el
+siguiente arranque de la tarea. Si la tarea muere, se reinicia sobre la misma
+cola; si cambió el loop, lo encolado pasa al archivo antes de crear la cola
+nueva, así que reiniciar la tarea nunca descarta filas.
+"""
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from sqlalchemy import insert
+from .database import get_session, leerConfig
+from .models import Log
+
+TAMANO_LOTE = leerConfig("BitacoraTamanoLote", 100, int)
+INTERVALO_SEGUNDOS = leerConfig("BitacoraIntervaloSegundos", 1.0, float)
+MAX_COLA = leerConfig("BitacoraMaxCola", 10000, int)
+ARCHIVO_RESPALDO = leerConfig(
+    "BitacoraArchivoRespaldo",
+    os.path.join(tempfile.gettempdir(), "pv_logs_respaldo.jsonl"),
+)
+
+
+def generarChecksum(valor: str) -> bytes:
+    return hashlib.sha256(valor.encode()).digest()
+
+
+def _aLinea(fila: dict) -> str:
+    return json.dumps({
+        **fila,
+        "timestamp": fila["timestamp"].isoformat(),
+        "checksum": fila["checksum"].hex(),
+    })
+
+
+def _deLinea(linea: str) -> dict:
+    fila = json.loads(linea)
+    fila["timestamp"] = datetime.fromisoformat(fila["timestamp"])
+    fila["checksum"] = bytes.fromhex(fila["checksum"])
+    return fila
+
+
+def _respaldar(filas: list):
+    try:
+        with open(ARCHIVO_RESPALDO, "a", encoding="utf-8") as archivo:
+            for fila in filas:
+                archivo.write(_aLinea(fila) + "\n")
+    except Exception as e:
+        logging.error(f"No se pudieron respaldar {len(filas)} logs: {str(e)}")
+
+
+class Bitacora:
+    def __init__(self):
+        self._cola = None
+        self._tarea = None
+        self._loop = None
+
+    def _asegurarTarea(self):
+        if self._tarea is not None and not self._tarea.done():
+            return
+        if self._tarea is not None and not self._tarea.cancelled() and self._tarea.exception() is not None:
+            logging.error(f"La tarea de la bitácora terminó con error, se reinicia: {str(self._tarea.exception())}")
+        loop = asyncio.get_running_loop()
+        if self._cola is None or self._loop is not loop:
+            # Una cola queda ligada al loop donde se usó: en un loop nuevo se crea
+            # otra y lo que quedó en la anterior va al respaldo, que la tarea nueva
+            # escribe antes que nada. En el mismo loop se reutiliza la cola.
+            filas = self._pendientes()
+            if filas:
+                _respaldar(filas)
+            self._cola = asyncio.Queue(maxsize=MAX_COLA)
+            self._loop = loop
+        self._tarea = loop.create_task(self._procesar())
+
+    def registrar(self, fila: dict):
+        self._asegurarTarea()
+        try:
+            self._cola.put_nowait(fila)
+        except asyncio.QueueFull:
+            _respaldar([fila])
+
+    async def _escribir(self, filas: list):
+        try:
+            async with get_session() as session:
+                await session.execute(insert(Log), filas)
+                await session.commit()
+        except Exception as e:
+            logging.error(f"Error escribiendo {len(filas)} logs, se respaldan en archivo: {str(e)}")
+            _respaldar(filas)
+
+    async def _reprocesarRespaldo(self):
+        if not os.path.exists(ARCHIVO_RESPALDO):
+            return
+        pendiente = ARCHIVO_RESPALDO + ".procesando"
+        try:
+            os.replace(ARCHIVO_RESPALDO, pendiente)
+            with open(pendiente, encoding="utf-8") as archivo:
+                filas = [_deLinea(linea) for linea in archivo if linea.strip()]
+            os.remove(pendiente)
+        except Exception as e:
+            logging.error(f"No se pudo leer el respaldo de logs: {str(e)}")
+            return
+        for inicio in range(0, len(filas), TAMANO_LOTE):
+            await self._escribir(filas[inicio:inicio + TAMANO_LOTE])
+
+    async def _procesar(self):
+        await self._reprocesarRespaldo()
+        loop = asyncio.get_running_loop()
+        activa = True
+        while activa:
+            fila = await self._cola.get()
+            if fila is None:
+                break
+            filas = [fila]
+            limite = loop.time() + INTERVALO_SEGUNDOS
+            try:
+                while len(filas) < TAMANO_LOTE:
+                    restante = limite - loop.time()
+                    if restante <= 0:
+                        break
+                    try:
+                        fila = await asyncio.wait_for(self._cola.get(), restante)
+                    except asyncio.TimeoutError:
+                        break
+                    if fila is None:
+                        activa = False
+                        break
+                    filas.append(fila)
+            except asyncio.CancelledError:
+                # El loop se cierra sin vaciar(): el lote que se estaba juntando va al respaldo
+                _respaldar(filas)
+                raise
+            await self._escribir(filas)
+
+    def _pendientes(self) -> list:
+        filas = []
+        while self._cola is not None and not self._cola.empty():
+            fila = self._cola.get_nowait()
+            if fila is not None:
+                filas.append(fila)
+        return filas
+
+    async def vaciar(self):
+        """Escribe todo lo encolado y detiene la tarea de fondo (apagado ordenado)."""
+        if self._tarea is not None and not self._tarea.done():
+            await self._cola.put(None)
+            await self._tarea
+        self._tarea = None
+        filas = self._pendientes()
+        for inicio in range(0, len(filas), TAMANO_LOTE):
+            await self._escribir(filas[inicio:inicio + TAMANO_LOTE])
+
+    def respaldarPendientes(self):
+        """Al salir el proceso sin loop disponible, las filas encoladas van al archivo."""
+        filas = self._pendientes()
+        if filas:
+            _respaldar(filas)
+
+
+bitacora = Bitacora()
+atexit.register(bitacora.respaldarPendientes)
+
+
+async def insertarLog(
+    descripcion: str,
+    computador: str,
+    usuario: str,
+    trace: str = "API/ENDPOINT/listarVotos",
+    refId1: int = None,
+    refId2: int = None,
+    valor1: str = None,
+    valor2: str = None,
+    checksum: str = "2025API/20END25OINT06/listarVotos26",
+    tipologid: int = 1,
+    origenlogid: int = 1,
+    logseveridadid: int = 1):
+    bitacora.registrar({
+        "descripcion": descripcion,
+        "timestamp": datetime.utcnow(),
+        "computador": computador,
+        "usuario": usuario,
+        "trace": trace,
+        "refId1": refId1,
+        "refId2": refId2,
+        "valor1": valor1,
+        "valor2": valor2,
+        "checksum": generarChecksum(checksum),
+        "tipologid": tipologid,
+        "origenlogid": origenlogid,
+        "logseveridadid": logseveridadid,
+    })
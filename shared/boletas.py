@@ -0,0 +1,303 @@
+"""
+Cache en proceso de boletas (votación + preguntas + respuestas permitidas).
+
+Cada voto necesitaba la votación de su pregunta: un join de cuatro tablas que
+armaba un dict con fechas en ISO para volver a parsearlas en `validarFechas`.
+`obtenerBoleta` devuelve una `Boleta` compacta, con fechas como `datetime` y
+los `respuestaID` permitidos por pregunta, las restricciones de IP y horario
+ya compiladas, los segmentos a los que se dirige la votación y el peso de los
+votos por segmento (`pv_votacionPeso`), guardada en un LRU con TTL por `preguntaID`
+(`BoletasCacheTtlSegundos`, `BoletasCacheMax`).
+
+El peso de un voto lo resuelve el servidor con `Boleta.pesoDelVotante`: el
+`pesoRespuesta` que manda el cliente solo se acepta si coincide.
+
+Ante un miss, una sola petición por pregunta lee la boleta; las demás esperan
+esa lectura (single-flight) en vez de consultar la base de datos cada una.
+
+La boleta se busca por `preguntaID`, así que una pregunta debe pertenecer a
+una sola votación (`configurarVotacion` rechaza asociar una pregunta que ya
+está en otra). Si los datos tienen una pregunta en varias votaciones,
+`cargarBoleta` lanza `PreguntaEnVariasVotaciones` en vez de elegir una: con
+otra votación se aplicarían otras fechas, restricciones y pesos.
+
+`configurarVotacion` invalida las preguntas que toca al confirmar. La
+invalidación es local al worker; en los demás la entrada vence por TTL.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import contains_eager
+from .database import ReplicaNoDisponible, get_read_session, leerConfig
+from .models import PesoRespuesta, Pregunta, PropuestaVotacion, SegmentoPropuesta, Votacion, VotacionPeso, VotacionPregunta
+from .statements import etiquetar
+from .restricciones import Restricciones, SIN_RESTRICCIONES, restriccionesDeVotacion
+
+TTL_SEGUNDOS = leerConfig("BoletasCacheTtlSegundos", 30.0, float)
+MAX_ENTRADAS = leerConfig("BoletasCacheMax", 1024, int)
+# pesoID de los votos de una votación sin filas en pv_votacionPeso
+PESO_POR_DEFECTO = leerConfig("VotosPesoPorDefecto", 1, int)
+
+# segmentoID de pv_votacionPeso que aplica a todos los votantes
+TODOS = 0
+
+
+class PreguntaBoleta(NamedTuple):
+    preguntaID: int
+    maxSelecciones: int
+    respuestaIDs: FrozenSet[int]
+
+
+class Boleta(NamedTuple):
+    votacionID: int
+    fechaInicio: datetime
+    fechaFin: datetime
+    estadoVotacionId: int
+    privada: bool
+    esSecreta: bool
+    preguntas: Dict[int, PreguntaBoleta]
+    restricciones: Restricciones = SIN_RESTRICCIONES
+    segmentos: FrozenSet[int] = frozenset()
+    # (segmentoID, pesoID) de pv_votacionPeso, de mayor a menor multiplicador
+    pesos: Tuple[Tuple[int, int], ...] = ()
+
+    @property
+    def segmentosConPeso(self) -> FrozenSet[int]:
+        return frozenset(segmentoID for segmentoID, _ in self.pesos if segmentoID != TODOS)
+
+    def pesoDelVotante(self, segmentos: Iterable[int]) -> int:
+        """
+        pesoID de un votante que pertenece a `segmentos`: el de su segmento de
+        mayor multiplicador, si no el de todos los votantes (segmentoID 0) y si
+        no `VotosPesoPorDefecto`.
+        """
+        segmentos = set(segmentos)
+        general = PESO_POR_DEFECTO
+        for segmentoID, pesoID in self.pesos:
+            if segmentoID == TODOS:
+                general = pesoID
+            elif segmentoID in segmentos:
+                return pesoID
+        return general
+
+    def abierta(self, ahora: datetime = None) -> bool:
+        ahora = ahora or datetime.now(timezone.utc)
+        return self.fechaInicio <= ahora <= self.fechaFin
+
+    def admiteRespuesta(self, preguntaID: int, respuestaID: int) -> bool:
+        pregunta = self.preguntas.get(preguntaID)
+        return pregunta is not None and respuestaID in pregunta.respuestaIDs
+
+    def validarSelecciones(self, selecciones: Iterable[Tuple[int, int]]) -> List[dict]:
+        """
+        Valida una boleta completa de pares (preguntaID, respuestaID): toda
+        pregunta de la votación contestada, respuestas permitidas y sin repetir,
+        y a lo sumo `maxSelecciones` por pregunta. Retorna los errores encontrados.
+        """
+        errores = []
+        porPregunta: Dict[int, List[int]] = {}
+        for preguntaID, respuestaID in selecciones:
+            porPregunta.setdefault(preguntaID, []).append(respuestaID)
+        for preguntaID, respuestaIDs in porPregunta.items():
+            pregunta = self.preguntas.get(preguntaID)
+            if pregunta is None:
+                errores.append({"preguntaID": preguntaID, "error": "La pregunta no pertenece a la votación"})
+                continue
+            if len(set(respuestaIDs)) != len(respuestaIDs):
+                errores.append({"preguntaID": preguntaID, "error": "Respuesta repetida"})
+            if len(respuestaIDs) > max(pregunta.maxSelecciones, 1):
+                errores.append({"preguntaID": preguntaID, "error": f"Se admiten a lo sumo {pregunta.maxSelecciones} respuestas"})
+            for respuestaID in respuestaIDs:
+                if respuestaID not in pregunta.respuestaIDs:
+                    errores.append({"preguntaID": preguntaID, "respuestaID": respuestaID, "error": "La respuesta no pertenece a la pregunta"})
+        for preguntaID in self.preguntas.keys() - porPregunta.keys():
+            errores.append({"preguntaID": preguntaID, "error": "Pregunta sin contestar"})
+        return errores
+
+
+class PreguntaEnVariasVotaciones(ValueError):
+    def __init__(self, preguntaID: int, votacionIDs: List[int]):
+        super().__init__(f"La pregunta {preguntaID} pertenece a varias votaciones: {votacionIDs}")
+        self.preguntaID = preguntaID
+        self.votacionIDs = votacionIDs
+
+
+def _utc(fecha: datetime) -> datetime:
+    # Las fechas de pv_votacion se guardan sin zona y se interpretan como UTC
+    return fecha.replace(tzinfo=timezone.utc) if fecha.tzinfo is None else fecha
+
+
+consultaBoleta = etiquetar(
+    select(Votacion)
+    .join(Votacion.preguntas)
+    .join(VotacionPregunta.pregunta)
+    .outerjoin(Pregunta.respuestas)
+    # Todas las preguntas de la votación, no solo la pedida: `votarBoleta` valida la boleta completa
+    .where(Votacion.votacionID.in_(
+        select(VotacionPregunta.votacionID).where(VotacionPregunta.preguntaID == bindparam("preguntaID"))
+    ))
+    .options(
+        contains_eager(Votacion.preguntas).contains_eager(VotacionPregunta.pregunta).contains_eager(Pregunta.respuestas)
+    )
+    .order_by(Votacion.votacionID),
+    "votacionPorPregunta",
+)
+
+
+consultaSegmentosDirigidos = etiquetar(
+    select(SegmentoPropuesta.segementoID)
+    .join(PropuestaVotacion, PropuestaVotacion.propuestaID == SegmentoPropuesta.propuestaID)
+    .where(
+        PropuestaVotacion.votacionID == bindparam("votacionID"),
+        PropuestaVotacion.deleted == False,  # noqa: E712
+        SegmentoPropuesta.deleted == False,  # noqa: E712
+    ),
+    "segmentosPorVotacion",
+)
+
+
+consultaPesosVotacion = etiquetar(
+    select(VotacionPeso.segmentoID, VotacionPeso.pesoID)
+    .join(PesoRespuesta, PesoRespuesta.pesoID == VotacionPeso.pesoID)
+    .where(VotacionPeso.votacionID == bindparam("votacionID"))
+    # Un peso sin multiplicador cuenta 1, igual que en shared/resultados.py
+    .order_by(func.coalesce(PesoRespuesta.multiplicador, 1).desc(), VotacionPeso.pesoID),
+    "pesosPorVotacion",
+)
+
+
+async def cargarBoleta(session, preguntaID: int) -> Optional[Boleta]:
+    """
+    Boleta de la votación de `preguntaID`, o None si la pregunta no está en
+    ninguna. Lanza `PreguntaEnVariasVotaciones` si está en más de una.
+    """
+    votaciones = (await session.execute(consultaBoleta, {"preguntaID": preguntaID})).unique().scalars().all()
+    if not votaciones:
+        return None
+    if len(votaciones) > 1:
+        votacionIDs = [votacion.votacionID for votacion in votaciones]
+        logging.error(f"La pregunta {preguntaID} pertenece a las votaciones {votacionIDs}; no se admiten votos")
+        raise PreguntaEnVariasVotaciones(preguntaID, votacionIDs)
+    votacion = votaciones[0]
+    preguntas = {}
+    for asociacion in votacion.preguntas:
+        pregunta = asociacion.pregunta
+        preguntas[pregunta.preguntaID] = PreguntaBoleta(
+            preguntaID=pregunta.preguntaID,
+            maxSelecciones=pregunta.maxSelecciones,
+            respuestaIDs=frozenset(r.respuestaID for r in pregunta.respuestas if not r.deleted),
+        )
+    segmentos = (await session.execute(consultaSegmentosDirigidos, {"votacionID": votacion.votacionID})).scalars().all()
+    pesos = (await session.execute(consultaPesosVotacion, {"votacionID": votacion.votacionID})).all()
+    return Boleta(
+        votacionID=votacion.votacionID,
+        fechaInicio=_utc(votacion.fechaInicio),
+        fechaFin=_utc(votacion.fechaFin),
+        estadoVotacionId=votacion.estadoVotacionId,
+        privada=votacion.privada,
+        esSecreta=votacion.esSecreta,
+        preguntas=preguntas,
+        restricciones=restriccionesDeVotacion(votacion),
+        segmentos=frozenset(segmentos),
+        pesos=tuple((fila.segmentoID, fila.pesoID) for fila in pesos),
+    )
+
+
+class CacheBoletas:
+    def __init__(self, ttl: float = TTL_SEGUNDOS, maximo: int = MAX_ENTRADAS):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._entradas = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, preguntaID: int) -> Optional[Boleta]:
+        entrada = self._entradas.get(preguntaID)
+        if entrada is None or entrada[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entradas.move_to_end(preguntaID)
+        self.hits += 1
+        return entrada[1]
+
+    def contiene(self, preguntaID: int) -> bool:
+        """Si hay una entrada vigente, sin contarla como hit ni miss."""
+        entrada = self._entradas.get(preguntaID)
+        return entrada is not None and entrada[0] >= time.monotonic()
+
+    def guardar(self, preguntaID: int, boleta: Boleta):
+        self._entradas[preguntaID] = (time.monotonic() + self.ttl, boleta)
+        self._entradas.move_to_end(preguntaID)
+        while len(self._entradas) > self.maximo:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, preguntaIDs: Iterable[int] = None):
+        if preguntaIDs is None:
+            self._entradas.clear()
+            return
+        for preguntaID in preguntaIDs:
+            self._entradas.pop(preguntaID, None)
+
+    def estadisticas(self) -> dict:
+        return {"entradas": len(self._entradas), "hits": self.hits, "misses": self.misses}
+
+
+cacheBoletas = CacheBoletas()
+
+
+# Lecturas de boleta en curso por preguntaID: ante un miss concurrente (por
+# ejemplo, al vencer el TTL) solo una petición consulta la base de datos y las
+# demás esperan su resultado sin tomar una conexión
+_enCurso: Dict[int, asyncio.Future] = {}
+
+
+async def obtenerBoleta(session, preguntaID: int, respaldo: bool = True) -> Optional[Boleta]:
+    """
+    Boleta de la votación que contiene `preguntaID`, desde el cache o leída en
+    la réplica (con `session` como respaldo; con None, en otra conexión del
+    pool, o con `respaldo=False` solo en la réplica, ver `get_read_session`).
+    Las preguntas inexistentes no se guardan en el cache.
+    """
+    while True:
+        boleta = cacheBoletas.obtener(preguntaID)
+        if boleta is not None:
+            return boleta
+        enCurso = _enCurso.get(preguntaID)
+        if enCurso is None:
+            break
+        try:
+            return await asyncio.shield(enCurso)
+        except asyncio.CancelledError:
+            if not enCurso.cancelled():
+                raise
+            # Se canceló la petición que leía la boleta, no esta: se vuelve a intentar
+        except ReplicaNoDisponible:
+            if not respaldo:
+                raise
+            # La otra petición leía solo en la réplica; esta puede caer al primario
+
+    futuro = asyncio.get_running_loop().create_future()
+    # El resultado solo se consume si hubo peticiones esperando
+    futuro.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _enCurso[preguntaID] = futuro
+    try:
+        async with get_read_session(session, respaldo) as lectura:
+            boleta = await cargarBoleta(lectura, preguntaID)
+        if boleta is not None:
+            cacheBoletas.guardar(preguntaID, boleta)
+            for otra in boleta.preguntas.keys() - {preguntaID}:
+                cacheBoletas.guardar(otra, boleta)
+        futuro.set_result(boleta)
+        return boleta
+    except asyncio.CancelledError:
+        futuro.cancel()
+        raise
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        del _enCurso[preguntaID]
@@ -0,0 +1,112 @@
+"""
+Cifrado de `ncRespuesta`.
+
+`ncRespuesta` guarda el id del votante cifrado con la llave del usuario. Antes
+se cifraba con `ENCRYPTBYPASSPHRASE` en SQL Server, lo que costaba una ida a la
+base de datos por voto y otra por cada fila a descifrar.
+
+Los proveedores implementan `cifrar(llave, texto)` / `descifrar(llave, datos)`
+y se identifican con un byte de versión al inicio del valor guardado. El
+proveedor por defecto es AES-256-GCM en proceso (`cryptography`), con la llave
+derivada por HKDF de la llave del usuario:
+
+    0xA1 | nonce (12 bytes) | texto cifrado + tag (16 bytes)
+
+Los valores que no empiezan con un byte de versión registrado son del formato
+de SQL Server (cabecera 0x01000000 o 0x02000000) y se comparan con
+`DECRYPTBYPASSPHRASE` dentro de la consulta (`perteneceA` retorna None para
+ellos; ver `shared/huella.py`). Con
+`CifradoNcRespuesta=sqlserver` los votos nuevos se siguen cifrando en SQL
+Server.
+"""
+import os
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import text
+from .database import leerConfig
+
+PROVEEDOR = leerConfig("CifradoNcRespuesta", "aesgcm").strip().lower()
+
+
+class ProveedorCifrado(ABC):
+    # Primer byte de los valores que genera; debe ser único entre los proveedores
+    version: int
+
+    @abstractmethod
+    def cifrar(self, llave: str, texto: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def descifrar(self, llave: str, datos: bytes) -> Optional[bytes]:
+        """Retorna el texto plano, o None si la llave no corresponde."""
+
+
+@lru_cache(maxsize=1024)
+def _derivarLlave(llave: str, contexto: bytes) -> bytes:
+    # `cryptography` se importa en el primer uso para no alargar el arranque en frío
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=contexto).derive(llave.encode("utf-8"))
+
+
+class CifradoAesGcm(ProveedorCifrado):
+    """AES-256-GCM; `contexto` separa las llaves derivadas de distintos usos de la misma llave."""
+    version = 0xA1
+
+    def __init__(self, contexto: bytes = b"pv_respuestaParticipante.ncRespuesta"):
+        self.contexto = contexto
+
+    def cifrar(self, llave: str, texto: bytes) -> bytes:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        cabecera = bytes([self.version])
+        nonce = os.urandom(12)
+        return cabecera + nonce + AESGCM(_derivarLlave(llave, self.contexto)).encrypt(nonce, texto, cabecera)
+
+    def descifrar(self, llave: str, datos: bytes) -> Optional[bytes]:
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        if len(datos) < 29:
+            return None
+        try:
+            return AESGCM(_derivarLlave(llave, self.contexto)).decrypt(datos[1:13], datos[13:], datos[:1])
+        except InvalidTag:
+            return None
+
+
+PROVEEDORES = {proveedor.version: proveedor for proveedor in (CifradoAesGcm(),)}
+_porNombre = {"aesgcm": CifradoAesGcm.version}
+
+
+def proveedorDe(datos: bytes) -> Optional[ProveedorCifrado]:
+    """Proveedor en proceso que generó `datos`, o None si es cifrado de SQL Server."""
+    return PROVEEDORES.get(datos[0]) if datos else None
+
+
+def cifradoLocal() -> bool:
+    return PROVEEDOR in _porNombre
+
+
+def cifrarUsuario(llave: str, usuarioID: int) -> bytes:
+    proveedor = PROVEEDORES[_porNombre[PROVEEDOR]]
+    return proveedor.cifrar(llave, str(usuarioID).encode("utf-8"))
+
+
+def perteneceA(llave: str, usuarioID: int, datos: bytes) -> Optional[bool]:
+    """
+    Indica si `datos` es el id `usuarioID` cifrado con `llave`. Retorna None si
+    `datos` está en formato de SQL Server y hay que descifrarlo en la base de datos.
+    """
+    proveedor = proveedorDe(datos)
+    if proveedor is None:
+        return None
+    return proveedor.descifrar(llave, datos) == str(usuarioID).encode("utf-8")
+
+
+async def cifrarUsuarioSql(session, llave: str, usuarioID: int) -> bytes:
+    result = await session.execute(
+        text("SELECT ENCRYPTBYPASSPHRASE(:pass, :texto)"),
+        {"pass": llave, "texto": str(usuarioID)},
+    )
+    return result.scalar_one()
+
@@ -0,0 +1,54 @@
+"""
+Codec de peticiones y respuestas.
+
+- `leerDto(req, Dto)` valida los bytes del body directamente contra el DTO con
+  `model_validate_json` (un solo paso en pydantic-core, sin armar un dict
+  intermedio con `req.get_json()`). Los bodies de más de `MaxCuerpoBytes` se
+  rechazan antes de parsear.
+- `aJson(obj)` serializa con orjson y soporta `bytes` (base64), `datetime` y
+  `Decimal` (como texto, para no perder precisión al pasar por float).
+  Reemplaza los `json_bytes_serializer` copiados en cada endpoint.
+"""
+import base64
+import orjson
+from decimal import Decimal
+from typing import Type, TypeVar
+import azure.functions as func
+from pydantic import BaseModel
+from .database import leerConfig
+
+MAX_CUERPO_BYTES = leerConfig("MaxCuerpoBytes", 64 * 1024, int)
+
+Dto = TypeVar("Dto", bound=BaseModel)
+
+
+class CuerpoDemasiadoGrande(ValueError):
+    def __init__(self, tamano: int):
+        super().__init__(f"El cuerpo de la solicitud ({tamano} bytes) supera el máximo de {MAX_CUERPO_BYTES} bytes")
+        self.tamano = tamano
+
+
+def _porDefecto(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("utf-8")
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def leerDto(req: func.HttpRequest, dto: Type[Dto]) -> Dto:
+    """Valida el body crudo contra `dto`. Lanza `ValidationError` o `CuerpoDemasiadoGrande`."""
+    cuerpo = req.get_body() or b"{}"
+    if len(cuerpo) > MAX_CUERPO_BYTES:
+        raise CuerpoDemasiadoGrande(len(cuerpo))
+    return dto.model_validate_json(cuerpo)
+
+
+def aJson(obj) -> bytes:
+    return orjson.dumps(obj, default=_porDefecto, option=orjson.OPT_NON_STR_KEYS)
+
+
+def respuestaJson(obj, status_code: int = 200) -> func.HttpResponse:
+    return func.HttpResponse(aJson(obj), status_code=status_code, mimetype="application/json")
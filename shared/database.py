@@ -1,6 +1,12 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc, text
+import logging
 import urllib.parse
+import asyncio
+import os
+import time
 from contextlib import asynccontextmanager
 
 server = "localhost"
@@ -15,20 +21,385 @@ rawConnString = (
     f"Trusted_Connection=yes;"
     f"TrustServerCertificate=yes;"
 )
-encodedConnString = urllib.parse.quote_plus(rawConnString)
 
-asyncUrl = f"mssql+aioodbc:///?odbc_connect={encodedConnString}"
 
-engine = create_async_engine(asyncUrl, echo=False, future=True)
+def leerConfig(nombre: str, defecto, tipo=str):
+    """
+    Lee un valor de los app settings (variables de entorno en Azure Functions,
+    `Values` de local.settings.json en local) y lo convierte al tipo pedido.
+    """
+    valor = os.getenv(nombre)
+    if valor is None or valor.strip() == "":
+        return defecto
+    if tipo is bool:
+        return valor.strip().lower() in ("1", "true", "yes", "si", "sí")
+    return tipo(valor)
 
-SessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
-    engine,
-    expire_on_commit=False,
+
+def construirUrl(connString: str) -> str:
+    """
+    Acepta una URL de SQLAlchemy (`sqlite+aiosqlite:///votos.db`) o una cadena
+    ODBC de SQL Server, que se envuelve en `mssql+aioodbc`.
+    """
+    if "://" in connString:
+        return connString
+    return f"mssql+aioodbc:///?odbc_connect={urllib.parse.quote_plus(connString)}"
+
+
+POOL_SIZE = leerConfig("SqlPoolSize", 20, int)
+POOL_MAX_OVERFLOW = leerConfig("SqlPoolMaxOverflow", 10, int)
+POOL_TIMEOUT = leerConfig("SqlPoolTimeout", 30.0, float)
+POOL_PRE_PING = leerConfig("SqlPoolPrePing", True, bool)
+POOL_RECYCLE = leerConfig("SqlPoolRecycle", 1800, int)
+POOL_PRECALENTAR = leerConfig("SqlPoolPrecalentar", POOL_SIZE, int)
+FAST_EXECUTEMANY = leerConfig("SqlFastExecutemany", True, bool)
+
+asyncUrl = construirUrl(leerConfig("SqlConnectionString", rawConnString))
+
+# Réplica de solo lectura (opcional). Sin `SqlReadConnectionString` todas las
+# lecturas van al primario.
+REPLICA_CONN_STRING = leerConfig("SqlReadConnectionString", None)
+REPLICA_MAX_RETRASO = leerConfig("SqlReplicaMaxRetrasoSegundos", 30.0, float)
+REPLICA_INTERVALO_CHEQUEO = leerConfig("SqlReplicaChequeoSegundos", 10.0, float)
+REPLICA_CONSULTA_RETRASO = leerConfig(
+    "SqlReplicaConsultaRetraso",
+    "SELECT DATEDIFF(SECOND, last_commit_time, SYSUTCDATETIME()) "
+    "FROM sys.dm_hadr_database_replica_states WHERE is_local = 1 AND database_id = DB_ID()"
+    if REPLICA_CONN_STRING and "://" not in REPLICA_CONN_STRING else None,
 )
 
+
+class EstadisticasPool:
+    """Contadores acumulados de adquisición de conexiones del pool."""
+
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.adquisiciones = 0
+        self.timeouts = 0
+        self.esperaTotal = 0.0
+        self.esperaMaxima = 0.0
+
+    def registrarEspera(self, segundos: float):
+        self.adquisiciones += 1
+        self.esperaTotal += segundos
+        if segundos > self.esperaMaxima:
+            self.esperaMaxima = segundos
+
+
+estadisticasPool = EstadisticasPool()
+
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """
+    Pool asíncrono que mide cuánto tarda cada checkout en obtener una conexión
+    (espera en la cola más la apertura de conexiones de overflow).
+    """
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            estadisticasPool.timeouts += 1
+            raise
+        finally:
+            estadisticasPool.registrarEspera(time.perf_counter() - inicio)
+
+
+def _crearEngine(url: str, **kwargs):
+    if FAST_EXECUTEMANY and url.startswith("mssql+"):
+        # executemany de pyodbc en un solo envío de parámetros (inserts en lote)
+        kwargs.setdefault("fast_executemany", True)
+    return create_async_engine(
+        url,
+        echo=False,
+        future=True,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_pre_ping=POOL_PRE_PING,
+        pool_recycle=POOL_RECYCLE,
+        **kwargs,
+    )
+
+
+# Los engines se crean en el primer uso y no al importar el módulo: crear el
+# engine carga el dialecto mssql y aioodbc/pyodbc, lo que alarga el arranque en
+# frío de cualquier función que solo importe los modelos.
+_engine = None
+_engineLectura = None
+_hooksEngine = []
+
+SessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(expire_on_commit=False)
+SessionLecturaLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(expire_on_commit=False)
+
+
+def alCrearEngine(hook):
+    """
+    Registra `hook(engine)` para que se ejecute sobre cada engine (primario y
+    réplica) al crearlo; si ya existen, se aplica de inmediato.
+    """
+    _hooksEngine.append(hook)
+    for existente in (_engine, _engineLectura):
+        if existente is not None:
+            hook(existente)
+    return hook
+
+
+def obtenerEngine():
+    global _engine, _engineLectura
+    if _engine is None:
+        _engine = _crearEngine(asyncUrl, poolclass=PoolMedido)
+        SessionLocal.configure(bind=_engine)
+        if REPLICA_CONN_STRING:
+            _engineLectura = _crearEngine(construirUrl(REPLICA_CONN_STRING))
+            SessionLecturaLocal.configure(bind=_engineLectura)
+        for hook in _hooksEngine:
+            hook(_engine)
+            if _engineLectura is not None:
+                hook(_engineLectura)
+    return _engine
+
+
+def obtenerEngineLectura():
+    obtenerEngine()
+    return _engineLectura
+
+
+def __getattr__(nombre):
+    if nombre == "engine":
+        return obtenerEngine()
+    if nombre == "engineLectura":
+        return obtenerEngineLectura()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+class EstadoReplica:
+    def __init__(self):
+        self.disponible = True
+        self.retrasoSegundos = None
+        self.ultimoChequeo = float("-inf")
+
+    def marcarCaida(self):
+        self.disponible = False
+        self.ultimoChequeo = time.monotonic()
+
+
+estadoReplica = EstadoReplica()
+
 Base = declarative_base()
 
 @asynccontextmanager
 async def get_session():
+    obtenerEngine()
     async with SessionLocal() as session:
         yield session
+
+
+@asynccontextmanager
+async def unidadDeTrabajo():
+    """
+    Sesión con una sola transacción para toda la petición. El autoflush está
+    apagado, así que lo agregado con `session.add` sale en un único flush y un
+    único commit al cerrar el bloque; cualquier excepción hace rollback de todo.
+    Usar `await session.flush()` explícito solo cuando se necesite un ID generado.
+    """
+    obtenerEngine()
+    async with SessionLocal(autoflush=False) as session:
+        async with session.begin():
+            yield session
+
+
+async def replicaDisponible() -> bool:
+    """
+    Indica si la réplica puede atender lecturas: responde y su retraso no supera
+    `SqlReplicaMaxRetrasoSegundos`. El resultado se reutiliza durante
+    `SqlReplicaChequeoSegundos` para no consultar la réplica en cada petición.
+    """
+    engineLectura = obtenerEngineLectura()
+    if engineLectura is None:
+        return False
+    ahora = time.monotonic()
+    if ahora - estadoReplica.ultimoChequeo < REPLICA_INTERVALO_CHEQUEO:
+        return estadoReplica.disponible
+    estadoReplica.ultimoChequeo = ahora
+    try:
+        async with engineLectura.connect() as conn:
+            if REPLICA_CONSULTA_RETRASO:
+                retraso = (await conn.execute(text(REPLICA_CONSULTA_RETRASO))).scalar()
+            else:
+                await conn.execute(text("SELECT 1"))
+                retraso = 0
+        estadoReplica.retrasoSegundos = retraso
+        estadoReplica.disponible = retraso is None or retraso <= REPLICA_MAX_RETRASO
+        if not estadoReplica.disponible:
+            logging.warning(f"Réplica con {retraso}s de retraso, lecturas al primario")
+    except Exception as e:
+        logging.warning(f"Réplica no disponible, lecturas al primario: {str(e)}")
+        estadoReplica.disponible = False
+    return estadoReplica.disponible
+
+
+class ReplicaNoDisponible(Exception):
+    """La réplica no puede atender la lectura y se pidió no caer al primario."""
+
+
+class SesionLectura:
+    """
+    Sesión de la réplica que reintenta en el primario. Si una consulta falla
+    por la conexión (la réplica cayó a mitad de la petición), marca la réplica
+    como caída y repite la consulta en el primario: `primaria` si se pasó, o
+    una sesión propia que se abre solo en ese caso. Las consultas siguientes
+    del bloque van directo al primario. Solo para lecturas: repetir una
+    consulta no tiene efectos. Con `respaldo=False` y sin `primaria`, en vez
+    de abrir una conexión del primario lanza `ReplicaNoDisponible`.
+    """
+
+    def __init__(self, replica: AsyncSession, primaria: AsyncSession = None, respaldo: bool = True):
+        self._replica = replica
+        self._primaria = primaria
+        self._respaldo = respaldo
+        self._propia = None
+        self._enPrimario = False
+
+    async def _sesionPrimaria(self) -> AsyncSession:
+        if self._primaria is None:
+            self._propia = get_session()
+            self._primaria = await self._propia.__aenter__()
+        self._enPrimario = True
+        return self._primaria
+
+    async def _ejecutar(self, metodo: str, *args, **kwargs):
+        if not self._enPrimario:
+            try:
+                return await getattr(self._replica, metodo)(*args, **kwargs)
+            except (exc.OperationalError, exc.InterfaceError) as e:
+                estadoReplica.marcarCaida()
+                if self._primaria is None and not self._respaldo:
+                    raise ReplicaNoDisponible(str(e)) from e
+                logging.warning(f"Réplica no disponible a mitad de la petición, se reintenta en el primario: {str(e)}")
+        return await getattr(await self._sesionPrimaria(), metodo)(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        return await self._ejecutar("execute", *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await self._ejecutar("scalar", *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await self._ejecutar("scalars", *args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        # Solo se reintenta si falla al abrir el cursor; un corte a mitad de la lectura se propaga
+        return await self._ejecutar("stream", *args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._primaria if self._enPrimario else self._replica, nombre)
+
+    async def cerrar(self, *excepcion):
+        if self._propia is not None:
+            await self._propia.__aexit__(*excepcion)
+
+
+@asynccontextmanager
+async def get_read_session(primaria: AsyncSession = None, respaldo: bool = True):
+    """
+    Sesión para consultas de solo lectura. Usa la réplica cuando está
+    configurada y sana; si no, cae al primario. Si se pasa `primaria`, el
+    fallback reutiliza esa sesión en vez de tomar otra conexión del pool. Si
+    la réplica falla a mitad del bloque, la consulta se repite en el primario
+    (ver `SesionLectura`).
+
+    Con `respaldo=False` (y sin `primaria`) nunca toma una conexión del pool
+    del primario: si la réplica no está disponible lanza `ReplicaNoDisponible`.
+    Sirve para leer en paralelo mientras la petición ya tiene una conexión del
+    primario, sin que muchas peticiones retengan una y esperen otra del mismo
+    pool.
+
+    No usar para credenciales ni llaves: una réplica atrasada rechazaría una
+    llave recién rotada o un usuario recién creado.
+    """
+    if not await replicaDisponible():
+        if primaria is not None:
+            yield primaria
+        elif not respaldo:
+            raise ReplicaNoDisponible("Réplica no configurada o no disponible")
+        else:
+            async with get_session() as session:
+                yield session
+        return
+    async with SessionLecturaLocal() as replica:
+        lectura = SesionLectura(replica, primaria, respaldo)
+        try:
+            yield lectura
+        except BaseException as e:
+            await lectura.cerrar(type(e), e, e.__traceback__)
+            raise
+        await lectura.cerrar(None, None, None)
+
+
+async def precalentarPool(cantidad: int = None) -> int:
+    """
+    Abre `cantidad` conexiones en paralelo y las devuelve al pool para que las
+    primeras peticiones no paguen el costo del login ODBC. Retorna cuántas
+    conexiones quedaron abiertas.
+    """
+    cantidad = min(POOL_PRECALENTAR if cantidad is None else cantidad, POOL_SIZE)
+    if cantidad <= 0:
+        return 0
+    conexiones = await asyncio.gather(
+        *(obtenerEngine().connect() for _ in range(cantidad)),
+        return_exceptions=True,
+    )
+    abiertas = 0
+    for conexion in conexiones:
+        if isinstance(conexion, BaseException):
+            continue
+        abiertas += 1
+        await conexion.close()
+    return abiertas
+
+
+def estadoPool() -> dict:
+    pool = obtenerEngine().sync_engine.pool
+    adquisiciones = estadisticasPool.adquisiciones
+    return {
+        "tamano": pool.size(),
+        "enUso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "maxOverflow": POOL_MAX_OVERFLOW,
+        "timeoutSegundos": POOL_TIMEOUT,
+        "adquisiciones": adquisiciones,
+        "timeouts": estadisticasPool.timeouts,
+        "esperaPromedioMs": round(estadisticasPool.esperaTotal / adquisiciones * 1000, 3) if adquisiciones else 0.0,
+        "esperaMaximaMs": round(estadisticasPool.esperaMaxima * 1000, 3),
+        "replica": estadoPoolReplica(),
+    }
+
+
+def estadoPoolReplica() -> dict | None:
+    engineLectura = obtenerEngineLectura()
+    if engineLectura is None:
+        return None
+    pool = engineLectura.sync_engine.pool
+    return {
+        "disponible": estadoReplica.disponible,
+        "retrasoSegundos": estadoReplica.retrasoSegundos,
+        "tamano": pool.size(),
+        "enUso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+
+
+async def cerrarEngines():
+    """Cierra las conexiones del pool primario y de la réplica (apagado del worker)."""
+    global _engine, _engineLectura
+    for existente in (_engine, _engineLectura):
+        if existente is not None:
+            await existente.dispose()
+    _engine = None
+    _engineLectura = None
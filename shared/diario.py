@@ -0,0 +1,415 @@
+"""
+Ingesta diferida de votos (write-behind).
+
+Con `VotosEscrituraDiferida=true`, `votar` no inserta el voto en su propia
+transacción: lo anexa a un diario local (JSON por línea, con fsync) y responde
+con el `tokenGUID` en cuanto la línea está en disco. Una tarea de fondo inserta
+los votos en lotes de `VotosTamanoLote` con un solo executemany (con
+`fast_executemany` en SQL Server) y anota en el diario qué tokens quedaron
+confirmados. Los contadores de resultados (`shared.resultados`) y la participación
+por minuto (`shared.participacion`) se suman en la misma transacción de cada
+lote.
+
+Las escrituras concurrentes al diario se agrupan: una sola tarea escribe todas
+las líneas pendientes y hace un único fsync por grupo.
+
+Al arrancar, el diario anterior se renombra y los votos sin confirmar se
+vuelven a insertar. Si el proceso cayó entre el commit de un lote y su marca de
+confirmación, esos votos chocan con el índice único de `huellaVotante`, su
+`tokenGUID` ya está en la base de datos y se dan por insertados, así que
+reprocesar es idempotente.
+
+Votos que no llegan a la base de datos (ya se respondió `202` al votante):
+
+- Un lote que falla `VotosMaxReintentos` veces por algo distinto de un
+  duplicado pasa entero al archivo de cuarentena (`VotosArchivoCuarentena`).
+- Un voto que choca con otro voto del mismo votante (misma huella, otro
+  `tokenGUID`) se descarta y también va a la cuarentena, con motivo
+  `duplicado`.
+- Un voto que la base de datos rechaza por otra restricción (una respuesta
+  borrada, un peso inexistente, un CHECK) va a la cuarentena con motivo
+  `rechazado` y el error: no se confunde con un voto repetido.
+
+En ambos casos se registra un error en `pv_logs` por voto (con su
+`tokenGUID`), se cuenta en `estadisticas()` y el recibo no se agrega al índice
+de `verificarRecibo`. Las líneas de la cuarentena tienen el formato del diario
+más un campo `motivo`: para reintentarlas, se renombra el archivo a
+`<VotosArchivoDiario>.reproceso` y se reinicia el worker.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+from typing import Tuple
+from sqlalchemy import bindparam, exists, insert, select
+from sqlalchemy.exc import IntegrityError
+from .bitacora import insertarLog
+from .database import get_session, leerConfig
+from .models import RespuestaParticipante
+from .statements import etiquetar
+from .recibos import indiceRecibos
+from .resultados import sumarVotos
+from .participacion import sumarParticipacion
+
+HABILITADO = leerConfig("VotosEscrituraDiferida", False, bool)
+TAMANO_LOTE = leerConfig("VotosTamanoLote", 500, int)
+INTERVALO_SEGUNDOS = leerConfig("VotosIntervaloSegundos", 0.2, float)
+ARCHIVO_DIARIO = leerConfig(
+    "VotosArchivoDiario",
+    os.path.join(tempfile.gettempdir(), "pv_votos_diario.jsonl"),
+)
+ARCHIVO_CUARENTENA = leerConfig("VotosArchivoCuarentena", None)
+MAX_REINTENTOS = leerConfig("VotosMaxReintentos", 5, int)
+
+# Errores de SQL Server por clave duplicada en un índice único (2601) o en una
+# restricción UNIQUE/PRIMARY KEY (2627)
+ERRORES_CLAVE_DUPLICADA = ("2601", "2627")
+
+consultaHuellaRegistrada = etiquetar(
+    select(exists().where(RespuestaParticipante.huellaVotante == bindparam("huella"))),
+    "diario.huellaRegistrada",
+)
+
+consultaTokenRegistrado = etiquetar(
+    select(exists().where(RespuestaParticipante.tokenGUID == bindparam("token"))),
+    "diario.tokenRegistrado",
+)
+
+_BINARIOS = ("checksum", "ncRespuesta", "huellaVotante", "huellaUsuario")
+
+
+_NO_COLUMNAS = ("participacion", "motivo")
+
+
+def _paraInsertar(fila: dict) -> dict:
+    # `participacion` (votación y segmentos del votante) viaja con el voto pero no es
+    # columna; `motivo` solo aparece en votos que vuelven de la cuarentena
+    return {campo: valor for campo, valor in fila.items() if campo not in _NO_COLUMNAS}
+
+
+def _participacion(filas: list) -> list:
+    return [
+        (fila["participacion"]["votacionID"], fila["participacion"]["segmentos"], fila["fechaRespuesta"])
+        for fila in filas if fila.get("participacion")
+    ]
+
+
+def _esHuellaRepetida(error: IntegrityError) -> bool:
+    """
+    La fila chocó con el índice único de `huellaVotante` (otro voto del mismo
+    votante), y no con una FK, un CHECK u otra restricción.
+    """
+    mensaje = str(error.orig)
+    if "huellaVotante" not in mensaje:
+        return False
+    # SQL Server informa el número de error; otros motores, solo el texto
+    return any(codigo in mensaje for codigo in ERRORES_CLAVE_DUPLICADA) or "unique" in mensaje.lower()
+
+
+def _aLinea(fila: dict) -> str:
+    return json.dumps({
+        **fila,
+        **{campo: fila[campo].hex() for campo in _BINARIOS if fila.get(campo) is not None},
+        "fechaRespuesta": fila["fechaRespuesta"].isoformat(),
+    })
+
+
+def _deLinea(registro: dict) -> dict:
+    registro["fechaRespuesta"] = datetime.fromisoformat(registro["fechaRespuesta"])
+    for campo in _BINARIOS:
+        if registro.get(campo) is not None:
+            registro[campo] = bytes.fromhex(registro[campo])
+    return registro
+
+
+class DiarioVotos:
+    def __init__(self, archivo: str = ARCHIVO_DIARIO, cuarentena: str = ARCHIVO_CUARENTENA):
+        self.archivo = archivo
+        self.cuarentena = cuarentena or archivo + ".cuarentena"
+        self._cola = None
+        self._tarea = None
+        self._porEscribir = []
+        self._escribiendo = False
+        self._bloqueo = threading.Lock()
+        self._huellasPendientes = set()
+        self.sinConfirmar = 0
+        self.enCuarentena = 0
+        self.descartados = 0
+        self.rechazados = 0
+
+    def _asegurarTarea(self):
+        if self._tarea is None or self._tarea.done():
+            # Lo que quedó de una ejecución anterior se reprocesa aparte,
+            # antes de que se anexe algo nuevo al diario
+            reproceso = self.archivo + ".reproceso"
+            if os.path.exists(self.archivo):
+                if os.path.exists(reproceso):
+                    with open(self.archivo, encoding="utf-8") as origen, open(reproceso, "a", encoding="utf-8") as destino:
+                        destino.write(origen.read())
+                    os.remove(self.archivo)
+                else:
+                    os.replace(self.archivo, reproceso)
+            self._cola = asyncio.Queue()
+            self._tarea = asyncio.get_running_loop().create_task(self._procesar())
+
+    def iniciar(self):
+        """Arranca la tarea de fondo y reprocesa el diario anterior sin esperar al primer voto."""
+        self._asegurarTarea()
+
+    # --- diario en disco ---
+
+    def _escribirLineas(self, lineas: list, truncar: bool = False):
+        with self._bloqueo:
+            with open(self.archivo, "a", encoding="utf-8") as archivo:
+                if lineas:
+                    archivo.write("\n".join(lineas) + "\n")
+                    archivo.flush()
+                    os.fsync(archivo.fileno())
+                if truncar:
+                    archivo.truncate(0)
+
+    async def _anexar(self, linea: str):
+        futuro = asyncio.get_running_loop().create_future()
+        self._porEscribir.append((linea, futuro))
+        if not self._escribiendo:
+            self._escribiendo = True
+            asyncio.get_running_loop().create_task(self._volcarDiario())
+        await futuro
+
+    async def _volcarDiario(self):
+        try:
+            while self._porEscribir:
+                grupo, self._porEscribir = self._porEscribir, []
+                try:
+                    await asyncio.to_thread(self._escribirLineas, [linea for linea, _ in grupo])
+                except Exception as e:
+                    for _, futuro in grupo:
+                        futuro.set_exception(e)
+                    continue
+                for _, futuro in grupo:
+                    futuro.set_result(None)
+                if self.sinConfirmar == 0 and not self._porEscribir:
+                    # Todo lo escrito ya está en la base de datos
+                    await asyncio.to_thread(self._escribirLineas, [], True)
+        finally:
+            self._escribiendo = False
+
+    # --- ingesta ---
+
+    async def yaRegistrado(self, session, huella: bytes) -> bool:
+        """El voto con esta huella está en el diario sin confirmar o ya en la base de datos."""
+        if huella in self._huellasPendientes:
+            return True
+        result = await session.execute(consultaHuellaRegistrada, {"huella": huella})
+        return bool(result.scalar())
+
+    def pendientes(self, huellas) -> bool:
+        """Alguna de las huellas está en el diario sin insertar todavía."""
+        return not self._huellasPendientes.isdisjoint(huellas)
+
+    async def registrar(self, fila: dict) -> bool:
+        """
+        Anexa el voto al diario y lo encola para insertarlo. Retorna False si ya
+        hay un voto pendiente con la misma huella. Al volver, el voto está en disco.
+        """
+        self._asegurarTarea()
+        huella = fila.get("huellaVotante")
+        if huella in self._huellasPendientes:
+            return False
+        if huella is not None:
+            self._huellasPendientes.add(huella)
+        self.sinConfirmar += 1
+        try:
+            await self._anexar(_aLinea(fila))
+        except Exception:
+            self._huellasPendientes.discard(huella)
+            self.sinConfirmar -= 1
+            raise
+        self._cola.put_nowait(fila)
+        return True
+
+    # --- escritura en lote ---
+
+    async def _insertar(self, filas: list) -> Tuple[list, list]:
+        """
+        Inserta el lote; si alguna fila viola una restricción, inserta fila por
+        fila. Retorna (votos descartados por chocar con otro voto del mismo
+        votante, pares (voto, error) rechazados por otra restricción).
+        """
+        try:
+            async with get_session() as session:
+                await session.execute(insert(RespuestaParticipante), [_paraInsertar(fila) for fila in filas])
+                await sumarVotos(session, filas)
+                await sumarParticipacion(session, _participacion(filas))
+                await session.commit()
+            return [], []
+        except IntegrityError:
+            pass
+        descartadas = []
+        rechazadas = []
+        async with get_session() as session:
+            for fila in filas:
+                try:
+                    async with session.begin_nested():
+                        await session.execute(insert(RespuestaParticipante), [_paraInsertar(fila)])
+                        await sumarVotos(session, [fila])
+                        await sumarParticipacion(session, _participacion([fila]))
+                except IntegrityError as e:
+                    # Con el mismo tokenGUID es este voto, insertado antes de una caída
+                    result = await session.execute(consultaTokenRegistrado, {"token": fila["tokenGUID"]})
+                    if result.scalar():
+                        continue
+                    if _esHuellaRepetida(e):
+                        descartadas.append(fila)
+                    else:
+                        rechazadas.append((fila, str(e.orig)))
+            await session.commit()
+        return descartadas, rechazadas
+
+    def _escribirCuarentena(self, lineas: list):
+        with open(self.cuarentena, "a", encoding="utf-8") as archivo:
+            archivo.write("\n".join(lineas) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+    async def _apartar(self, filas: list, motivo: str):
+        """Lleva los votos a la cuarentena y registra un error por voto en pv_logs."""
+        await asyncio.to_thread(self._escribirCuarentena, [_aLinea({**fila, "motivo": motivo}) for fila in filas])
+        for fila in filas:
+            await insertarLog(
+                descripcion=f"Voto diferido no registrado ({motivo}), en cuarentena",
+                computador="votar/diario",
+                usuario="diario",
+                trace=motivo,
+                refId1=fila["preguntaID"],
+                valor1=fila["tokenGUID"],
+                tipologid=2,
+                origenlogid=2,
+                logseveridadid=5,
+            )
+
+    async def _descartar(self, filas: list, rechazadas: list = ()):
+        if filas:
+            logging.error(f"{len(filas)} votos del diario chocaron con otro voto del mismo votante y se descartan")
+            self.descartados += len(filas)
+            await self._apartar(filas, "duplicado")
+        for fila, error in rechazadas:
+            logging.error(f"Voto del diario {fila['tokenGUID']} rechazado por la base de datos: {error}")
+            self.rechazados += 1
+            await self._apartar([fila], f"rechazado: {error[:200]}")
+
+    async def _escribir(self, filas: list):
+        for intento in range(1, MAX_REINTENTOS + 1):
+            try:
+                descartadas, rechazadas = await self._insertar(filas)
+            except Exception as e:
+                if intento < MAX_REINTENTOS:
+                    # Los votos siguen en el diario; se reintenta sin perder el orden
+                    logging.error(f"Error insertando {len(filas)} votos del diario (intento {intento} de {MAX_REINTENTOS}): {str(e)}")
+                    await asyncio.sleep(INTERVALO_SEGUNDOS * 5 * intento)
+                    continue
+                logging.error(f"{len(filas)} votos del diario no se insertaron tras {intento} intentos, pasan a cuarentena: {str(e)}")
+                self.enCuarentena += len(filas)
+                await self._apartar(filas, f"error: {str(e)[:200]}")
+                descartadas = filas
+            else:
+                if descartadas or rechazadas:
+                    await self._descartar(descartadas, rechazadas)
+                    descartadas = descartadas + [fila for fila, _ in rechazadas]
+            break
+        apartados = {fila["tokenGUID"] for fila in descartadas}
+        for fila in filas:
+            self._huellasPendientes.discard(fila.get("huellaVotante"))
+            if fila["tokenGUID"] not in apartados:
+                indiceRecibos.agregar(fila["tokenGUID"])
+        self.sinConfirmar -= len(filas)
+        await self._anexar(json.dumps({
+            "confirmados": [fila["tokenGUID"] for fila in filas if fila["tokenGUID"] not in apartados],
+            "cuarentena": sorted(apartados),
+        }))
+
+    async def _reprocesarDiario(self):
+        pendiente = self.archivo + ".reproceso"
+        if not os.path.exists(pendiente):
+            return
+        votos = {}
+        with open(pendiente, encoding="utf-8") as archivo:
+            for linea in archivo:
+                if not linea.strip():
+                    continue
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    # Última línea cortada por la caída: ese voto nunca se confirmó al cliente
+                    continue
+                if "confirmados" in registro:
+                    for token in registro["confirmados"] + registro.get("cuarentena", []):
+                        votos.pop(token, None)
+                else:
+                    votos[registro["tokenGUID"]] = registro
+        filas = [_deLinea(registro) for registro in votos.values()]
+        if filas:
+            logging.info(f"Reprocesando {len(filas)} votos del diario")
+        for inicio in range(0, len(filas), TAMANO_LOTE):
+            descartadas, rechazadas = await self._insertar(filas[inicio:inicio + TAMANO_LOTE])
+            if descartadas or rechazadas:
+                await self._descartar(descartadas, rechazadas)
+        os.remove(pendiente)
+
+    async def _procesar(self):
+        try:
+            await self._reprocesarDiario()
+        except Exception as e:
+            logging.error(f"No se pudo reprocesar el diario de votos: {str(e)}")
+        loop = asyncio.get_running_loop()
+        activa = True
+        while activa:
+            fila = await self._cola.get()
+            if fila is None:
+                break
+            filas = [fila]
+            limite = loop.time() + INTERVALO_SEGUNDOS
+            while len(filas) < TAMANO_LOTE:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    fila = await asyncio.wait_for(self._cola.get(), restante)
+                except asyncio.TimeoutError:
+                    break
+                if fila is None:
+                    activa = False
+                    break
+                filas.append(fila)
+            await self._escribir(filas)
+
+    async def vaciar(self):
+        """Inserta todo lo encolado y detiene la tarea de fondo (apagado ordenado)."""
+        if self._tarea is not None and not self._tarea.done():
+            await self._cola.put(None)
+            await self._tarea
+        self._tarea = None
+        filas = []
+        while self._cola is not None and not self._cola.empty():
+            fila = self._cola.get_nowait()
+            if fila is not None:
+                filas.append(fila)
+        for inicio in range(0, len(filas), TAMANO_LOTE):
+            await self._escribir(filas[inicio:inicio + TAMANO_LOTE])
+
+    def estadisticas(self) -> dict:
+        return {
+            "habilitado": HABILITADO,
+            "sinConfirmar": self.sinConfirmar,
+            "enCola": self._cola.qsize() if self._cola is not None else 0,
+            # Votos respondidos con 202 que no llegaron a pv_respuestaParticipante (ver cuarentena)
+            "enCuarentena": self.enCuarentena,
+            "descartados": self.descartados,
+            "rechazados": self.rechazados,
+        }
+
+
+diarioVotos = DiarioVotos()
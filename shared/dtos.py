@@ -69,7 +69,31 @@ class VotoDTO(BaseModel):
     preguntaID: int = Field(..., description = "ID de la pregunta a contestar")
     respuestaID: int = Field(..., description = "ID de la respuesta con la que se contestará")
     valor: str = Field(..., max_length=100, description="Contenido de la respuesta")
-    pesoRespuesta: int = Field(..., description = "ID del peso de la respuesta")
+    # El servidor resuelve el peso del votante; si se manda, debe coincidir
+    pesoRespuesta: Optional[int] = Field(None, description = "ID del peso de la respuesta")
+    # Credenciales completas, o un token de sesionVotacion (body o header Authorization: Bearer)
+    cedulaUsuario: Optional[str] = None
+    contrasenia: Optional[SecretStr] = None
+    prueba_vida: Optional[str] = None
+    tokenSesion: Optional[str] = None
+
+class SeleccionDTO(BaseModel):
+    preguntaID: int
+    respuestaID: int
+    valor: str = Field(..., max_length=100)
+    pesoRespuesta: Optional[int] = None
+
+class BoletaDTO(BaseModel):
+    votacionID: int = Field(..., description="Votación a la que pertenece la boleta")
+    # Una entrada por respuesta elegida; varias para la misma pregunta si admite selección múltiple
+    respuestas: List[SeleccionDTO] = Field(..., min_length=1)
+    cedulaUsuario: Optional[str] = None
+    contrasenia: Optional[SecretStr] = None
+    prueba_vida: Optional[str] = None
+    tokenSesion: Optional[str] = None
+
+class SesionVotacionDTO(BaseModel):
+    votacionID: int = Field(..., description="Votación para la que se emite la sesión")
     cedulaUsuario: str
     contrasenia: SecretStr
     prueba_vida: str
@@ -81,8 +105,14 @@ class RevisarPropuestaDTO(BaseModel):
     comentarios_revision: Optional[str] = None
     tipo_revision: str 
 
+class CursorVotosDTO(BaseModel):
+    fecha_respuesta: datetime
+    respuesta_participante_id: int
+
 class ListaVotosInputDTO(BaseModel):
     cedula: str = Field(..., min_length=9, max_length=9, example="123456789")
     contrasenna: SecretStr
     prueba_vida: str = Field(..., description="UUID o URL del video de verificación")
-    token_mfa: Optional[str] = Field(None, min_length=6, max_length=6)
\ No newline at end of file
+    token_mfa: Optional[str] = Field(None, min_length=6, max_length=6)
+    tamano_pagina: int = Field(5, ge=1, le=100)
+    cursor: Optional[CursorVotosDTO] = Field(None, description="Campo `siguiente` de la página anterior")
\ No newline at end of file
@@ -0,0 +1,346 @@
+"""
+Escrutinio vectorizado de una pregunta con NumPy.
+
+Los votos de la pregunta se leen en lotes de `EscrutinioTamanoLote` filas
+(paginando por `respuestaParticipanteID`, como la carga de recibos) y cada lote
+se convierte en arreglos: índice de la respuesta, peso (`multiplicador` de
+`pv_pesoRespuesta`, 1 si no tiene) y `valor`. Los conteos acumulan sobre
+arreglos del tamaño de la cantidad de respuestas, así que la memoria depende
+del lote y no de la cantidad de votos.
+
+Métodos:
+
+- `mayoria`: un voto por fila; gana la respuesta con más votos.
+- `aprobacion`: cada respuesta marcada suma el peso del voto; gana la de más
+  votos ponderados (preguntas con `maxSelecciones > 1`).
+- `calificacion`: `valor` es una nota numérica; promedio ponderado por
+  respuesta. Las notas que no son números finitos o que están fuera de
+  [`EscrutinioNotaMinima`, `EscrutinioNotaMaxima`] se cuentan como inválidas:
+  una sola nota como "1e300" no puede decidir el promedio.
+- `segundaVuelta` (instant-runoff): `valor` es el orden de preferencia como
+  `respuestaID` separados por `>` o `,` (vacío: solo `respuestaID`). Las
+  boletas se agrupan por orden distinto y cada ronda se resuelve con una
+  máscara de respuestas eliminadas sobre la matriz de órdenes. Un orden no
+  repite respuestas, así que su largo es a lo sumo la cantidad de respuestas
+  (y `valor` tiene a lo sumo 100 caracteres); la cantidad de órdenes distintos
+  se limita a `EscrutinioMaxOrdenes` y, si se supera, el escrutinio falla con
+  `ValueError` en vez de agotar la memoria.
+
+Los `valor` se convierten una vez por valor distinto (`np.unique`), no por fila.
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from sqlalchemy import bindparam, func, select
+from .database import leerConfig
+from .models import PesoRespuesta, Respuesta, RespuestaParticipante
+from .statements import etiquetar
+
+TAMANO_LOTE = leerConfig("EscrutinioTamanoLote", 100_000, int)
+NOTA_MINIMA = leerConfig("EscrutinioNotaMinima", 0.0, float)
+NOTA_MAXIMA = leerConfig("EscrutinioNotaMaxima", 10.0, float)
+# La matriz de la segunda vuelta ocupa ordenes x respuestas x 8 bytes
+MAX_ORDENES = leerConfig("EscrutinioMaxOrdenes", 200_000, int)
+
+MAYORIA = "mayoria"
+APROBACION = "aprobacion"
+CALIFICACION = "calificacion"
+SEGUNDA_VUELTA = "segundaVuelta"
+
+# tipoVotacionId en el orden de VotacionDTO: única, múltiple, calificación, preferencial
+METODO_POR_TIPO = {1: MAYORIA, 2: APROBACION, 3: CALIFICACION, 4: SEGUNDA_VUELTA}
+
+consultaCandidatos = etiquetar(
+    select(Respuesta.respuestaID).where(Respuesta.preguntaID == bindparam("preguntaID")),
+    "escrutinio.candidatos",
+)
+
+consultaVotosDesde = etiquetar(
+    select(
+        RespuestaParticipante.respuestaParticipanteID,
+        RespuestaParticipante.respuestaID,
+        RespuestaParticipante.valor,
+        func.coalesce(PesoRespuesta.multiplicador, 1).label("multiplicador"),
+    )
+    .outerjoin(PesoRespuesta, PesoRespuesta.pesoID == RespuestaParticipante.pesoRespuesta)
+    .where(
+        RespuestaParticipante.preguntaID == bindparam("preguntaID"),
+        RespuestaParticipante.respuestaParticipanteID > bindparam("desde"),
+    )
+    .order_by(RespuestaParticipante.respuestaParticipanteID)
+    .limit(TAMANO_LOTE),
+    "escrutinio.votosDesde",
+)
+
+
+def _ganadores(candidatos: np.ndarray, puntajes: np.ndarray, elegibles: np.ndarray = None) -> List[int]:
+    if elegibles is None:
+        elegibles = np.ones(len(candidatos), dtype=bool)
+    if not elegibles.any():
+        return []
+    maximo = puntajes[elegibles].max()
+    return candidatos[elegibles & (puntajes == maximo)].tolist()
+
+
+class Conteo(ABC):
+    """Acumulador de un método; `agregar` recibe un lote, `resultado` arma el informe."""
+
+    metodo = None
+    usaValor = False
+
+    def __init__(self, candidatos: Iterable[int]):
+        self.candidatos = np.unique(np.asarray(list(candidatos), dtype=np.int64))
+        self.boletas = 0
+        self.invalidas = 0
+
+    def _indices(self, respuestaIDs: np.ndarray) -> np.ndarray:
+        """Posición de cada respuestaID en `candidatos`, o -1 si no es de la pregunta."""
+        if not len(self.candidatos):
+            return np.full(len(respuestaIDs), -1, dtype=np.int64)
+        posiciones = np.searchsorted(self.candidatos, respuestaIDs)
+        posiciones[posiciones == len(self.candidatos)] = 0
+        return np.where(self.candidatos[posiciones] == respuestaIDs, posiciones, -1)
+
+    @abstractmethod
+    def agregar(self, respuestaIDs: np.ndarray, pesos: np.ndarray, valores: np.ndarray = None):
+        ...
+
+    @abstractmethod
+    def resultado(self) -> dict:
+        ...
+
+
+class Mayoria(Conteo):
+    metodo = MAYORIA
+
+    def __init__(self, candidatos: Iterable[int]):
+        super().__init__(candidatos)
+        self.votos = np.zeros(len(self.candidatos), dtype=np.int64)
+        self.ponderados = np.zeros(len(self.candidatos), dtype=np.float64)
+
+    def agregar(self, respuestaIDs, pesos, valores=None):
+        indices = self._indices(respuestaIDs)
+        validas = indices >= 0
+        self.boletas += len(indices)
+        self.invalidas += int(len(indices) - np.count_nonzero(validas))
+        indices = indices[validas]
+        n = len(self.candidatos)
+        self.votos += np.bincount(indices, minlength=n)
+        self.ponderados += np.bincount(indices, weights=pesos[validas], minlength=n)
+
+    def _puntajes(self) -> np.ndarray:
+        return self.votos
+
+    def resultado(self) -> dict:
+        return {
+            "metodo": self.metodo,
+            "boletas": self.boletas,
+            "invalidas": self.invalidas,
+            "ganadores": _ganadores(self.candidatos, self._puntajes(), self.votos > 0),
+            "respuestas": [
+                {"respuestaID": int(c), "votos": int(v), "votosPonderados": round(float(p), 2)}
+                for c, v, p in zip(self.candidatos, self.votos, self.ponderados)
+            ],
+        }
+
+
+class Aprobacion(Mayoria):
+    metodo = APROBACION
+
+    def _puntajes(self) -> np.ndarray:
+        return self.ponderados
+
+
+def _numeros(valores: np.ndarray) -> np.ndarray:
+    unicos, inversa = np.unique(valores, return_inverse=True)
+    convertidos = np.empty(len(unicos), dtype=np.float64)
+    for i, valor in enumerate(unicos):
+        try:
+            convertidos[i] = float(valor)
+        except (TypeError, ValueError):
+            convertidos[i] = np.nan
+    return convertidos[inversa.reshape(-1)]
+
+
+class Calificacion(Conteo):
+    metodo = CALIFICACION
+    usaValor = True
+
+    def __init__(self, candidatos: Iterable[int]):
+        super().__init__(candidatos)
+        n = len(self.candidatos)
+        self.votos = np.zeros(n, dtype=np.int64)
+        self.sumaNotas = np.zeros(n, dtype=np.float64)
+        self.sumaPesos = np.zeros(n, dtype=np.float64)
+        self.sumaPonderada = np.zeros(n, dtype=np.float64)
+
+    def agregar(self, respuestaIDs, pesos, valores=None):
+        indices = self._indices(respuestaIDs)
+        notas = _numeros(valores)
+        # NaN (no numérica) queda fuera del rango, igual que inf
+        validas = (indices >= 0) & (notas >= NOTA_MINIMA) & (notas <= NOTA_MAXIMA)
+        self.boletas += len(indices)
+        self.invalidas += int(len(indices) - np.count_nonzero(validas))
+        indices, notas, pesos = indices[validas], notas[validas], pesos[validas]
+        n = len(self.candidatos)
+        self.votos += np.bincount(indices, minlength=n)
+        self.sumaNotas += np.bincount(indices, weights=notas, minlength=n)
+        self.sumaPesos += np.bincount(indices, weights=pesos, minlength=n)
+        self.sumaPonderada += np.bincount(indices, weights=notas * pesos, minlength=n)
+
+    def resultado(self) -> dict:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            promedio = self.sumaNotas / self.votos
+            ponderado = self.sumaPonderada / self.sumaPesos
+        calificadas = self.votos > 0
+        return {
+            "metodo": self.metodo,
+            "boletas": self.boletas,
+            "invalidas": self.invalidas,
+            "ganadores": _ganadores(self.candidatos, np.nan_to_num(ponderado, nan=-np.inf), calificadas),
+            "respuestas": [
+                {
+                    "respuestaID": int(c),
+                    "votos": int(v),
+                    "promedio": round(float(p), 4) if v else None,
+                    "promedioPonderado": round(float(pp), 4) if v else None,
+                }
+                for c, v, p, pp in zip(self.candidatos, self.votos, promedio, ponderado)
+            ],
+        }
+
+
+class SegundaVuelta(Conteo):
+    metodo = SEGUNDA_VUELTA
+    usaValor = True
+
+    def __init__(self, candidatos: Iterable[int]):
+        super().__init__(candidatos)
+        self._posicion = {int(c): i for i, c in enumerate(self.candidatos)}
+        # Orden de preferencia (tupla de índices) -> [boletas, peso]
+        self._ordenes: Dict[Tuple[int, ...], list] = {}
+
+    def _orden(self, valor: str) -> Tuple[int, ...]:
+        orden = []
+        for parte in valor.replace(">", ",").split(","):
+            try:
+                indice = self._posicion.get(int(parte))
+            except ValueError:
+                continue
+            if indice is not None and indice not in orden:
+                orden.append(indice)
+        return tuple(orden)
+
+    def _acumular(self, orden: Tuple[int, ...], cantidad: int, peso: float):
+        if not orden:
+            self.invalidas += cantidad
+            return
+        acumulado = self._ordenes.get(orden)
+        if acumulado is None:
+            if len(self._ordenes) >= MAX_ORDENES:
+                raise ValueError(f"La pregunta tiene más de {MAX_ORDENES} órdenes de preferencia distintos (EscrutinioMaxOrdenes)")
+            acumulado = self._ordenes[orden] = [0, 0.0]
+        acumulado[0] += cantidad
+        acumulado[1] += peso
+
+    def agregar(self, respuestaIDs, pesos, valores=None):
+        self.boletas += len(respuestaIDs)
+        sinOrden = valores == ""
+        # Solo se interpreta cada orden distinto del lote
+        ordenes, inversa = np.unique(valores[~sinOrden], return_inverse=True)
+        inversa = inversa.reshape(-1)
+        cantidades = np.bincount(inversa, minlength=len(ordenes))
+        pesosOrden = np.bincount(inversa, weights=pesos[~sinOrden], minlength=len(ordenes))
+        for valor, cantidad, peso in zip(ordenes.tolist(), cantidades.tolist(), pesosOrden.tolist()):
+            self._acumular(self._orden(valor), cantidad, peso)
+        # Sin `valor`, la boleta solo tiene la preferencia de su respuestaID
+        indices = self._indices(respuestaIDs[sinOrden])
+        validas = indices >= 0
+        self.invalidas += int(len(indices) - np.count_nonzero(validas))
+        n = len(self.candidatos)
+        cantidades = np.bincount(indices[validas], minlength=n)
+        pesosOrden = np.bincount(indices[validas], weights=pesos[sinOrden][validas], minlength=n)
+        for indice in np.flatnonzero(cantidades).tolist():
+            self._acumular((indice,), int(cantidades[indice]), float(pesosOrden[indice]))
+
+    def resultado(self) -> dict:
+        n = len(self.candidatos)
+        rondas = []
+        ganadores: List[int] = []
+        if self._ordenes and n:
+            largo = max(len(orden) for orden in self._ordenes)
+            # Matriz de órdenes rellenada con n, un candidato ficticio siempre eliminado
+            matriz = np.full((len(self._ordenes), largo), n, dtype=np.int64)
+            for fila, orden in enumerate(self._ordenes):
+                matriz[fila, :len(orden)] = orden
+            cantidades = np.array([v[0] for v in self._ordenes.values()], dtype=np.int64)
+            pesos = np.array([v[1] for v in self._ordenes.values()], dtype=np.float64)
+            activos = np.ones(n + 1, dtype=bool)
+            activos[n] = False
+            filas = np.arange(len(matriz))
+            while True:
+                mascara = activos[matriz]
+                vigentes = mascara.any(axis=1)
+                eleccion = matriz[filas, mascara.argmax(axis=1)][vigentes]
+                votos = np.bincount(eleccion, weights=cantidades[vigentes], minlength=n + 1)[:n]
+                ponderados = np.bincount(eleccion, weights=pesos[vigentes], minlength=n + 1)[:n]
+                enCarrera = activos[:n]
+                rondas.append({
+                    "ronda": len(rondas) + 1,
+                    "agotadas": int(cantidades[~vigentes].sum()),
+                    "respuestas": [
+                        {"respuestaID": int(c), "votos": int(v), "votosPonderados": round(float(p), 2)}
+                        for c, v, p, a in zip(self.candidatos, votos, ponderados, enCarrera) if a
+                    ],
+                })
+                total = ponderados[enCarrera].sum()
+                if total <= 0:
+                    break
+                if ponderados[enCarrera].max() * 2 > total:
+                    ganadores = _ganadores(self.candidatos, ponderados, enCarrera)
+                    break
+                minimo = ponderados[enCarrera].min()
+                eliminar = enCarrera & (ponderados == minimo)
+                if np.array_equal(eliminar, enCarrera):
+                    # Empate entre todos los que quedan
+                    ganadores = self.candidatos[enCarrera].tolist()
+                    break
+                activos[:n] &= ~eliminar
+        return {
+            "metodo": self.metodo,
+            "boletas": self.boletas,
+            "invalidas": self.invalidas,
+            "ordenesDistintos": len(self._ordenes),
+            "ganadores": ganadores,
+            "rondas": rondas,
+        }
+
+
+METODOS = {clase.metodo: clase for clase in (Mayoria, Aprobacion, Calificacion, SegundaVuelta)}
+
+
+async def lotesDeVotos(session, preguntaID: int, conValor: bool = True):
+    """Votos de la pregunta en lotes de `TAMANO_LOTE` como (respuestaIDs, pesos, valores)."""
+    desde = 0
+    while True:
+        filas = (await session.execute(consultaVotosDesde, {"preguntaID": preguntaID, "desde": desde})).all()
+        if not filas:
+            return
+        desde = filas[-1].respuestaParticipanteID
+        respuestaIDs = np.fromiter((fila.respuestaID for fila in filas), dtype=np.int64, count=len(filas))
+        pesos = np.fromiter((float(fila.multiplicador) for fila in filas), dtype=np.float64, count=len(filas))
+        valores = np.array([fila.valor or "" for fila in filas], dtype=str) if conValor else None
+        yield respuestaIDs, pesos, valores
+        if len(filas) < TAMANO_LOTE:
+            return
+
+
+async def escrutarPregunta(session, preguntaID: int, metodo: str) -> dict:
+    """Escrutinio completo de la pregunta desde `pv_respuestaParticipante`."""
+    if metodo not in METODOS:
+        raise ValueError(f"Método de escrutinio desconocido: {metodo}")
+    candidatos = (await session.execute(consultaCandidatos, {"preguntaID": preguntaID})).scalars().all()
+    conteo = METODOS[metodo](candidatos)
+    async for lote in lotesDeVotos(session, preguntaID, conteo.usaValor):
+        conteo.agregar(*lote)
+    return {"preguntaID": preguntaID, **conteo.resultado()}
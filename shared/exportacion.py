@@ -0,0 +1,340 @@
+"""
+Exportación de las boletas anonimizadas de una votación cerrada.
+
+Para auditar una votación se necesitan todos sus votos, que pueden ser
+millones: cargarlos con el ORM en una lista agota la memoria de la función.
+`exportarBoletas` los lee con un cursor del lado del servidor
+(`session.stream` con `yield_per`) y produce la salida por bloques de
+`ExportacionTamanoBloque` votos, así que la memoria no depende del tamaño de la
+votación.
+
+Formato (JSON por línea, NDJSON):
+
+    {"exportacion": "boletas", "votacion_id": 1, ..., "columnas": [...]}  encabezado
+    [11, 111, "v", 1, "2025-06-20T08:01:00"]                             un voto (formato "filas")
+    {"columnas": {"pregunta_id": [...], ...}}                            un bloque (formato "columnas")
+    {"bloque": 0, "desde": 0, "filas": 10000, "sha256": "...", "clave": [...]}  control de bloque
+    {"fin": true, "filas": 25000, "siguiente": null, "clave": [...]}     cierre
+
+Cada línea de control cierra un bloque: `sha256` es el hash de los bytes
+exactos de las líneas de datos desde el control anterior (o desde el
+encabezado). Los bloques se numeran desde el primer voto de la votación, no
+desde donde empezó la descarga, así que una descarga retomada produce los
+mismos bloques y hashes que una completa. Para retomar una descarga cortada se
+descarta lo posterior al último control válido (`verificarExportacion`) y se
+pide de nuevo con `desde` igual a las filas verificadas y la `clave` de ese
+control.
+
+Los votos salen ordenados por las columnas exportadas (pregunta, respuesta,
+valor, peso y minuto), no en el orden en que se insertaron, y sin
+`respuestaParticipanteID`, `tokenGUID`, `huellaVotante`, `ncRespuesta` o
+`checksum`, con `fechaRespuesta` truncada al minuto: con el ID, el orden de
+inserción o la hora exacta se podría cruzar un voto con la bitácora de
+accesos. El encabezado trae los pesos y los totales de `pv_conteoRespuesta`
+para conciliar el conteo.
+
+Los tramos se recorren por clave (keyset), no con OFFSET, que relee todos los
+votos anteriores en cada petición. La `clave` de un control es el último voto
+exportado [pregunta_id, respuesta_id, valor, peso_id, minuto] más cuántos
+votos iguales a ese ya salieron: la consulta busca desde esa clave y salta
+solo esos repetidos. Dentro de un mismo voto exportado, los votos se ordenan
+por su hora exacta, que no se publica (las filas son idénticas). `valor` se
+ordena y compara como bytes (`VARBINARY` en SQL Server), para que la
+comparación de SQL coincida con la de Python sin depender de la colación, y
+un `valor` NULL se ordena como vacío.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+from sqlalchemy import String, and_, bindparam, cast, func, or_, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from .codec import aJson
+from .database import leerConfig
+from .models import PesoRespuesta, RespuestaParticipante, VotacionPregunta
+from .resultados import obtenerResultados
+from .statements import etiquetar
+
+TAMANO_BLOQUE = leerConfig("ExportacionTamanoBloque", 10000, int)
+FILAS_POR_LECTURA = leerConfig("ExportacionFilasPorLectura", 2000, int)
+
+FILAS = "filas"
+COLUMNAS = "columnas"
+FORMATOS = (FILAS, COLUMNAS)
+
+CAMPOS = ("pregunta_id", "respuesta_id", "valor", "peso_id", "minuto")
+
+
+class Binario(FunctionElement):
+    """Texto comparado byte a byte: sin colación que ignore mayúsculas o espacios finales."""
+    type = String()
+    inherit_cache = True
+
+
+@compiles(Binario)
+def _compilarBinario(elemento, compilador, **kw):
+    return compilador.process(elemento.clauses, **kw)
+
+
+@compiles(Binario, "mssql")
+def _compilarBinarioMssql(elemento, compilador, **kw):
+    return f"CAST({compilador.process(elemento.clauses, **kw)} AS VARBINARY(500))"
+
+
+# Ambos lados como la columna (VARCHAR): pyodbc manda los parámetros como
+# NVARCHAR y sus bytes no se compararían con los de la columna
+_valor = Binario(cast(func.coalesce(RespuestaParticipante.valor, ""), RespuestaParticipante.valor.type))
+
+
+def _desdeClave():
+    """
+    (pregunta, respuesta, valor, peso, fecha) >= clave, desplegado en OR/AND:
+    SQL Server no compara filas completas.
+    """
+    condicion = RespuestaParticipante.fechaRespuesta >= bindparam("claveMinuto")
+    for columna, valor in reversed((
+        (RespuestaParticipante.preguntaID, bindparam("clavePregunta")),
+        (RespuestaParticipante.respuestaID, bindparam("claveRespuesta")),
+        (_valor, Binario(cast(bindparam("claveValor", type_=String), RespuestaParticipante.valor.type))),
+        (RespuestaParticipante.pesoRespuesta, bindparam("clavePeso")),
+    )):
+        condicion = or_(columna > valor, and_(columna == valor, condicion))
+    return condicion
+
+
+_boletas = (
+    select(
+        RespuestaParticipante.preguntaID,
+        RespuestaParticipante.respuestaID,
+        RespuestaParticipante.valor,
+        RespuestaParticipante.pesoRespuesta,
+        RespuestaParticipante.fechaRespuesta,
+    )
+    .join(VotacionPregunta, VotacionPregunta.preguntaID == RespuestaParticipante.preguntaID)
+    .where(VotacionPregunta.votacionID == bindparam("votacionID"))
+    .order_by(
+        RespuestaParticipante.preguntaID,
+        RespuestaParticipante.respuestaID,
+        _valor,
+        RespuestaParticipante.pesoRespuesta,
+        RespuestaParticipante.fechaRespuesta,
+    )
+    .execution_options(yield_per=FILAS_POR_LECTURA)
+)
+
+consultaBoletas = etiquetar(_boletas, "exportacion.boletas")
+
+consultaBoletasDesde = etiquetar(_boletas.where(_desdeClave()), "exportacion.boletasDesde")
+
+consultaPesos = etiquetar(
+    select(PesoRespuesta.pesoID, PesoRespuesta.multiplicador),
+    "exportacion.pesos",
+)
+
+
+def votacionCerrada(votacion) -> bool:
+    # Las fechas de pv_votacion se guardan sin zona y se interpretan como UTC
+    return votacion.fechaFin.replace(tzinfo=timezone.utc) < datetime.now(timezone.utc)
+
+
+def _minuto(fecha: datetime) -> str:
+    return fecha.replace(second=0, microsecond=0).isoformat()
+
+
+def _linea(obj) -> bytes:
+    return aJson(obj) + b"\n"
+
+
+def _voto(fila) -> tuple:
+    """Columnas exportadas de un voto, con `valor` NULL como vacío (así se ordena)."""
+    return (fila.preguntaID, fila.respuestaID, fila.valor or "", fila.pesoRespuesta, _minuto(fila.fechaRespuesta))
+
+
+def leerClave(clave) -> Tuple[tuple, int]:
+    """Valida la `clave` de un control: retorna (voto exportado, repetidos)."""
+    try:
+        preguntaID, respuestaID, valor, pesoID, minuto, repetidos = clave
+        voto = (int(preguntaID), int(respuestaID), str(valor), int(pesoID), _minuto(datetime.fromisoformat(minuto)))
+        repetidos = int(repetidos)
+    except (TypeError, ValueError):
+        raise ValueError("clave debe ser [pregunta_id, respuesta_id, valor, peso_id, minuto, repetidos]") from None
+    if repetidos < 1:
+        raise ValueError("clave debe tener al menos un voto repetido")
+    return voto, repetidos
+
+
+async def encabezado(session, votacion, formato: str, desde: int, bloque: int, clave: Optional[list] = None) -> bytes:
+    _, filas = await obtenerResultados(session, votacion.votacionID)
+    pesos = (await session.execute(consultaPesos)).all()
+    return _linea({
+        "exportacion": "boletas",
+        "votacion_id": votacion.votacionID,
+        "titulo": votacion.titulo,
+        "fecha_inicio": votacion.fechaInicio,
+        "fecha_fin": votacion.fechaFin,
+        "formato": formato,
+        "bloque": bloque,
+        "desde": desde,
+        "clave": clave,
+        "columnas": CAMPOS,
+        # Un peso sin multiplicador cuenta 1, igual que en shared/resultados.py
+        "pesos": {peso.pesoID: peso.multiplicador if peso.multiplicador is not None else 1 for peso in pesos},
+        "resultados": [
+            {"pregunta_id": fila.preguntaID, "respuesta_id": fila.respuestaID,
+             "votos": int(fila.votos), "votos_ponderados": fila.votosPonderados}
+            for fila in filas
+        ],
+    })
+
+
+async def exportarBoletas(
+    session,
+    votacion,
+    formato: str = FILAS,
+    desde: int = 0,
+    bloque: int = TAMANO_BLOQUE,
+    limite: Optional[int] = None,
+    conEncabezado: bool = True,
+    clave: Optional[list] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Produce la exportación de `votacion` (fila de `shared.resultados.consultaVotacion`)
+    como fragmentos de bytes, un bloque a la vez. `desde` debe ser múltiplo de
+    `bloque` y, si no es 0, ir con la `clave` del control de ese voto. Con
+    `limite`, se detiene después de esa cantidad de votos (múltiplo de
+    `bloque`) y el cierre indica en `siguiente` y `clave` desde dónde seguir.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato debe ser uno de {', '.join(FORMATOS)}")
+    if bloque < 1 or desde < 0 or desde % bloque:
+        raise ValueError("desde debe ser un múltiplo no negativo de bloque")
+    if limite is not None and (limite < bloque or limite % bloque):
+        raise ValueError("limite debe ser un múltiplo de bloque")
+    if (clave is None) != (desde == 0):
+        raise ValueError("para retomar desde un voto distinto de 0 hace falta la clave de su control, y solo entonces")
+    ultimo, repetidos = leerClave(clave) if clave is not None else (None, 0)
+    if conEncabezado:
+        yield await encabezado(session, votacion, formato, desde, bloque, clave)
+
+    inicio = desde
+    datos = []
+    completa = True
+    # Votos iguales a `ultimo` que ya salieron en tramos anteriores y se saltan
+    saltar = repetidos
+
+    def claveActual() -> Optional[list]:
+        return None if ultimo is None else [*ultimo, repetidos]
+
+    def cerrarBloque() -> bytes:
+        if formato == FILAS:
+            contenido = b"".join(datos)
+        else:
+            contenido = _linea({"columnas": dict(zip(CAMPOS, map(list, zip(*datos))))})
+        control = _linea({
+            "bloque": inicio // bloque,
+            "desde": inicio,
+            "filas": len(datos),
+            "sha256": hashlib.sha256(contenido).hexdigest(),
+            "clave": claveActual(),
+        })
+        return contenido + control
+
+    if ultimo is None:
+        result = await session.stream(consultaBoletas, {"votacionID": votacion.votacionID})
+    else:
+        result = await session.stream(consultaBoletasDesde, {
+            "votacionID": votacion.votacionID,
+            "clavePregunta": ultimo[0],
+            "claveRespuesta": ultimo[1],
+            "claveValor": ultimo[2],
+            "clavePeso": ultimo[3],
+            "claveMinuto": datetime.fromisoformat(ultimo[4]),
+        })
+    try:
+        async for particion in result.partitions():
+            for fila in particion:
+                voto = _voto(fila)
+                if saltar:
+                    if voto == ultimo:
+                        saltar -= 1
+                        continue
+                    saltar = 0
+                if limite is not None and inicio + len(datos) - desde >= limite:
+                    completa = False
+                    break
+                if voto == ultimo:
+                    repetidos += 1
+                else:
+                    ultimo, repetidos = voto, 1
+                valores = (fila.preguntaID, fila.respuestaID, fila.valor, fila.pesoRespuesta, voto[4])
+                datos.append(_linea(valores) if formato == FILAS else valores)
+                if len(datos) == bloque:
+                    yield cerrarBloque()
+                    inicio += len(datos)
+                    datos = []
+            if not completa:
+                break
+    finally:
+        await result.close()
+    if datos:
+        yield cerrarBloque()
+        inicio += len(datos)
+    yield _linea({"fin": completa, "filas": inicio, "siguiente": None if completa else inicio, "clave": claveActual()})
+
+
+def verificarExportacion(archivo) -> Tuple[Optional[dict], int, int, bool, Optional[list]]:
+    """
+    Recorre una exportación (archivo binario abierto) y verifica el hash de
+    cada bloque. Retorna (encabezado, filas verificadas, bytes hasta el último
+    control válido, completa, clave de ese control). Lo que sigue a esos bytes
+    es un bloque cortado o corrupto y se puede descartar para retomar desde las
+    filas verificadas con esa clave.
+    """
+    cabecera = None
+    filas = 0
+    clave = None
+    leidos = 0
+    posicion = 0
+    completa = False
+    contenido = hashlib.sha256()
+    pendientes = 0
+    for linea in archivo:
+        if not linea.endswith(b"\n"):
+            break
+        leidos += len(linea)
+        if linea.startswith(b"["):
+            contenido.update(linea)
+            pendientes += 1
+            continue
+        try:
+            registro = json.loads(linea)
+        except ValueError:
+            break
+        if cabecera is None:
+            if registro.get("exportacion") != "boletas":
+                break
+            cabecera = registro
+            filas = registro["desde"]
+            clave = registro.get("clave")
+        elif isinstance(registro.get("columnas"), dict):
+            contenido.update(linea)
+            pendientes += len(next(iter(registro["columnas"].values()), []))
+            continue
+        elif "bloque" in registro:
+            if (registro["sha256"] != contenido.hexdigest() or registro["filas"] != pendientes
+                    or registro["desde"] != filas):
+                break
+            filas += pendientes
+            clave = registro.get("clave")
+        elif "fin" in registro:
+            completa = bool(registro["fin"]) and pendientes == 0 and registro["filas"] == filas
+            if completa:
+                posicion = leidos
+            break
+        else:
+            break
+        posicion = leidos
+        contenido = hashlib.sha256()
+        pendientes = 0
+    return cabecera, filas, posicion, completa, clave
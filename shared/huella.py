@@ -0,0 +1,155 @@
+"""
+Huellas del votante en `pv_respuestaParticipante`.
+
+`ncRespuesta` está cifrado con la llave de cada usuario, así que no sirve para
+buscar sus votos. Cada voto lleva dos HMAC-SHA256 con un secreto del servidor
+(`HuellaVotanteSecreto`):
+
+- `huellaVotante` = HMAC(usuario, pregunta), con índice único: `votar` detecta
+  el voto duplicado al insertar.
+- `huellaUsuario` = HMAC(usuario), con índice por (huellaUsuario,
+  fechaRespuesta, respuestaParticipanteID): `listarVotos` encuentra y pagina
+  los votos del usuario con una sola búsqueda en el índice, sin recorrer el
+  catálogo de preguntas.
+
+Los votos anteriores a `huellaVotante` quedan en NULL hasta que se completan
+con `completarHuellas` (al votar, o con `scripts/backfill_huella_votante.py
+--llaves`); los que ya tenían `huellaVotante` pero no `huellaUsuario` se
+completan sin llaves con `--usuarios`. Mientras el backfill no termine, active
+`HuellaVotanteRespaldoLegado=true` para que también se revisen esas filas (por
+defecto está apagado: el respaldo descifra en SQL Server y enumera huellas por
+pregunta en cada consulta).
+
+En preguntas de selección múltiple (`votarBoleta`) cada respuesta elegida lleva
+la huella de su posición: la primera usa la misma huella que un voto simple,
+así que un segundo voto a la misma pregunta choca igual con el índice.
+"""
+import hashlib
+import hmac
+from typing import Iterable, List, Tuple
+from sqlalchemy import bindparam, select, text, update
+from .database import leerConfig
+from .models import RespuestaParticipante
+from .statements import etiquetar
+from .cifrado import CifradoAesGcm, perteneceA
+
+SECRETO = leerConfig("HuellaVotanteSecreto", "")
+RESPALDO_LEGADO = leerConfig("HuellaVotanteRespaldoLegado", False, bool)
+
+_secreto = SECRETO.encode("utf-8")
+
+
+def huellaVotante(usuarioID: int, preguntaID: int, seleccion: int = 0) -> bytes:
+    if not _secreto:
+        raise ValueError("HuellaVotanteSecreto no está configurado")
+    mensaje = f"{usuarioID}:{preguntaID}" if seleccion == 0 else f"{usuarioID}:{preguntaID}:{seleccion}"
+    return hmac.new(_secreto, mensaje.encode("utf-8"), hashlib.sha256).digest()
+
+
+def huellaUsuario(usuarioID: int) -> bytes:
+    if not _secreto:
+        raise ValueError("HuellaVotanteSecreto no está configurado")
+    # Prefijo propio: no coincide con ningún mensaje de huellaVotante
+    return hmac.new(_secreto, f"usuario:{usuarioID}".encode("utf-8"), hashlib.sha256).digest()
+
+
+def huellasDeUsuario(usuarioID: int, preguntas: Iterable[Tuple[int, int]]) -> List[bytes]:
+    """Todas las huellas posibles del usuario para pares (preguntaID, maxSelecciones)."""
+    return [
+        huellaVotante(usuarioID, preguntaID, seleccion)
+        for preguntaID, maxSelecciones in preguntas
+        for seleccion in range(max(maxSelecciones or 1, 1))
+    ]
+
+
+# Filas sin huella que pueden pertenecer al usuario: las cifradas en SQL Server
+# se descifran y comparan en la base de datos (mismo texto plano que usa votar);
+# las cifradas en proceso se traen y se verifican en Python con `perteneceA`.
+consultaFilasLegadas = etiquetar(
+    text("""
+        SELECT respuestaParticipanteID, preguntaID, ncRespuesta
+        FROM pv_respuestaParticipante
+        WHERE huellaVotante IS NULL
+          AND (:preguntaID IS NULL OR preguntaID = :preguntaID)
+          AND (SUBSTRING(ncRespuesta, 1, 1) = :versionLocal
+               OR DECRYPTBYPASSPHRASE(:llave, ncRespuesta) = CONVERT(VARBINARY(256), :usuario))
+        ORDER BY preguntaID, respuestaParticipanteID
+    """),
+    "huella.filasLegadas",
+)
+
+consultaHuellasDeUsuario = etiquetar(
+    select(RespuestaParticipante.huellaVotante).where(RespuestaParticipante.huellaUsuario == bindparam("huellaUsuario")),
+    "huella.huellasDeUsuario",
+)
+
+
+async def completarHuellas(session, usuarioID: int, llave: str, preguntaID: int = None) -> int:
+    """
+    Asigna `huellaVotante` y `huellaUsuario` a los votos del usuario que
+    todavía no tienen huella.
+    Requiere la llave descifrada del usuario. Retorna cuántas filas actualizó.
+
+    Varias filas legadas de la misma pregunta (selección múltiple, o votos
+    repetidos de antes del índice único) reciben selecciones sucesivas en el
+    orden en que se insertaron, saltando las huellas que el usuario ya tiene:
+    la primera queda con la huella de un voto simple y ninguna choca con el
+    índice.
+    """
+    result = await session.execute(
+        consultaFilasLegadas,
+        {
+            "preguntaID": preguntaID,
+            "versionLocal": bytes([CifradoAesGcm.version]),
+            "llave": llave,
+            "usuario": str(usuarioID),
+        },
+    )
+    propia = huellaUsuario(usuarioID)
+    legadas = [row for row in result if perteneceA(llave, usuarioID, row.ncRespuesta) is not False]
+    if not legadas:
+        return 0
+    usadas = set((await session.execute(consultaHuellasDeUsuario, {"huellaUsuario": propia})).scalars())
+    siguiente = {}
+    filas = []
+    for row in legadas:
+        seleccion = siguiente.get(row.preguntaID, 0)
+        huella = huellaVotante(usuarioID, row.preguntaID, seleccion)
+        while huella in usadas:
+            seleccion += 1
+            huella = huellaVotante(usuarioID, row.preguntaID, seleccion)
+        usadas.add(huella)
+        siguiente[row.preguntaID] = seleccion + 1
+        filas.append({"respuestaParticipanteID": row.respuestaParticipanteID, "huellaVotante": huella, "huellaUsuario": propia})
+    if filas:
+        await session.execute(update(RespuestaParticipante), filas)
+    return len(filas)
+
+
+consultaSinHuellaUsuario = etiquetar(
+    select(RespuestaParticipante.respuestaParticipanteID)
+    .where(RespuestaParticipante.huellaUsuario.is_(None))
+    .where(RespuestaParticipante.huellaVotante.in_(bindparam("huellas", expanding=True))),
+    "huella.sinHuellaUsuario",
+)
+
+
+async def completarHuellaUsuario(session, usuarioID: int, preguntas: List[Tuple[int, int]], porConsulta: int = 1000) -> int:
+    """
+    Asigna `huellaUsuario` a los votos del usuario que ya tienen
+    `huellaVotante` (no requiere su llave). `preguntas` son pares (preguntaID,
+    maxSelecciones) de todo el catálogo. Retorna cuántas filas actualizó.
+    """
+    huellas = huellasDeUsuario(usuarioID, preguntas)
+    propia = huellaUsuario(usuarioID)
+    ids = []
+    # SQL Server admite como máximo 2100 parámetros por sentencia
+    for inicio in range(0, len(huellas), porConsulta):
+        result = await session.execute(consultaSinHuellaUsuario, {"huellas": huellas[inicio:inicio + porConsulta]})
+        ids.extend(result.scalars())
+    if ids:
+        await session.execute(
+            update(RespuestaParticipante),
+            [{"respuestaParticipanteID": id, "huellaUsuario": propia} for id in ids],
+        )
+    return len(ids)
@@ -0,0 +1,117 @@
+"""
+Instrumentación por petición del camino caliente.
+
+Con `InstrumentacionHabilitada=true`, cada petición que pasa por `api` lleva una
+`Medicion` en un ContextVar. Los eventos del engine cuentan sentencias, idas a
+la base de datos y tiempo en SQL; `marcarEtapa("auth")` registra el tiempo
+transcurrido desde la etapa anterior. Al terminar se escribe una línea de log
+JSON y se devuelve el header `Server-Timing`.
+
+Deshabilitada, no se registran listeners y `marcarEtapa` solo lee el ContextVar.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from .database import alCrearEngine, leerConfig
+
+HABILITADA = leerConfig("InstrumentacionHabilitada", False, bool)
+
+_medicionActual: ContextVar[Optional["Medicion"]] = ContextVar("medicion", default=None)
+
+
+class Medicion:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.activa = True
+        self.inicio = time.perf_counter()
+        self.ultimaMarca = self.inicio
+        self.etapas = []
+        self.sentencias = 0
+        self.idas = 0
+        self.tiempoDb = 0.0
+        self.porSql = Counter()
+
+    def marcar(self, etapa: str):
+        ahora = time.perf_counter()
+        self.etapas.append((etapa, ahora - self.ultimaMarca))
+        self.ultimaMarca = ahora
+
+    def total(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def serverTiming(self) -> str:
+        partes = [f'{nombre};dur={segundos * 1000:.1f}' for nombre, segundos in self.etapas]
+        partes.append(f'db;dur={self.tiempoDb * 1000:.1f};desc="{self.sentencias} sentencias/{self.idas} idas"')
+        partes.append(f'total;dur={self.total() * 1000:.1f}')
+        return ", ".join(partes)
+
+    def resumen(self, status_code: int = None) -> dict:
+        repetida, vecesRepetida = self.porSql.most_common(1)[0] if self.porSql else (None, 0)
+        return {
+            "endpoint": self.nombre,
+            "status": status_code,
+            "totalMs": round(self.total() * 1000, 2),
+            "dbMs": round(self.tiempoDb * 1000, 2),
+            "sentencias": self.sentencias,
+            "idas": self.idas,
+            "etapasMs": {nombre: round(segundos * 1000, 2) for nombre, segundos in self.etapas},
+            # Una misma sentencia ejecutada muchas veces en una petición suele ser un N+1
+            "sentenciaMasRepetida": {"sql": repetida[:120], "veces": vecesRepetida} if vecesRepetida > 1 else None,
+        }
+
+
+def marcarEtapa(etapa: str):
+    medicion = _medicionActual.get()
+    if medicion is not None:
+        medicion.marcar(etapa)
+
+
+@contextmanager
+def medirPeticion(nombre: str):
+    """Abre una `Medicion` para la petición en curso; produce None si está deshabilitada."""
+    if not HABILITADA:
+        yield None
+        return
+    medicion = Medicion(nombre)
+    token = _medicionActual.set(medicion)
+    try:
+        yield medicion
+    finally:
+        medicion.activa = False
+        _medicionActual.reset(token)
+
+
+def registrarMedicion(medicion: Medicion, status_code: int):
+    logging.info(json.dumps({"instrumentacion": medicion.resumen(status_code)}))
+
+
+def _antesDeEjecutar(conn, cursor, statement, parameters, context, executemany):
+    medicion = _medicionActual.get()
+    if medicion is None or not medicion.activa:
+        return
+    conn.info["instrumentacionInicio"] = time.perf_counter()
+    medicion.idas += 1
+    medicion.sentencias += len(parameters) if executemany else 1
+    medicion.porSql[statement] += 1
+
+
+def _despuesDeEjecutar(conn, cursor, statement, parameters, context, executemany):
+    medicion = _medicionActual.get()
+    inicio = conn.info.pop("instrumentacionInicio", None)
+    if medicion is None or inicio is None:
+        return
+    medicion.tiempoDb += time.perf_counter() - inicio
+
+
+def _instrumentar(engine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _antesDeEjecutar)
+    event.listen(engine.sync_engine, "after_cursor_execute", _despuesDeEjecutar)
+
+
+if HABILITADA:
+    alCrearEngine(_instrumentar)
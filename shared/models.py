@@ -4,12 +4,15 @@ from sqlalchemy import (
     ForeignKey,
     VARBINARY,
     Integer,
+    BigInteger,
     LargeBinary,
     String,
     DateTime,
-    Numeric
+    Numeric,
+    Index,
+    text
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, configure_mappers
 from datetime import datetime
 from .database import Base
 
@@ -69,6 +72,14 @@ class Segmento(Base):
     def __repr__(self):
         return f"<Segmento(id={self.segmentoID}, nombre={self.nombre})>"
 
+class UsuarioSegmento(Base):
+    # Pertenencia de un usuario a un segmento (scripts/sql/participacion_votacion.sql)
+    __tablename__ = 'pv_usuarioSegmento'
+    __table_args__ = {'extend_existing': True}
+
+    usuarioID = Column(Integer, ForeignKey('pv_usuarios.userid'), primary_key=True)
+    segmentoID = Column(Integer, ForeignKey('pv_segmento.segmentoID'), primary_key=True)
+
 class SegmentoPropuesta(Base):
     __tablename__ = 'pv_propuestaSegmentosDirigidos'
     __table_args__ = {'extend_existing': True}
@@ -204,6 +215,8 @@ class Votacion(Base):
     ultimaModificacion = Column(DateTime, nullable=False)
     privada = Column(Boolean, nullable=False)
     esSecreta = Column(Boolean, nullable=False)
+    restriccionesIP = Column(String, nullable=True)  # JSON: lista CIDR, ver shared/restricciones.py
+    horariosPermitidos = Column(String, nullable=True)  # JSON: lista "HH:mm-HH:mm"
 
     preguntas = relationship("VotacionPregunta", back_populates="votacion")
     propuestas = relationship("PropuestaVotacion", back_populates="votacion")
@@ -289,7 +302,39 @@ class Permiso(Base):
 
 class RespuestaParticipante(Base):
     __tablename__ = 'pv_respuestaParticipante'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Único solo entre filas con huella: los votos anteriores quedan en NULL hasta el backfill
+        Index(
+            'UX_pv_respuestaParticipante_huellaVotante',
+            'huellaVotante',
+            unique=True,
+            mssql_where=text('huellaVotante IS NOT NULL'),
+            # listarVotos ordena y pagina por fecha sin leer las filas completas
+            mssql_include=['fechaRespuesta'],
+        ),
+        # Votos de un usuario en orden de listarVotos, con una sola búsqueda
+        Index(
+            'IX_pv_respuestaParticipante_huellaUsuario',
+            'huellaUsuario',
+            'fechaRespuesta',
+            'respuestaParticipanteID',
+            mssql_where=text('huellaUsuario IS NOT NULL'),
+        ),
+        # Verificación de recibos (shared/recibos.py)
+        Index(
+            'UX_pv_respuestaParticipante_tokenGUID',
+            'tokenGUID',
+            unique=True,
+            mssql_include=['preguntaID', 'fechaRespuesta'],
+        ),
+        # Refresco del filtro de recibos por ventana de fechaRespuesta
+        Index(
+            'IX_pv_respuestaParticipante_fechaRespuesta',
+            'fechaRespuesta',
+            mssql_include=['tokenGUID'],
+        ),
+        {'extend_existing': True},
+    )
     respuestaParticipanteID = Column(Integer, primary_key=True, autoincrement=True)
     preguntaID = Column(Integer, ForeignKey('pv_preguntas.preguntaID'), nullable=False)
     respuestaID = Column(Integer, ForeignKey('pv_respuestas.respuestaID'), nullable=False)
@@ -299,11 +344,48 @@ class RespuestaParticipante(Base):
     ncRespuesta = Column(VARBINARY(256), nullable=False)
     tokenGUID = Column(String(36), nullable=False)  # Storing as string for UUID
     pesoRespuesta = Column(Integer, ForeignKey('pv_pesoRespuesta.pesoID'), nullable=False)
+    huellaVotante = Column(VARBINARY(32), nullable=True)  # HMAC(usuario, pregunta), ver shared/huella.py
+    huellaUsuario = Column(VARBINARY(32), nullable=True)  # HMAC(usuario), ver shared/huella.py
     
     pregunta = relationship("Pregunta")
     respuesta = relationship("Respuesta")
     peso = relationship("PesoRespuesta", back_populates="respuestas_participantes")
 
+
+class ConteoRespuesta(Base):
+    # Resultados incrementales (shared/resultados.py): cada respuesta se reparte en
+    # `ResultadosCubetas` filas para que los votos concurrentes no esperen la misma
+    __tablename__ = 'pv_conteoRespuesta'
+    __table_args__ = {'extend_existing': True}
+    preguntaID = Column(Integer, ForeignKey('pv_preguntas.preguntaID'), primary_key=True)
+    respuestaID = Column(Integer, ForeignKey('pv_respuestas.respuestaID'), primary_key=True)
+    cubeta = Column(Integer, primary_key=True, autoincrement=False)
+    votos = Column(BigInteger, nullable=False)
+    votosPonderados = Column(Numeric(18, 2), nullable=False)
+    ultimaModificacion = Column(DateTime, nullable=False)
+
+class Participacion(Base):
+    # Votos por minuto (minutos=1) o por hora ya compactada (minutos=60), ver shared/participacion.py.
+    # segmentoID 0 es el total de la votación.
+    __tablename__ = 'pv_participacion'
+    __table_args__ = {'extend_existing': True}
+    votacionID = Column(Integer, ForeignKey('pv_votacion.votacionID'), primary_key=True)
+    segmentoID = Column(Integer, primary_key=True, autoincrement=False)
+    inicio = Column(DateTime, primary_key=True)
+    minutos = Column(Integer, primary_key=True, autoincrement=False)
+    cubeta = Column(Integer, primary_key=True, autoincrement=False)
+    votos = Column(BigInteger, nullable=False)
+
+class VotacionPeso(Base):
+    # Peso (pv_pesoRespuesta) de los votos de cada segmento en una votación; lo
+    # resuelve el servidor al votar (shared/boletas.py). segmentoID 0 son todos
+    # los votantes (scripts/sql/votacion_peso.sql)
+    __tablename__ = 'pv_votacionPeso'
+    __table_args__ = {'extend_existing': True}
+    votacionID = Column(Integer, ForeignKey('pv_votacion.votacionID'), primary_key=True)
+    segmentoID = Column(Integer, primary_key=True, autoincrement=False)
+    pesoID = Column(Integer, ForeignKey('pv_pesoRespuesta.pesoID'), nullable=False)
+
 class UsuarioPermiso(Base):
     __tablename__ = 'pv_usuariosPermisos'
     __table_args__ = {'extend_existing': True}
@@ -324,4 +406,12 @@ class UsuarioPermiso(Base):
     fechaRespuesta = Column(DateTime)
     ncRespuesta = Column(VARBINARY)
     tokenGUID = Column(String, unique=True)
-    pesoRespuesta = Column(Integer, ForeignKey("pv_pesoRespuesta.pesoID"),nullable=False)"""
\ No newline at end of file
+    pesoRespuesta = Column(Integer, ForeignKey("pv_pesoRespuesta.pesoID"),nullable=False)"""
+
+
+def configurarMappers():
+    """
+    Resuelve relaciones y mappers ahora en vez de en la primera consulta; se
+    llama desde el warm-up para sacar ese costo del camino de la primera petición.
+    """
+    configure_mappers()
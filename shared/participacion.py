@@ -0,0 +1,196 @@
+"""
+Participación por minuto de cada votación, mantenida de forma incremental.
+
+Seguir la participación mientras la votación está abierta obligaba a agrupar
+`pv_respuestaParticipante` por minuto de `fechaRespuesta` en cada refresco.
+`pv_participacion` guarda los votos por (votación, segmento, minuto) y se
+actualiza en la misma transacción que inserta los votos, junto con los
+contadores de `shared.resultados` y con las mismas cubetas
+(`ResultadosCubetas`) para que los votos del mismo minuto no esperen la misma
+fila. `segmentoID = 0` es el total; además se cuenta un voto en cada segmento
+dirigido de la votación al que pertenece el votante (`pv_usuarioSegmento`).
+
+Al cerrar la votación, `scripts/compactar_participacion.py` reemplaza los
+minutos por horas (`minutos = 60`). `serieParticipacion` lee ambas
+granularidades, así que los votos que el diario inserte después de compactar
+no se pierden.
+"""
+from collections import defaultdict
+from datetime import datetime
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from .models import Participacion, UsuarioSegmento
+from .resultados import CUBETAS
+from .statements import etiquetar
+
+TOTAL = 0
+MINUTO = 1
+HORA = 60
+# DATETIME de SQL Server no admite fechas anteriores a 1753
+SIN_DESDE = datetime(1900, 1, 1)
+
+consultaSegmentosDeUsuario = etiquetar(
+    select(UsuarioSegmento.segmentoID).where(
+        UsuarioSegmento.usuarioID == bindparam("usuarioID"),
+        UsuarioSegmento.segmentoID.in_(bindparam("segmentos", expanding=True)),
+    ),
+    "participacion.segmentosDeUsuario",
+)
+
+actualizarParticipacion = etiquetar(
+    update(Participacion)
+    .where(
+        Participacion.votacionID == bindparam("deLaVotacion"),
+        Participacion.segmentoID == bindparam("delSegmento"),
+        Participacion.inicio == bindparam("delInicio"),
+        Participacion.minutos == MINUTO,
+        Participacion.cubeta == bindparam("deLaCubeta"),
+    )
+    .values(votos=Participacion.votos + bindparam("deltaVotos"))
+    .execution_options(synchronize_session=False),
+    "participacion.sumar",
+)
+
+consultaSerie = etiquetar(
+    select(
+        Participacion.segmentoID,
+        Participacion.inicio,
+        Participacion.minutos,
+        func.sum(Participacion.votos).label("votos"),
+    )
+    .where(
+        Participacion.votacionID == bindparam("votacionID"),
+        Participacion.inicio >= bindparam("desde"),
+        Participacion.segmentoID.in_(bindparam("segmentos", expanding=True)),
+    )
+    .group_by(Participacion.segmentoID, Participacion.inicio, Participacion.minutos)
+    .order_by(Participacion.inicio),
+    "participacion.serie",
+)
+
+
+# UPDLOCK + HOLDLOCK: los minutos leídos y el rango de la votación quedan
+# bloqueados hasta el commit, así que un voto que llegue mientras se compacta
+# (por ejemplo, del diario) espera y cae en una fila nueva en vez de sumarse a
+# una fila que el DELETE borra sin haberla contado. SQL Server ignora
+# FOR UPDATE; `with_for_update` cubre a los demás motores
+consultaParaCompactar = etiquetar(
+    select(Participacion.segmentoID, Participacion.inicio, Participacion.minutos, Participacion.votos)
+    .where(Participacion.votacionID == bindparam("votacionID"))
+    .with_hint(Participacion, "WITH (UPDLOCK, HOLDLOCK)", "mssql")
+    .with_for_update(),
+    "participacion.paraCompactar",
+)
+
+
+def _minuto(fecha: datetime) -> datetime:
+    return fecha.replace(second=0, microsecond=0)
+
+
+def _hora(fecha: datetime) -> datetime:
+    return fecha.replace(minute=0, second=0, microsecond=0)
+
+
+async def segmentosDelVotante(session, usuarioID: int, segmentosDirigidos: Iterable[int]) -> Tuple[int, ...]:
+    """Segmentos dirigidos de la votación a los que pertenece el usuario (sin consulta si no hay ninguno)."""
+    segmentosDirigidos = list(segmentosDirigidos)
+    if not segmentosDirigidos:
+        return ()
+    result = await session.execute(consultaSegmentosDeUsuario, {"usuarioID": usuarioID, "segmentos": segmentosDirigidos})
+    return tuple(sorted(result.scalars().all()))
+
+
+async def segmentosYPeso(session, usuarioID: int, boleta) -> Tuple[Tuple[int, ...], int]:
+    """
+    Segmentos dirigidos de `boleta` a los que pertenece el usuario y el pesoID
+    de sus votos (`Boleta.pesoDelVotante`), con una sola consulta de pertenencia.
+    """
+    propios = await segmentosDelVotante(session, usuarioID, boleta.segmentos | boleta.segmentosConPeso)
+    return tuple(s for s in propios if s in boleta.segmentos), boleta.pesoDelVotante(propios)
+
+
+async def sumarParticipacion(session, votos: Iterable[Tuple[int, Iterable[int], datetime]]):
+    """
+    Suma votos (votacionID, segmentos del votante, fechaRespuesta) a sus
+    minutos. Como `sumarVotos`, va en la transacción que inserta los votos.
+    """
+    deltas: Dict[Tuple[int, int, datetime], int] = defaultdict(int)
+    for votacionID, segmentos, fecha in votos:
+        minuto = _minuto(fecha)
+        for segmentoID in (TOTAL, *segmentos):
+            deltas[(votacionID, segmentoID, minuto)] += 1
+    cubeta = random.randrange(CUBETAS)
+    for (votacionID, segmentoID, inicio), cantidad in sorted(deltas.items()):
+        parametros = {
+            "deLaVotacion": votacionID, "delSegmento": segmentoID, "delInicio": inicio,
+            "deLaCubeta": cubeta, "deltaVotos": cantidad,
+        }
+        if (await session.execute(actualizarParticipacion, parametros)).rowcount:
+            continue
+        try:
+            async with session.begin_nested():
+                await session.execute(insert(Participacion), [{
+                    "votacionID": votacionID, "segmentoID": segmentoID, "inicio": inicio,
+                    "minutos": MINUTO, "cubeta": cubeta, "votos": cantidad,
+                }])
+        except IntegrityError:
+            await session.execute(actualizarParticipacion, parametros)
+
+
+async def serieParticipacion(
+    session, votacionID: int, segmentos: Iterable[int] = (), desde: Optional[datetime] = None, porHora: bool = False
+) -> Dict[int, List[dict]]:
+    """
+    Serie por segmento (`TOTAL` incluido) de {"inicio", "minutos", "votos"},
+    en orden. Los minutos que ya se compactaron aparecen como horas; con
+    `porHora` todo se agrupa por hora. Con `desde` se incluye la hora que lo
+    contiene.
+    """
+    desde = desde or SIN_DESDE
+    filas = (await session.execute(consultaSerie, {
+        "votacionID": votacionID,
+        "desde": _hora(desde),
+        "segmentos": [TOTAL, *segmentos],
+    })).all()
+    puntos: Dict[int, Dict[Tuple[datetime, int], int]] = defaultdict(lambda: defaultdict(int))
+    for fila in filas:
+        if porHora or fila.minutos == HORA:
+            clave = (_hora(fila.inicio), HORA)
+        elif fila.inicio >= desde:
+            clave = (fila.inicio, MINUTO)
+        else:
+            continue
+        puntos[fila.segmentoID][clave] += int(fila.votos)
+    return {
+        segmentoID: [
+            {"inicio": inicio, "minutos": minutos, "votos": votos}
+            for (inicio, minutos), votos in sorted(serie.items())
+        ]
+        for segmentoID, serie in puntos.items()
+    }
+
+
+async def compactar(session, votacionID: int) -> Tuple[int, int]:
+    """
+    Reemplaza los minutos de la votación por horas, sumando todas las
+    cubetas. Retorna (filas de minuto borradas, filas de hora escritas).
+    La lectura bloquea las filas que se van a borrar: `session` debe ser la
+    transacción que hace el DELETE (`unidadDeTrabajo`).
+    """
+    filas = (await session.execute(consultaParaCompactar, {"votacionID": votacionID})).all()
+    minutos = sum(1 for fila in filas if fila.minutos == MINUTO)
+    if not minutos:
+        return 0, 0
+    horas: Dict[Tuple[int, datetime], int] = defaultdict(int)
+    for fila in filas:
+        horas[(fila.segmentoID, _hora(fila.inicio))] += int(fila.votos)
+    await session.execute(
+        delete(Participacion).where(Participacion.votacionID == votacionID).execution_options(synchronize_session=False)
+    )
+    await session.execute(insert(Participacion), [
+        {"votacionID": votacionID, "segmentoID": segmentoID, "inicio": inicio, "minutos": HORA, "cubeta": 0, "votos": votos}
+        for (segmentoID, inicio), votos in sorted(horas.items())
+    ])
+    return minutos, len(horas)
@@ -0,0 +1,269 @@
+"""
+Verificación de recibos de voto (`tokenGUID`).
+
+Cada voto devuelve un `tokenGUID` como recibo. `verificarRecibo` lo busca por el
+índice único de `tokenGUID`, pero antes lo pasa por un filtro de Bloom en
+memoria con todos los tokens registrados: un token inventado o mal copiado se
+rechaza sin ir a la base de datos, lo que importa cuando las verificaciones se
+disparan al cierre de una votación.
+
+El filtro se carga completo en la primera verificación y después crece de forma
+incremental: lee las filas con `respuestaParticipanteID` mayor al último visto
+(volviendo a leer los últimos `RecibosMargenIds`) y también las de los últimos
+`RecibosVentanaSegundos` por `fechaRespuesta`, porque una transacción que tomó
+su ID antes puede confirmar tarde y quedar por debajo del margen. Además
+recibe los tokens que este worker inserta y se reconstruye completo cada
+`RecibosReconstruccionSegundos` (o al llenarse, con el doble de capacidad). La
+reconstrucción corre en una tarea de fondo, una a la vez, que lanza la
+verificación que la encuentra vencida; mientras tanto las verificaciones se
+responden con el filtro anterior, que se reemplaza al terminar (con los tokens
+que este worker insertó en el intervalo). Un token que no está en el filtro provoca a
+lo sumo un refresco cada `RecibosRefrescoSegundos` antes de rechazarse, así
+que los votos recién insertados por otros workers también se encuentran.
+
+Un filtro de Bloom no tiene falsos negativos sobre lo que cargó, pero un voto
+que confirmó más tarde que la ventana puede no estar cargado hasta la
+siguiente reconstrucción. Por eso un rechazo del filtro no es definitivo:
+`buscar` lo informa como tal y solo la consulta por índice dice que un recibo
+no existe. Los falsos positivos (`RecibosBloomErrorRate`) solo cuestan esa
+consulta, que se haría de todos modos.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import bindparam, select
+from .database import get_read_session, leerConfig
+from .models import Pregunta, RespuestaParticipante, VotacionPregunta, Votacion
+from .statements import etiquetar
+
+CAPACIDAD = leerConfig("RecibosBloomCapacidad", 1_000_000, int)
+TASA_FALSOS_POSITIVOS = leerConfig("RecibosBloomErrorRate", 0.001, float)
+INTERVALO_REFRESCO = leerConfig("RecibosRefrescoSegundos", 5.0, float)
+MARGEN_IDS = leerConfig("RecibosMargenIds", 1000, int)
+VENTANA_SEGUNDOS = leerConfig("RecibosVentanaSegundos", 60.0, float)
+RECONSTRUCCION_SEGUNDOS = leerConfig("RecibosReconstruccionSegundos", 900.0, float)
+LOTE_CARGA = 50_000
+
+consultaTokensDesde = etiquetar(
+    select(RespuestaParticipante.respuestaParticipanteID, RespuestaParticipante.tokenGUID)
+    .where(RespuestaParticipante.respuestaParticipanteID > bindparam("desde"))
+    .order_by(RespuestaParticipante.respuestaParticipanteID)
+    .limit(LOTE_CARGA),
+    "recibos.tokensDesde",
+)
+
+# Votos recientes por fecha, sin importar su ID: cubre las confirmaciones tardías
+consultaTokensRecientes = etiquetar(
+    select(RespuestaParticipante.tokenGUID)
+    .where(RespuestaParticipante.fechaRespuesta >= bindparam("desdeFecha")),
+    "recibos.tokensRecientes",
+)
+
+consultaRecibo = etiquetar(
+    select(
+        RespuestaParticipante.tokenGUID,
+        RespuestaParticipante.preguntaID,
+        RespuestaParticipante.fechaRespuesta,
+        Pregunta.enunciado,
+        Votacion.votacionID,
+        Votacion.titulo,
+    )
+    .join(Pregunta, RespuestaParticipante.preguntaID == Pregunta.preguntaID)
+    .join(VotacionPregunta, VotacionPregunta.preguntaID == Pregunta.preguntaID)
+    .join(Votacion, Votacion.votacionID == VotacionPregunta.votacionID)
+    .where(RespuestaParticipante.tokenGUID == bindparam("tokenGUID"))
+    .limit(1),
+    "recibos.porToken",
+)
+
+
+def normalizarToken(token: str) -> Optional[str]:
+    """Forma canónica (minúsculas con guiones) con la que `votar` guarda el token, o None si no es un UUID."""
+    try:
+        return str(uuid.UUID(token.strip()))
+    except (ValueError, AttributeError):
+        return None
+
+
+class FiltroBloom:
+    def __init__(self, capacidad: int, tasaFalsosPositivos: float):
+        self.capacidad = capacidad
+        self.bits = max(8, math.ceil(-capacidad * math.log(tasaFalsosPositivos) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacidad * math.log(2)))
+        self._arreglo = bytearray((self.bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, valor: str):
+        # Doble hashing (Kirsch-Mitzenmacher) sobre un solo digest
+        digest = hashlib.blake2b(valor.encode("ascii"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def agregar(self, valor: str):
+        for posicion in self._posiciones(valor):
+            self._arreglo[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += 1
+
+    def __contains__(self, valor: str) -> bool:
+        return all(self._arreglo[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(valor))
+
+
+class IndiceRecibos:
+    def __init__(self, capacidad: int = CAPACIDAD, tasaFalsosPositivos: float = TASA_FALSOS_POSITIVOS):
+        self.capacidad = capacidad
+        self.tasaFalsosPositivos = tasaFalsosPositivos
+        self._filtro: Optional[FiltroBloom] = None
+        self._ultimoID = 0
+        self._ultimoRefresco = 0.0
+        self._ultimaCarga = 0.0
+        self._ventanaDesde: Optional[datetime] = None
+        self._bloqueo = asyncio.Lock()
+        self._reconstruccion: Optional[asyncio.Task] = None
+        self._pendientes: Optional[list] = None
+        self.rechazados = 0
+        self.consultas = 0
+        self.noEncontrados = 0
+
+    def agregar(self, tokenGUID: str):
+        """Anota un token recién insertado por este worker (no hace nada si el filtro no se cargó)."""
+        if self._filtro is not None:
+            self._filtro.agregar(tokenGUID.lower())
+        if self._pendientes is not None:
+            # Reconstrucción en curso: el filtro nuevo puede haber leído ya esa parte de la tabla
+            self._pendientes.append(tokenGUID.lower())
+
+    async def _leer(self, lectura, filtro: FiltroBloom, inicio: int, desde: int) -> int:
+        """Agrega al filtro los tokens con ID mayor a `inicio`; retorna el último ID leído."""
+        ultimoID = inicio
+        while True:
+            filas = (await lectura.execute(consultaTokensDesde, {"desde": inicio})).all()
+            for fila in filas:
+                filtro.agregar(fila.tokenGUID.lower())
+                if fila.respuestaParticipanteID <= desde:
+                    # Releída por el margen: ya estaba contada
+                    filtro.elementos -= 1
+            if filas:
+                inicio = ultimoID = filas[-1].respuestaParticipanteID
+            if len(filas) < LOTE_CARGA:
+                return ultimoID
+
+    async def _cargarCompleto(self, capacidad: int) -> Tuple[FiltroBloom, int, datetime]:
+        # fechaRespuesta se guarda con la hora local del worker que votó (datetime.now())
+        inicioCarga = datetime.now()
+        filtro = FiltroBloom(capacidad, self.tasaFalsosPositivos)
+        async with get_read_session() as lectura:
+            ultimoID = await self._leer(lectura, filtro, 0, 0)
+        logging.info(f"Filtro de recibos cargado: {filtro.elementos} tokens, {filtro.bits // 8} bytes")
+        return filtro, ultimoID, inicioCarga
+
+    def _usar(self, filtro: FiltroBloom, ultimoID: int, inicioCarga: datetime, ahora: float):
+        self._filtro = filtro
+        self._ultimoID = ultimoID
+        self._ventanaDesde = inicioCarga - timedelta(seconds=VENTANA_SEGUNDOS)
+        self._ultimaCarga = self._ultimoRefresco = ahora
+
+    def _programarReconstruccion(self, ahora: float):
+        """
+        Lanza la recarga completa en una tarea de fondo si toca (por tiempo o
+        porque el filtro se llenó) y no hay otra en curso.
+        """
+        if self._reconstruccion is not None:
+            return
+        lleno = self._filtro.elementos > self._filtro.capacidad
+        if not lleno and ahora - self._ultimaCarga < RECONSTRUCCION_SEGUNDOS:
+            return
+        # Si el filtro se llenó, se rehace con el doble de capacidad
+        capacidad = self._filtro.capacidad * 2 if lleno else self._filtro.capacidad
+        self._pendientes = []
+        self._reconstruccion = asyncio.get_running_loop().create_task(self._reconstruir(capacidad))
+
+    async def _reconstruir(self, capacidad: int):
+        try:
+            ahora = time.monotonic()
+            filtro, ultimoID, inicioCarga = await self._cargarCompleto(capacidad)
+            # El cambio espera al refresco incremental en curso, que escribe en el filtro anterior
+            async with self._bloqueo:
+                for tokenGUID in self._pendientes:
+                    filtro.agregar(tokenGUID)
+                self._usar(filtro, ultimoID, inicioCarga, ahora)
+        except Exception:
+            # Se sigue con el filtro anterior; se reintenta en el siguiente refresco
+            logging.exception("No se pudo reconstruir el filtro de recibos")
+        finally:
+            self._reconstruccion = None
+            self._pendientes = None
+
+    async def _refrescar(self):
+        ahora = time.monotonic()
+        if self._filtro is None:
+            # Primera carga: no hay filtro con qué responder mientras tanto
+            filtro, ultimoID, inicioCarga = await self._cargarCompleto(self.capacidad)
+            self._usar(filtro, ultimoID, inicioCarga, ahora)
+            return
+        inicioRefresco = datetime.now()
+        filtro, desde = self._filtro, self._ultimoID
+        async with get_read_session() as lectura:
+            # Ya están contados o se cuentan abajo al leerlos por ID
+            result = await lectura.execute(consultaTokensRecientes, {"desdeFecha": self._ventanaDesde})
+            for tokenGUID in result.scalars():
+                filtro.agregar(tokenGUID.lower())
+                filtro.elementos -= 1
+            ultimoID = await self._leer(lectura, filtro, max(0, desde - MARGEN_IDS), desde)
+        self._ultimoID = max(self._ultimoID, ultimoID)
+        self._ventanaDesde = inicioRefresco - timedelta(seconds=VENTANA_SEGUNDOS)
+        self._ultimoRefresco = ahora
+
+    async def _refrescarUnaVez(self, vencido: float):
+        """Refresca si nadie lo hizo desde `vencido` (las verificaciones concurrentes esperan un solo refresco)."""
+        async with self._bloqueo:
+            if self._filtro is None or self._ultimoRefresco <= vencido:
+                await self._refrescar()
+
+    async def puedeExistir(self, tokenGUID: str) -> bool:
+        """False si el filtro (recién refrescado) no tiene el token; True si hay que confirmarlo en la base de datos."""
+        if self._filtro is None:
+            await self._refrescarUnaVez(time.monotonic())
+        else:
+            self._programarReconstruccion(time.monotonic())
+        if tokenGUID in self._filtro:
+            return True
+        ahora = time.monotonic()
+        if ahora - self._ultimoRefresco >= INTERVALO_REFRESCO:
+            await self._refrescarUnaVez(ahora - INTERVALO_REFRESCO)
+            if tokenGUID in self._filtro:
+                return True
+        self.rechazados += 1
+        return False
+
+    async def buscar(self, session, tokenGUID: str) -> Tuple[Optional[object], bool]:
+        """
+        Busca el recibo `tokenGUID` (ya normalizado). Retorna (recibo o None,
+        definitivo): `definitivo` es False cuando solo el filtro lo rechazó, sin
+        consultar la base de datos.
+        """
+        if not await self.puedeExistir(tokenGUID):
+            return None, False
+        self.consultas += 1
+        recibo = (await session.execute(consultaRecibo, {"tokenGUID": tokenGUID})).first()
+        if recibo is None:
+            self.noEncontrados += 1
+        return recibo, True
+
+    def estadisticas(self) -> dict:
+        return {
+            "tokens": self._filtro.elementos if self._filtro is not None else 0,
+            "bytes": self._filtro.bits // 8 if self._filtro is not None else 0,
+            "ultimoID": self._ultimoID,
+            "rechazadosSinConsulta": self.rechazados,
+            "consultas": self.consultas,
+            "noEncontrados": self.noEncontrados,
+        }
+
+
+indiceRecibos = IndiceRecibos()
@@ -0,0 +1,164 @@
+"""
+Restricciones de IP y horario de una votación.
+
+`configurarVotacion` guarda `restriccionesIP` (lista CIDR) y
+`horariosPermitidos` ("HH:mm-HH:mm") como JSON en `pv_votacion`. Al cargar la
+boleta (`shared.boletas`) se compilan una sola vez:
+
+- `RangosIP`: los CIDR se convierten en intervalos de enteros, se ordenan y se
+  fusionan; una IP se busca con bisect, O(log n) sin importar cuántas redes haya.
+- `Horario`: los rangos se convierten a minutos del día (los que cruzan la
+  medianoche se parten en dos), se fusionan y se buscan igual.
+
+Así `votar` las verifica en microsegundos con la boleta en cache. Las horas se
+interpretan en la zona `HorariosZonaHoraria`.
+"""
+import ipaddress
+import json
+import socket
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+from .database import leerConfig
+
+ZONA_HORARIA = ZoneInfo(leerConfig("HorariosZonaHoraria", "America/Costa_Rica"))
+
+SALTOS_PROXY = max(1, leerConfig("XForwardedForSaltos", 1, int))
+
+_PREFIJO_IPV4_MAPEADA = bytes(10) + b"\xff\xff"
+
+
+def _fusionar(intervalos: Iterable[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    inicios, finales = [], []
+    for inicio, final in sorted(intervalos):
+        if finales and inicio <= finales[-1] + 1:
+            finales[-1] = max(finales[-1], final)
+        else:
+            inicios.append(inicio)
+            finales.append(final)
+    return inicios, finales
+
+
+class _Intervalos:
+    def __init__(self, intervalos: Iterable[Tuple[int, int]]):
+        self._inicios, self._finales = _fusionar(intervalos)
+
+    def _contiene(self, valor: int) -> bool:
+        posicion = bisect_right(self._inicios, valor) - 1
+        return posicion >= 0 and valor <= self._finales[posicion]
+
+    def __len__(self) -> int:
+        return len(self._inicios)
+
+
+class RangosIP:
+    """Conjunto de redes CIDR (IPv4 e IPv6) compilado a intervalos ordenados."""
+
+    def __init__(self, cidrs: Iterable[str]):
+        v4, v6 = [], []
+        for cidr in cidrs:
+            red = ipaddress.ip_network(cidr.strip(), strict=False)
+            (v4 if red.version == 4 else v6).append((int(red.network_address), int(red.broadcast_address)))
+        self._v4 = _Intervalos(v4)
+        self._v6 = _Intervalos(v6)
+
+    def __contains__(self, ip: str) -> bool:
+        # inet_pton es varias veces más rápido que ipaddress.ip_address en el camino de votar
+        try:
+            if ":" not in ip:
+                return self._v4._contiene(int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+            binario = socket.inet_pton(socket.AF_INET6, ip)
+        except (OSError, TypeError):
+            return False
+        if binario[:12] == _PREFIJO_IPV4_MAPEADA:
+            return self._v4._contiene(int.from_bytes(binario[12:], "big"))
+        return self._v6._contiene(int.from_bytes(binario, "big"))
+
+    def __len__(self) -> int:
+        return len(self._v4) + len(self._v6)
+
+
+def _minuto(hora: str) -> int:
+    horas, minutos = hora.strip().split(":")
+    horas, minutos = int(horas), int(minutos)
+    if not (0 <= horas <= 24 and 0 <= minutos < 60) or horas * 60 + minutos > 1440:
+        raise ValueError(f"Hora inválida: {hora}")
+    return horas * 60 + minutos
+
+
+class Horario(_Intervalos):
+    """Minutos del día permitidos, desde rangos "HH:mm-HH:mm" (el final es exclusivo)."""
+
+    def __init__(self, rangos: Iterable[str]):
+        intervalos = []
+        for rango in rangos:
+            desde, _, hasta = rango.partition("-")
+            inicio, final = _minuto(desde), _minuto(hasta)
+            if inicio < final:
+                intervalos.append((inicio, final - 1))
+            elif inicio > final:
+                # Cruza la medianoche
+                intervalos.append((inicio, 1439))
+                if final > 0:
+                    intervalos.append((0, final - 1))
+            else:
+                raise ValueError(f"Rango vacío: {rango}")
+        super().__init__(intervalos)
+
+    def permite(self, ahora: datetime) -> bool:
+        local = ahora.astimezone(ZONA_HORARIA)
+        return self._contiene(local.hour * 60 + local.minute)
+
+
+class Restricciones(NamedTuple):
+    ip: Optional[RangosIP]
+    horario: Optional[Horario]
+
+    def rechazo(self, ip: Optional[str], ahora: datetime = None) -> Optional[str]:
+        """Código del rechazo (`IP_NO_PERMITIDA`, `HORARIO_NO_PERMITIDO`) o None si se permite votar."""
+        if self.ip is not None and (ip is None or ip not in self.ip):
+            return "IP_NO_PERMITIDA"
+        if self.horario is not None and not self.horario.permite(ahora or datetime.now(timezone.utc)):
+            return "HORARIO_NO_PERMITIDO"
+        return None
+
+
+SIN_RESTRICCIONES = Restricciones(None, None)
+
+
+def compilarRestricciones(restriccionesIP: Optional[List[str]], horariosPermitidos: Optional[List[str]]) -> Restricciones:
+    """Lanza ValueError si algún CIDR u horario no es válido."""
+    if not restriccionesIP and not horariosPermitidos:
+        return SIN_RESTRICCIONES
+    return Restricciones(
+        RangosIP(restriccionesIP) if restriccionesIP else None,
+        Horario(horariosPermitidos) if horariosPermitidos else None,
+    )
+
+
+def restriccionesDeVotacion(votacion) -> Restricciones:
+    """Compila las columnas JSON de una `Votacion`."""
+    return compilarRestricciones(
+        json.loads(votacion.restriccionesIP) if votacion.restriccionesIP else None,
+        json.loads(votacion.horariosPermitidos) if votacion.horariosPermitidos else None,
+    )
+
+
+def ipDeSolicitud(req) -> Optional[str]:
+    """
+    IP del cliente según `X-Forwarded-For`. Se toma la entrada que agregó el
+    proxy de confianza (`XForwardedForSaltos` desde la derecha) y no la
+    primera, que el cliente puede inventar. Azure agrega el puerto.
+    """
+    entradas = [entrada.strip() for entrada in (req.headers.get("x-forwarded-for") or "").split(",") if entrada.strip()]
+    if len(entradas) < SALTOS_PROXY:
+        return None
+    ip = entradas[-SALTOS_PROXY]
+    if ip.startswith("["):
+        # [IPv6]:puerto
+        return ip[1:ip.index("]")] if "]" in ip else None
+    if ip.count(":") == 1:
+        # IPv4:puerto
+        return ip.split(":")[0]
+    return ip
@@ -0,0 +1,234 @@
+"""
+Resultados de una votación mantenidos de forma incremental.
+
+Contar los votos desde `pv_respuestaParticipante` obliga a agrupar la tabla
+completa y cruzarla con `pv_pesoRespuesta` en cada consulta. En su lugar,
+`pv_conteoRespuesta` lleva por (pregunta, respuesta) la cantidad de votos y la
+suma de `multiplicador` de su peso (un peso sin multiplicador cuenta 1).
+`sumarVotos` la actualiza en la misma transacción que inserta los votos:
+`votar` y `votarBoleta` por petición, y el diario de escritura diferida una vez
+por lote, con un UPDATE por respuesta distinta.
+
+Un solo contador por respuesta haría que todos los votos por la opción más
+votada esperaran el bloqueo de la misma fila hasta su commit. Cada respuesta se
+reparte en `ResultadosCubetas` filas y cada transacción suma en una al azar;
+los resultados suman las cubetas.
+
+Los contadores no llevan `votacionID`: suponen que cada pregunta pertenece a
+una sola votación. `configurarVotacion` rechaza asociar una pregunta que ya
+está en otra y `shared.boletas` no admite votos para una pregunta que los
+datos tengan en varias, así que no se mezclan conteos de dos votaciones.
+
+`scripts/recontar_resultados.py` recuenta desde los votos (`recontar`) y puede
+reconstruir los contadores (`reconstruir`).
+"""
+import random
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+from sqlalchemy import Numeric, and_, bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from .database import leerConfig
+from .models import ConteoRespuesta, PesoRespuesta, Pregunta, Respuesta, RespuestaParticipante, Votacion, VotacionPregunta
+from .statements import etiquetar
+
+CUBETAS = max(1, leerConfig("ResultadosCubetas", 8, int))
+PESOS_TTL_SEGUNDOS = 300.0
+
+_UNO = Decimal(1)
+_CENTIMOS = Decimal("0.01")
+
+consultaPesos = etiquetar(
+    select(PesoRespuesta.pesoID, PesoRespuesta.multiplicador),
+    "resultados.pesos",
+)
+
+actualizarConteo = etiquetar(
+    update(ConteoRespuesta)
+    .where(
+        # Nombres distintos de las columnas: SQLAlchemy los reserva para el SET
+        ConteoRespuesta.preguntaID == bindparam("deLaPregunta"),
+        ConteoRespuesta.respuestaID == bindparam("deLaRespuesta"),
+        ConteoRespuesta.cubeta == bindparam("deLaCubeta"),
+    )
+    .values(
+        votos=ConteoRespuesta.votos + bindparam("deltaVotos"),
+        votosPonderados=ConteoRespuesta.votosPonderados + bindparam("deltaPonderados", type_=Numeric(18, 2)),
+        ultimaModificacion=bindparam("ahora"),
+    )
+    .execution_options(synchronize_session=False),
+    "resultados.sumar",
+)
+
+_preguntasDeVotacion = select(VotacionPregunta.preguntaID).where(VotacionPregunta.votacionID == bindparam("votacionID"))
+
+consultaVotacion = etiquetar(
+    select(Votacion.votacionID, Votacion.titulo, Votacion.fechaInicio, Votacion.fechaFin)
+    .where(Votacion.votacionID == bindparam("votacionID")),
+    "resultados.votacion",
+)
+
+consultaResultados = etiquetar(
+    select(
+        Pregunta.preguntaID,
+        Pregunta.enunciado,
+        Respuesta.respuestaID,
+        Respuesta.respuesta,
+        func.coalesce(func.sum(ConteoRespuesta.votos), 0).label("votos"),
+        func.coalesce(func.sum(ConteoRespuesta.votosPonderados), 0).label("votosPonderados"),
+    )
+    .select_from(VotacionPregunta)
+    .join(Pregunta, Pregunta.preguntaID == VotacionPregunta.preguntaID)
+    .join(Respuesta, Respuesta.preguntaID == Pregunta.preguntaID)
+    .outerjoin(ConteoRespuesta, and_(
+        ConteoRespuesta.preguntaID == Respuesta.preguntaID,
+        ConteoRespuesta.respuestaID == Respuesta.respuestaID,
+    ))
+    .where(VotacionPregunta.votacionID == bindparam("votacionID"))
+    .group_by(
+        Pregunta.preguntaID, Pregunta.enunciado, Pregunta.order,
+        Respuesta.respuestaID, Respuesta.respuesta, Respuesta.order,
+    )
+    .order_by(Pregunta.order, Pregunta.preguntaID, Respuesta.order, Respuesta.respuestaID),
+    "resultados.porVotacion",
+)
+
+consultaConteos = etiquetar(
+    select(
+        ConteoRespuesta.preguntaID,
+        ConteoRespuesta.respuestaID,
+        func.sum(ConteoRespuesta.votos).label("votos"),
+        func.sum(ConteoRespuesta.votosPonderados).label("votosPonderados"),
+    )
+    .where(ConteoRespuesta.preguntaID.in_(_preguntasDeVotacion))
+    .group_by(ConteoRespuesta.preguntaID, ConteoRespuesta.respuestaID),
+    "resultados.conteos",
+)
+
+consultaRecuento = etiquetar(
+    select(
+        RespuestaParticipante.preguntaID,
+        RespuestaParticipante.respuestaID,
+        func.count().label("votos"),
+        func.sum(func.coalesce(PesoRespuesta.multiplicador, 1)).label("votosPonderados"),
+    )
+    .outerjoin(PesoRespuesta, PesoRespuesta.pesoID == RespuestaParticipante.pesoRespuesta)
+    .where(RespuestaParticipante.preguntaID.in_(_preguntasDeVotacion))
+    .group_by(RespuestaParticipante.preguntaID, RespuestaParticipante.respuestaID),
+    "resultados.recuento",
+)
+
+
+def _decimal(valor) -> Decimal:
+    # SQLite devuelve float en las sumas de Numeric
+    return Decimal(str(valor or 0)).quantize(_CENTIMOS)
+
+
+class PesosRespuesta:
+    """`multiplicador` por `pesoID`; la tabla es chica y casi no cambia."""
+
+    def __init__(self, ttl: float = PESOS_TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._multiplicadores: Dict[int, Decimal] = {}
+        self._cargado = float("-inf")
+
+    async def obtener(self, session, pesoIDs: Iterable[int]) -> Dict[int, Decimal]:
+        if not self._multiplicadores.keys() >= set(pesoIDs) or time.monotonic() - self._cargado > self.ttl:
+            filas = (await session.execute(consultaPesos)).all()
+            self._multiplicadores = {
+                fila.pesoID: _UNO if fila.multiplicador is None else _decimal(fila.multiplicador) for fila in filas
+            }
+            self._cargado = time.monotonic()
+        return self._multiplicadores
+
+
+pesosRespuesta = PesosRespuesta()
+
+
+async def sumarVotos(session, filas: List[dict]):
+    """
+    Suma las filas de `pv_respuestaParticipante` a sus contadores. Se llama en
+    la transacción (o savepoint) que las inserta, después del INSERT, para que
+    un voto duplicado deshaga también su conteo.
+    """
+    multiplicadores = await pesosRespuesta.obtener(session, {fila["pesoRespuesta"] for fila in filas})
+    deltas: Dict[Tuple[int, int], list] = {}
+    for fila in filas:
+        delta = deltas.setdefault((fila["preguntaID"], fila["respuestaID"]), [0, Decimal(0)])
+        delta[0] += 1
+        delta[1] += multiplicadores.get(fila["pesoRespuesta"], _UNO)
+    cubeta = random.randrange(CUBETAS)
+    ahora = datetime.now()
+    # Siempre en el mismo orden, para que dos lotes no se bloqueen en cruz
+    for (preguntaID, respuestaID), (votos, ponderados) in sorted(deltas.items()):
+        parametros = {
+            "deLaPregunta": preguntaID, "deLaRespuesta": respuestaID, "deLaCubeta": cubeta,
+            "deltaVotos": votos, "deltaPonderados": ponderados, "ahora": ahora,
+        }
+        if (await session.execute(actualizarConteo, parametros)).rowcount:
+            continue
+        try:
+            # Primer voto de la respuesta en esta cubeta
+            async with session.begin_nested():
+                await session.execute(insert(ConteoRespuesta), [{
+                    "preguntaID": preguntaID, "respuestaID": respuestaID, "cubeta": cubeta,
+                    "votos": votos, "votosPonderados": ponderados, "ultimaModificacion": ahora,
+                }])
+        except IntegrityError:
+            # Otra transacción la creó primero
+            await session.execute(actualizarConteo, parametros)
+
+
+async def obtenerResultados(session, votacionID: int):
+    """(votación, filas por respuesta con sus totales), o (None, []) si la votación no existe."""
+    votacion = (await session.execute(consultaVotacion, {"votacionID": votacionID})).first()
+    if votacion is None:
+        return None, []
+    return votacion, (await session.execute(consultaResultados, {"votacionID": votacionID})).all()
+
+
+class Diferencia(NamedTuple):
+    preguntaID: int
+    respuestaID: int
+    votos: int
+    votosContador: int
+    votosPonderados: Decimal
+    votosPonderadosContador: Decimal
+
+
+def _porRespuesta(filas) -> Dict[Tuple[int, int], Tuple[int, Decimal]]:
+    return {(fila.preguntaID, fila.respuestaID): (int(fila.votos or 0), _decimal(fila.votosPonderados)) for fila in filas}
+
+
+async def recontar(session, votacionID: int) -> Tuple[Dict[Tuple[int, int], Tuple[int, Decimal]], List[Diferencia]]:
+    """Recuenta la votación desde `pv_respuestaParticipante` y lo compara con los contadores."""
+    recuento = _porRespuesta((await session.execute(consultaRecuento, {"votacionID": votacionID})).all())
+    contadores = _porRespuesta((await session.execute(consultaConteos, {"votacionID": votacionID})).all())
+    cero = (0, _decimal(0))
+    diferencias = []
+    for clave in sorted(recuento.keys() | contadores.keys()):
+        votos, ponderados = recuento.get(clave, cero)
+        votosContador, ponderadosContador = contadores.get(clave, cero)
+        if (votos, ponderados) != (votosContador, ponderadosContador):
+            diferencias.append(Diferencia(*clave, votos, votosContador, ponderados, ponderadosContador))
+    return recuento, diferencias
+
+
+async def reconstruir(session, votacionID: int, recuento: Dict[Tuple[int, int], Tuple[int, Decimal]]):
+    """Reemplaza los contadores de la votación por `recuento` (todo en la cubeta 0)."""
+    await session.execute(
+        delete(ConteoRespuesta)
+        .where(ConteoRespuesta.preguntaID.in_(_preguntasDeVotacion))
+        .execution_options(synchronize_session=False),
+        {"votacionID": votacionID},
+    )
+    if recuento:
+        ahora = datetime.now()
+        await session.execute(insert(ConteoRespuesta), [
+            {
+                "preguntaID": preguntaID, "respuestaID": respuestaID, "cubeta": 0,
+                "votos": votos, "votosPonderados": ponderados, "ultimaModificacion": ahora,
+            }
+            for (preguntaID, respuestaID), (votos, ponderados) in recuento.items()
+        ])
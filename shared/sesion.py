@@ -0,0 +1,80 @@
+"""
+Tokens de sesión de votación.
+
+`sesionVotacion` autentica al votante una vez (cédula, contraseña y prueba de
+vida) y emite un token de vida corta para una votación y un usuario. `votar`
+lo verifica en proceso, sin consultar usuario, llave ni contraseña en la base
+de datos ni insertar otra prueba de vida por cada pregunta.
+
+El token es AES-256-GCM con una llave derivada de `SesionVotacionSecreto`: el
+tag de GCM lo firma y el cifrado oculta la llave descifrada del usuario, que
+`votar` necesita para cifrar `ncRespuesta`. Vence a los
+`SesionVotacionTtlSegundos` o al cierre de la votación, lo que ocurra antes.
+
+Mientras no vence, el token equivale a la llave descifrada: quien lo obtenga
+puede votar como el usuario, y con `SesionVotacionSecreto` también puede
+leer la llave. Por eso el TTL es corto (5 minutos por defecto, 15 como
+máximo).
+"""
+import base64
+import json
+import time
+from typing import NamedTuple, Tuple
+from .cifrado import CifradoAesGcm
+from .database import leerConfig
+
+SECRETO = leerConfig("SesionVotacionSecreto", "")
+TTL_MAXIMO_SEGUNDOS = 900
+TTL_SEGUNDOS = min(leerConfig("SesionVotacionTtlSegundos", 300, int), TTL_MAXIMO_SEGUNDOS)
+
+_cifrado = CifradoAesGcm(b"sesionVotacion")
+
+
+class TokenInvalido(ValueError):
+    pass
+
+
+class SesionVoto(NamedTuple):
+    usuarioID: int
+    votacionID: int
+    llave: str
+    expira: float
+
+
+def _secreto() -> str:
+    if not SECRETO:
+        raise ValueError("SesionVotacionSecreto no está configurado")
+    return SECRETO
+
+
+def emitirToken(usuarioID: int, votacionID: int, llave: str, vencimiento: float = None) -> Tuple[str, int]:
+    """Retorna (token, expira en segundos epoch)."""
+    expira = time.time() + TTL_SEGUNDOS
+    if vencimiento is not None:
+        expira = min(expira, vencimiento)
+    carga = json.dumps({"u": usuarioID, "v": votacionID, "k": llave, "e": int(expira)}, separators=(",", ":"))
+    token = base64.urlsafe_b64encode(_cifrado.cifrar(_secreto(), carga.encode("utf-8"))).rstrip(b"=")
+    return token.decode("ascii"), int(expira)
+
+
+def verificarToken(token: str) -> SesionVoto:
+    """Valida firma y vencimiento. Lanza `TokenInvalido`."""
+    try:
+        datos = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise TokenInvalido("Token de sesión mal formado")
+    carga = _cifrado.descifrar(_secreto(), datos) if datos[:1] == bytes([_cifrado.version]) else None
+    if carga is None:
+        raise TokenInvalido("Token de sesión inválido")
+    sesion = json.loads(carga)
+    if sesion["e"] < time.time():
+        raise TokenInvalido("Token de sesión vencido")
+    return SesionVoto(usuarioID=sesion["u"], votacionID=sesion["v"], llave=sesion["k"], expira=sesion["e"])
+
+
+def tokenDeSolicitud(req) -> str | None:
+    """Token del header `Authorization: Bearer ...`, si viene."""
+    autorizacion = req.headers.get("authorization") or ""
+    if autorizacion[:7].lower() == "bearer ":
+        return autorizacion[7:].strip() or None
+    return None
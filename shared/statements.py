@@ -0,0 +1,49 @@
+"""
+Sentencias precompiladas.
+
+Las consultas del camino caliente se construyen una sola vez a nivel de módulo
+con `bindparam(...)` y se ejecutan pasando los valores como parámetros. Así el
+objeto `Select` (y su cache key memoizada) se reutiliza en cada petición y
+SQLAlchemy encuentra el SQL compilado en su cache en vez de recompilarlo.
+
+Cada sentencia se etiqueta con `etiquetar(stmt, "nombre")`; un listener del
+engine cuenta hits y misses del cache de compilación por etiqueta.
+"""
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from .database import alCrearEngine
+
+
+_contadores = defaultdict(lambda: {"hits": 0, "misses": 0, "sinCache": 0})
+
+
+def etiquetar(stmt, nombre: str):
+    return stmt.execution_options(sentencia=nombre)
+
+
+def _contarCache(conn, cursor, statement, parameters, context, executemany):
+    if context is None:
+        return
+    nombre = context.execution_options.get("sentencia")
+    if nombre is None:
+        return
+    contador = _contadores[nombre]
+    if context.cache_hit == CACHE_HIT:
+        contador["hits"] += 1
+    elif context.cache_hit == CACHE_MISS:
+        contador["misses"] += 1
+    else:
+        contador["sinCache"] += 1
+
+
+alCrearEngine(lambda engine: event.listen(engine.sync_engine, "after_cursor_execute", _contarCache))
+
+
+def estadisticasCache() -> dict:
+    """Hits/misses del cache de compilación por sentencia etiquetada."""
+    return {nombre: dict(valores) for nombre, valores in _contadores.items()}
+
+
+def reiniciarEstadisticasCache():
+    _contadores.clear()
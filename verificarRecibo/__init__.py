@@ -0,0 +1,97 @@
+import logging
+import azure.functions as func
+from shared.codec import aJson
+from shared.database import get_read_session
+from shared.recibos import indiceRecibos, normalizarToken
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    tokenGUID = normalizarToken(req.route_params.get("tokenGUID") or req.params.get("tokenGUID") or "")
+    if tokenGUID is None:
+        return func.HttpResponse(
+            aJson({"error": "El recibo no tiene el formato de un tokenGUID", "codigo": "RECIBO_INVALIDO"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+    try:
+        async with get_read_session() as lectura:
+            recibo, definitivo = await indiceRecibos.buscar(lectura, tokenGUID)
+        if recibo is None:
+            return func.HttpResponse(
+                aJson({"tokenGUID": tokenGUID, "registrado": False, "definitivo": definitivo}),
+                status_code=404,
+                mimetype="application/json"
+            )
+        return func.HttpResponse(
+            aJson({
+                "tokenGUID": tokenGUID,
+                "registrado": True,
+                "votacion_id": recibo.votacionID,
+                "titulo_votacion": recibo.titulo,
+                "pregunta_id": recibo.preguntaID,
+                "enunciado_pregunta": recibo.enunciado,
+                "fecha_respuesta": recibo.fechaRespuesta,
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"Error al verificar recibo: {str(e)}", exc_info=True)
+        return func.HttpResponse(
+            aJson({"error": "Error interno del servidor"}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: verificarRecibo
+
+Ruta: GET /api/recibos/{tokenGUID}
+
+Descripción general:
+    Permite al votante confirmar que su voto quedó registrado con el
+    `tokenGUID` que le devolvió `votar` o `votarBoleta`.
+
+Lógica interna:
+    1. Valida que el recibo sea un UUID; si no, `400` sin tocar la base de datos.
+    2. Lo pasa por el filtro de Bloom de `shared.recibos`: si el filtro dice que
+       no existe (y ya se refrescó hace menos de `RecibosRefrescoSegundos`), se
+       responde `404` con `"definitivo": false` sin consultar la base de datos.
+       Así los tokens inventados no cuestan nada aunque lleguen en ráfaga al
+       cierre de una votación. No es un "no registrado" definitivo: un voto que
+       confirmó tarde puede no estar en el filtro hasta la siguiente
+       reconstrucción (`RecibosReconstruccionSegundos`), que corre en segundo
+       plano: ninguna verificación espera la recarga completa del filtro.
+    3. Si puede existir, lo busca por el índice único
+       `UX_pv_respuestaParticipante_tokenGUID` (`scripts/sql/token_guid.sql`)
+       en la réplica de lectura.
+
+Respuesta exitosa (200):
+{
+    "tokenGUID": "3c1df5b9-1bc5-48d3-a88a-dc0a0feae2fa",
+    "registrado": true,
+    "votacion_id": 1,
+    "titulo_votacion": "Presupuesto participativo 2025",
+    "pregunta_id": 1,
+    "enunciado_pregunta": "¿Aprueba el proyecto?",
+    "fecha_respuesta": "2025-06-20T15:30:00"
+}
+
+Flujo de respuesta:
+    - 200 OK: voto registrado
+    - 400 Bad Request: el recibo no es un UUID
+    - 404 Not Found: no se encontró el recibo ({"registrado": false}). Con
+      "definitivo": true se buscó en la base de datos; con false solo lo
+      rechazó el filtro y conviene volver a consultar más tarde
+    - 500 Internal Server Error: error inesperado
+
+Consideraciones:
+    - No devuelve la respuesta elegida: el recibo no debe servir para demostrar
+      a un tercero cómo votó alguien.
+    - Con `VotosEscrituraDiferida=true` el recibo aparece cuando el diario
+      inserta el voto (en general, menos de `VotosIntervaloSegundos`).
+    - El filtro es por worker y ocupa ~1.8 MB por millón de votos con la tasa
+      de falsos positivos por defecto (0.1 %).
+"""
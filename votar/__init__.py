@@ -1,407 +1,220 @@
+import asyncio
 import azure.functions as func
+from shared.codec import leerDto, aJson
 from shared.dtos import VotoDTO
-from shared.database import get_session
-from shared.models import Usuario, Log, LlaveUsuario, Documento, Pregunta, Respuesta, Votacion, VotacionPregunta, RespuestaParticipante
-from sqlalchemy import select, desc, text
-from sqlalchemy.orm import selectinload, Session, relationship, contains_eager
+from shared.database import unidadDeTrabajo, leerConfig, replicaDisponible, ReplicaNoDisponible
+from shared.auth import verificarCredenciales, registrarPruebaVida, CredencialesInvalidas, ErrorVerificacion
+from shared.sesion import verificarToken, tokenDeSolicitud, TokenInvalido
+from shared.instrumentacion import marcarEtapa
+from shared.huella import huellaVotante, huellaUsuario, completarHuellas, RESPALDO_LEGADO
+from shared.boletas import obtenerBoleta, cacheBoletas, PreguntaEnVariasVotaciones
+from shared.diario import diarioVotos, HABILITADO as ESCRITURA_DIFERIDA
+from shared.recibos import indiceRecibos
+from shared.resultados import sumarVotos
+from shared.participacion import segmentosYPeso, sumarParticipacion
+from shared.restricciones import ipDeSolicitud
+from shared.cifrado import cifradoLocal, cifrarUsuario, cifrarUsuarioSql
+from shared.models import RespuestaParticipante
+from sqlalchemy.exc import IntegrityError
 from pydantic import ValidationError
-import json
-import logging
-from datetime import datetime, timezone
-import base64
-import hashlib 
-from typing import Optional, List
-import uuid 
+from datetime import datetime
+import hashlib
+import uuid
 
-def validarVotoUsuario(registro_respuesta_participante: dict, json_votacion_completa: dict) -> bool:
+# Si la boleta no está en cache y hay réplica, se lee en ella mientras se verifican las credenciales
+LECTURAS_CONCURRENTES = leerConfig("VotarLecturasConcurrentes", True, bool)
 
-    try:
-        participante_pregunta_id = registro_respuesta_participante.get("pregunta_id")
-        participante_votacion_id = registro_respuesta_participante.get("votacionID")
-
-        if participante_pregunta_id is None or participante_votacion_id is None:
-            print("Advertencia: El JSON del participante debe contener 'pregunta_id' y 'votacionID'.")
-            return False
-        
-        votacion_id_completa = json_votacion_completa.get("votacionID")
-        preguntas_de_votacion = json_votacion_completa.get("preguntas", []) 
-
-        if votacion_id_completa is None:
-            print("Advertencia: El JSON completo de la votación debe contener 'votacionID'.")
-            return False
-        if participante_votacion_id != votacion_id_completa:
-            print(f"Mismatch: La votacionID del participante ({participante_votacion_id}) no coincide con la votacionID de la votación completa ({votacion_id_completa}).")
-            return False
-        pregunta_encontrada_en_votacion = False
-        for pregunta_en_votacion in preguntas_de_votacion:
-            if pregunta_en_votacion.get("preguntaID") == participante_pregunta_id:
-                pregunta_encontrada_en_votacion = True
-                break
-        
-        if not pregunta_encontrada_en_votacion:
-            print(f"Mismatch: La pregunta_id del participante ({participante_pregunta_id}) no se encontró en la lista de preguntas de la votación con ID {votacion_id_completa}.")
-            return False
-        return True
-
-    except Exception as e:
-        print(f"Ocurrió un error inesperado durante la validación: {e}")
-        return False
-
-
-def validarFechas(json_votacion: dict) -> bool:
-
-    try:
-        fecha_inicio_str = json_votacion.get("fechaInicio")
-        fecha_fin_str = json_votacion.get("fechaFin")
-
-        if not fecha_inicio_str or not fecha_fin_str:
-            print("Error: El JSON de la votación debe contener 'fechaInicio' y 'fechaFin'.")
-            return False
-
-        fecha_inicio_dt = datetime.fromisoformat(fecha_inicio_str).replace(tzinfo=timezone.utc)
-        fecha_fin_dt = datetime.fromisoformat(fecha_fin_str).replace(tzinfo=timezone.utc)
-        
-        fecha_actual_utc = datetime.now(timezone.utc)
 
-        if fecha_inicio_dt <= fecha_actual_utc <= fecha_fin_dt:
-            return True
-        else:
-            return False
-
-    except ValueError as e:
-        print(f"Error al parsear las fechas del JSON. Asegúrate de que estén en formato ISO 8601 (YYYY-MM-DDTHH:MM:SS): {e}")
-        return False
-    except Exception as e:
-        print(f"Ocurrió un error inesperado durante la validación: {e}")
-        return False
-    
-
-
-async def getVotacionPorPreguntaID(session, pregunta_id: int) -> Optional[dict]:
-    query = (
-        select(Votacion)
-        .join(Votacion.preguntas) 
-        .join(VotacionPregunta.pregunta)  
-        .outerjoin(Pregunta.respuestas)  
-        .where(Pregunta.preguntaID == pregunta_id) 
-        .options(
-            contains_eager(Votacion.preguntas).contains_eager(VotacionPregunta.pregunta).contains_eager(Pregunta.respuestas)
-        )
+def respuestaPreguntaEnVariasVotaciones(e: PreguntaEnVariasVotaciones) -> func.HttpResponse:
+    return func.HttpResponse(
+        aJson({"error": str(e), "codigo": "PREGUNTA_EN_VARIAS_VOTACIONES"}),
+        status_code=409,
+        mimetype="application/json"
     )
 
-    result = await session.execute(query)
-    votacion_instance = result.scalars().first()
 
-    if not votacion_instance:
-        return None 
-    votacion_data = {
-        "votacionID": votacion_instance.votacionID,
-        "titulo": votacion_instance.titulo,
-        "descripcion": votacion_instance.descripcion,
-        "fechaInicio": votacion_instance.fechaInicio.isoformat(),
-        "fechaFin": votacion_instance.fechaFin.isoformat(),
-        "estadoVotacionId": votacion_instance.estadoVotacionId,
-        "privada": votacion_instance.privada,
-        "esSecreta": votacion_instance.esSecreta,
-        "preguntas": []
-    }
-    preguntas_set = set()
-
-    for vp_assoc in votacion_instance.preguntas:
-        pregunta = vp_assoc.pregunta
-        if pregunta.preguntaID not in preguntas_set:
-            preguntas_set.add(pregunta.preguntaID)
-            pregunta_data = {
-                "preguntaID": pregunta.preguntaID,
-                "enunciado": pregunta.enunciado,
-                "tipoPreguntaID": pregunta.tipoPreguntaID,
-                "maxSelecciones": pregunta.maxSelecciones,
-                "fechaPublicacion": pregunta.fechaPublicacion.isoformat(),
-                "respuestas": []
-            }
-            
-            # Iterar sobre las respuestas de la pregunta
-            for respuesta in pregunta.respuestas: # 'respuestas' cargadas por eager load
-                pregunta_data["respuestas"].append({
-                    "respuestaID": respuesta.respuestaID,
-                    "respuesta": respuesta.respuesta,
-                    "value": respuesta.value
-                })
-            
-            votacion_data["preguntas"].append(pregunta_data)
-            
-    return votacion_data
-
-async def obtenerLlave(session, usuario_id: int) -> LlaveUsuario:
-    try:
-        result = await session.execute(
-            select(LlaveUsuario)
-            .where(
-                LlaveUsuario.usuarioID == usuario_id,
-                LlaveUsuario.esActiva == True 
-            )
-            .order_by(desc(LlaveUsuario.ultimaModificacion))
-        )
-        
-        llave = result.scalar_one_or_none()
-        if not llave:
-            logging.warning(f"No hay llave activa para usuario ID: {usuario_id}")
-            raise ValueError("No se encontró llave criptográfica activa")
-        logging.info(f"Llave encontrada para usuario ID: {usuario_id}")
-        return llave
-    except Exception as e:
-        logging.error(f"Error al consultar llave: {str(e)}", exc_info=True)
-        raise ValueError("Error al verificar credenciales")
-
-def generarChecksum(valor: str) -> bytes:
-    return hashlib.sha256(valor.encode()).digest()
-
-async def insertarLog(
-    session: Session,
-    descripcion: str,
-    computador: str,
-    usuario: str,
-    trace: str = "API/ENDPOINT/listarVotos",  
-    refId1: int = None,
-    refId2: int = None,
-    valor1: str = None,
-    valor2: str = None,
-    checksum: str = "2025API/20END25OINT06/listarVotos26",  
-    tipologid: int = 1,     
-    origenlogid: int = 1,   
-    logseveridadid: int = 1 ):
-    log_entry = Log(
-        descripcion=descripcion,
-        timestamp=datetime.utcnow(),
-        computador=computador,
-        usuario=usuario,
-        trace=trace,
-        refId1=refId1,
-        refId2=refId2,
-        valor1=valor1,
-        valor2=valor2,
-        checksum=generarChecksum(checksum),
-        tipologid=tipologid,
-        origenlogid=origenlogid,
-        logseveridadid=logseveridadid
+def respuestaYaVoto() -> func.HttpResponse:
+    return func.HttpResponse(
+        aJson({
+            "error": "Este usuario ya votó para esta pregunta.",
+            "codigo": "506"
+        }),
+        status_code=500,
+        mimetype="application/json"
     )
-    session.add(log_entry)
-    await session.commit()
-
-async def obtenerRespuestasParticipantes(session, llaveCifrada, usuario) -> List[dict]:
-    try:
-        query = (
-            select(
-                RespuestaParticipante.respuestaParticipanteID,
-                RespuestaParticipante.preguntaID,
-                RespuestaParticipante.ncRespuesta,
-                Votacion.votacionID
-            )
-            .select_from(RespuestaParticipante)
-            .join(Pregunta, RespuestaParticipante.preguntaID == Pregunta.preguntaID)
-            .join(Respuesta, RespuestaParticipante.respuestaID == Respuesta.respuestaID)
-            .join(VotacionPregunta, VotacionPregunta.preguntaID == Pregunta.preguntaID)
-            .join(Votacion, Votacion.votacionID == VotacionPregunta.votacionID)
-        )
-        result = await session.execute(query)
-        respuestas = []
-        for row in result:
-            respuesta = {
-                "respuesta_participante_id": row.respuestaParticipanteID,
-                "pregunta_id": row.preguntaID,
-                "nc_respuesta": row.ncRespuesta, 
-                "votacionID": row.votacionID
-            }
-            if await verificarRespuesta(session, respuesta['nc_respuesta'], llaveCifrada, usuario):
-                respuestas.append(respuesta)
 
-        return respuestas
-    except Exception as e:
-        logging.error(f"Error al consultar respuestas de participantes: {str(e)}", exc_info=True)
-        raise ValueError("Error al obtener respuestas de participantes")
-
-async def verificarRespuesta(session, ncRespuesta, llaveCifrada, usuario) -> bool:
-    try:
-        if not ncRespuesta:
-            return False
-        result = await session.execute(
-            text("""
-                SELECT DECRYPTBYPASSPHRASE(:llaveCifrada, :nc_respuesta) AS nc_desencriptado
-            """),
-            {
-                "llaveCifrada": llaveCifrada,
-                "nc_respuesta": ncRespuesta
-            }
-        )
-        nc_desencriptado = result.scalar_one_or_none()
-        if nc_desencriptado != None:
-            logging.info(nc_desencriptado)
-            logging.info(usuario)
-            return nc_desencriptado.decode('utf-8') == str(usuario)
-        return False
-    except Exception as e:
-        logging.error(f"Error desencriptando ncRespuesta: {str(e)}")
-        return False
-
-async def obtenerUsuario(session, cedula) -> Usuario | None:
-    try:
-        result = await session.execute(
-            select(Usuario)
-            .where(Usuario.identificacion == cedula)
-            .options(selectinload(Usuario.llaves))
-        )
-        return result.scalar_one_or_none()
-    except Exception as e:
-        logging.error(f"Error en consulta de usuario: {str(e)}", exc_info=True)
-        raise ValueError("Error al consultar usuario en la base de datos")
-    
 
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        dto = VotoDTO(**req.get_json())
+        dto = leerDto(req, VotoDTO)
     except ValidationError as e:
         return func.HttpResponse(e.json(), status_code=400)
+    tokenSesion = tokenDeSolicitud(req) or dto.tokenSesion
+    if not tokenSesion and not (dto.cedulaUsuario and dto.contrasenia and dto.prueba_vida):
+        return func.HttpResponse(
+            aJson({"error": "Se requiere tokenSesion o cedulaUsuario, contrasenia y prueba_vida"}),
+            status_code=400,
+            mimetype="application/json"
+        )
 
     try:
-        async with get_session() as session:
-            usuario = await obtenerUsuario(session, dto.cedulaUsuario)
-            if not usuario:  #VALIDAMOS QUE EL USUARIO EXISTA EN EL SISTEMA  
-                await insertarLog(
-                    session=session,
-                    descripcion="Usuario no encontrado",
-                    computador="votar/endpoint",
-                    usuario=dto.cedulaUsuario,
-                    tipologid=1,
-                    origenlogid=2,
-                    logseveridadid=2
-                )
-                return func.HttpResponse(
-                    json.dumps({"error": "Credenciales inválidas"}),
-                    status_code=401,
-                    mimetype="application/json"
-                )
-            
-            llaveActiva = await obtenerLlave(session, usuario.userid)
+        async with unidadDeTrabajo() as session:
+            credenciales = None
             try:
-                resultado = await session.execute(
-                    text("""
-                        SELECT DECRYPTBYPASSPHRASE(:pass, :llave) AS llave_desencriptada
-                        WHERE :llave IS NOT NULL
-                    """),
-                    {
-                        "pass": dto.contrasenia.get_secret_value(),
-                        "llave": llaveActiva.llaveCifrada
-                    }
-                )
-                llave_desencriptada = resultado.scalar_one_or_none()
-                if llave_desencriptada is None:
-                    await insertarLog(
-                        session=session,
-                        descripcion="Fallo de descifrado de llave",
-                        computador="listarVotos/endpoint",
-                        usuario=str(usuario.userid),
-                        refId1=usuario.userid,
-                        tipologid=2,
-                        origenlogid=2,
-                        logseveridadid=3
-                    )
-                    logging.warning(f"Fallo de descifrado para usuario ID: {usuario.userid}")
-                    return func.HttpResponse(
-                        json.dumps({
-                            "error": "Credenciales inválidas",
-                            "codigo": "AUTH_FAILED"
-                        }),
-                        status_code=401,
-                        mimetype="application/json"
+                if (not tokenSesion and LECTURAS_CONCURRENTES and not cacheBoletas.contiene(dto.preguntaID)
+                        and await replicaDisponible()):
+                    # La boleta no depende del usuario: se lee en la réplica mientras la sesión de la
+                    # petición verifica las credenciales. Nunca se toma una segunda conexión del
+                    # primario teniendo ya una (respaldo=False): si la réplica falla, se lee después
+                    boleta, credenciales = await asyncio.gather(
+                        obtenerBoleta(None, dto.preguntaID, respaldo=False),
+                        verificarCredenciales(
+                            session, dto.cedulaUsuario, dto.contrasenia.get_secret_value(), "votar/endpoint"
+                        ),
+                        return_exceptions=True,
                     )
-                llave_desencriptada = llave_desencriptada.decode('utf-8')
-                logging.info(f"Autenticación exitosa para usuario ID: {usuario.userid}")
-            except Exception as e:
-                await insertarLog(
-                    session=session,
-                    descripcion="Error técnico en verificación de contraseña",
-                    computador="listarVotos/endpoint",
-                    usuario=str(usuario.userid),
-                    refId1=usuario.userid,
-                    trace=str(e),
-                    tipologid=2,
-                    origenlogid=2,
-                    logseveridadid=5
-                )
-                logging.error(f"Error técnico al verificar contraseña: {str(e)}", exc_info=True)
+                    if isinstance(boleta, ReplicaNoDisponible):
+                        boleta = await obtenerBoleta(session, dto.preguntaID)
+                    elif isinstance(boleta, BaseException):
+                        raise boleta
+                else:
+                    # Con la boleta en cache estas validaciones no tocan la base de datos
+                    boleta = await obtenerBoleta(session, dto.preguntaID)
+            except PreguntaEnVariasVotaciones as e:
+                return respuestaPreguntaEnVariasVotaciones(e)
+            marcarEtapa("votacion")
+            if boleta is None or not boleta.abierta():
                 return func.HttpResponse(
-                    json.dumps({
-                        "error": "Error interno en verificación",
-                        "codigo": "INTERNAL_ERROR"
+                    aJson({
+                        "error": "Votación invalida, la fecha ya pasó, o la fecha de inicio no ha llegado.",
+                        "codigo": "404"
                     }),
                     status_code=500,
                     mimetype="application/json"
                 )
-            documento = Documento(
-                nombre=f"{usuario.userid}-PruebaVida",
-                fechaCreacion=datetime.now(),
-                tipoDocumentoID=10,
-                estadoDocumentoID=4,
-                ultimaModificacion=datetime.now(),
-                esActual=True,
-                idLegal=f"{usuario.userid}_PV",
-                checksum=generarChecksum(dto.prueba_vida),
-            )
-            session.add(documento)
-            await session.commit()
-
-            votacionJSON = await getVotacionPorPreguntaID(session, dto.preguntaID)
-            if not validarFechas(votacionJSON): 
+            rechazo = boleta.restricciones.rechazo(ipDeSolicitud(req))
+            if rechazo is not None:
                 return func.HttpResponse(
-                    json.dumps({
-                        "error": "Votación invalida, la fecha ya pasó, o la fecha de inicio no ha llegado.",
-                        "codigo": "404"
-                    }),
-                    status_code=500,
+                    aJson({"error": "La votación no admite votos desde esta red o a esta hora.", "codigo": rechazo}),
+                    status_code=403,
                     mimetype="application/json"
                 )
-            
-            if not validarVotoUsuario(obtenerRespuestasParticipantes(session, llave_desencriptada, usuario), votacionJSON):
+            if not boleta.admiteRespuesta(dto.preguntaID, dto.respuestaID):
                 return func.HttpResponse(
-                    json.dumps({
-                        "error": "Este usuario ya votó para esta pregunta.",
-                        "codigo": "506"
+                    aJson({
+                        "error": "La respuesta no pertenece a la pregunta.",
+                        "codigo": "RESPUESTA_INVALIDA"
                     }),
-                    status_code=500,
+                    status_code=400,
                     mimetype="application/json"
                 )
-            
-            result = await session.execute( 
-                 text("""
-                        SELECT ENCRYPTBYPASSPHRASE(:pass, :llave) AS llave_desencriptada
-                        WHERE :llave IS NOT NULL
-                    """),
-                    {
-                        "pass": llave_desencriptada,
-                        "llave": str(usuario.userid)
-                    }
-                )
-            #async with session.begin():
-            voto = RespuestaParticipante(
-                    preguntaID = dto.preguntaID,
-                    respuestaID = dto.respuestaID,
-                    checksum = hashlib.sha256("RespuestaParticipante".encode('utf-8')).digest(),
-                    valor = dto.valor,
-                    fechaRespuesta = datetime.now(),
-                    ncRespuesta = result.scalar_one(),
-                    tokenGUID = str(uuid.uuid4()),
-                    pesoRespuesta = dto.pesoRespuesta
+
+            if tokenSesion:
+                # Sesión emitida por sesionVotacion: se verifica en proceso, sin consultar credenciales
+                try:
+                    sesion = verificarToken(tokenSesion)
+                except TokenInvalido as e:
+                    return func.HttpResponse(
+                        aJson({"error": str(e), "codigo": "TOKEN_INVALIDO"}),
+                        status_code=401,
+                        mimetype="application/json"
+                    )
+                if sesion.votacionID != boleta.votacionID:
+                    return func.HttpResponse(
+                        aJson({"error": "El token no corresponde a esta votación", "codigo": "TOKEN_VOTACION"}),
+                        status_code=403,
+                        mimetype="application/json"
+                    )
+                usuarioID, llave_desencriptada = sesion.usuarioID, sesion.llave
+                marcarEtapa("token")
+            else:
+                try:
+                    if credenciales is None:
+                        credenciales = await verificarCredenciales(
+                            session, dto.cedulaUsuario, dto.contrasenia.get_secret_value(), "votar/endpoint"
+                        )
+                    elif isinstance(credenciales, BaseException):
+                        raise credenciales
+                    usuario, llave_desencriptada = credenciales
+                except CredencialesInvalidas as e:
+                    return func.HttpResponse(
+                        aJson({"error": str(e), "codigo": e.codigo} if e.codigo else {"error": str(e)}),
+                        status_code=401,
+                        mimetype="application/json"
+                    )
+                except ErrorVerificacion:
+                    return func.HttpResponse(
+                        aJson({
+                            "error": "Error interno en verificación",
+                            "codigo": "INTERNAL_ERROR"
+                        }),
+                        status_code=500,
+                        mimetype="application/json"
+                    )
+                usuarioID = usuario.userid
+                registrarPruebaVida(session, usuarioID, dto.prueba_vida)
+
+            if RESPALDO_LEGADO:
+                # Votos anteriores a huellaVotante: se les asigna huella para que choquen con el índice único
+                await completarHuellas(session, usuarioID, llave_desencriptada, dto.preguntaID)
+            marcarEtapa("duplicado")
+            segmentos, pesoID = await segmentosYPeso(session, usuarioID, boleta)
+            if dto.pesoRespuesta is not None and dto.pesoRespuesta != pesoID:
+                return func.HttpResponse(
+                    aJson({"error": "El votante no tiene ese peso en esta votación", "codigo": "PESO_NO_PERMITIDO"}),
+                    status_code=403,
+                    mimetype="application/json"
                 )
-            session.add(voto)
-            await session.commit()
-        return func.HttpResponse(json.dumps({"msg": "Voto registrado"}),
+
+            if cifradoLocal():
+                ncRespuesta = cifrarUsuario(llave_desencriptada, usuarioID)
+            else:
+                ncRespuesta = await cifrarUsuarioSql(session, llave_desencriptada, usuarioID)
+            fila = {
+                "preguntaID": dto.preguntaID,
+                "respuestaID": dto.respuestaID,
+                "checksum": hashlib.sha256("RespuestaParticipante".encode('utf-8')).digest(),
+                "valor": dto.valor,
+                "fechaRespuesta": datetime.now(),
+                "ncRespuesta": ncRespuesta,
+                "tokenGUID": str(uuid.uuid4()),
+                "pesoRespuesta": pesoID,
+                "huellaVotante": huellaVotante(usuarioID, dto.preguntaID),
+                "huellaUsuario": huellaUsuario(usuarioID),
+            }
+            marcarEtapa("cifrado")
+            if ESCRITURA_DIFERIDA:
+                # El voto se anexa al diario después del commit de la prueba de vida
+                if await diarioVotos.yaRegistrado(session, fila["huellaVotante"]):
+                    return respuestaYaVoto()
+                fila["participacion"] = {"votacionID": boleta.votacionID, "segmentos": list(segmentos)}
+            else:
+                try:
+                    # El savepoint conserva la prueba de vida si el voto choca con el índice único
+                    async with session.begin_nested():
+                        session.add(RespuestaParticipante(**fila))
+                        await session.flush()
+                        await sumarVotos(session, [fila])
+                        await sumarParticipacion(session, [(boleta.votacionID, segmentos, fila["fechaRespuesta"])])
+                except IntegrityError:
+                    return respuestaYaVoto()
+        marcarEtapa("commit")
+        if ESCRITURA_DIFERIDA:
+            if not await diarioVotos.registrar(fila):
+                return respuestaYaVoto()
+            marcarEtapa("diario")
+            return func.HttpResponse(aJson({"msg": "Voto recibido", "tokenGUID": fila["tokenGUID"]}),
+                                  status_code=202,
+                                  mimetype="application/json")
+        indiceRecibos.agregar(fila["tokenGUID"])
+        return func.HttpResponse(aJson({"msg": "Voto registrado", "tokenGUID": fila["tokenGUID"]}),
                               mimetype="application/json")
     
     
 
     except Exception as ex:
         return func.HttpResponse(
-            json.dumps({"error": str(ex)}),
+            aJson({"error": str(ex)}),
             mimetype="application/json",
             status_code=500,
         )
@@ -444,44 +257,50 @@ La función espera un JSON en el cuerpo de la solicitud HTTP POST, que debe coin
 | `preguntaID`    | `int`       | ID de la pregunta a la que el usuario está votando.                  | `1`                 |
 | `respuestaID`   | `int`       | ID de la respuesta seleccionada por el usuario para la `preguntaID`.| `1`                 |
 | `valor`         | `str`       | El texto o valor asociado a la `respuestaID` seleccionada.           | `"Mejorar el transporte público"` |
-| `pesoRespuesta` | `int`       | Un valor numérico que representa el "peso" o la ponderación de la respuesta. | `2`                 |
+| `pesoRespuesta` | `int`       | Opcional. El peso del voto lo resuelve el servidor (`pv_votacionPeso`, ver `shared.boletas`); si se manda y no coincide, `403` `PESO_NO_PERMITIDO`. | `2`                 |
+| `tokenSesion`   | `str`       | Opcional. Token de `sesionVotacion`; reemplaza `cedulaUsuario`, `contrasenia` y `prueba_vida`. También se acepta en el header `Authorization: Bearer`. | `"oQ3x..."` |
 
 ### 3. Lógica Interna y Flujo de Procesamiento
 
 1.  **Validación de Entrada (Pydantic):**
     * El cuerpo de la solicitud JSON se valida contra el `VotoDTO`. Si falla, se retorna un `400 Bad Request`.
 
-2.  **Autenticación de Usuario:**
-    * Se busca al `Usuario` por `cedulaUsuario` en la tabla `pv_usuarios` (`obtenerUsuario`).
+2.  **Validación de Votación y Pregunta:**
+    * Se obtiene la `Boleta` de la votación asociada a `dto.preguntaID` con `shared.boletas.obtenerBoleta`: fechas como `datetime` y `respuestaID` permitidos por pregunta, en un cache LRU con TTL por `preguntaID` que `configurarVotacion` invalida al confirmar. Con la boleta en cache estas validaciones no consultan la base de datos.
+    * Una pregunta pertenece a una sola votación. Si los datos la asocian a varias, no se elige ninguna: `409 Conflict` con código `PREGUNTA_EN_VARIAS_VOTACIONES` (`shared.boletas.PreguntaEnVariasVotaciones`).
+    * Si la votación no existe o no está activa según sus fechas (`boleta.abierta()`), se retorna un `500 Internal Server Error` (este código de estado podría ser más apropiado como `400 Bad Request` o `403 Forbidden`).
+    * Si la votación tiene `restriccionesIP` u `horariosPermitidos`, la IP del cliente (`X-Forwarded-For`) y la hora local se verifican contra los rangos ya compilados en la boleta (`shared.restricciones`); si no se permiten, `403` con código `IP_NO_PERMITIDA` u `HORARIO_NO_PERMITIDO`.
+    * Si `dto.respuestaID` no pertenece a `dto.preguntaID`, se retorna `400 Bad Request` con código `RESPUESTA_INVALIDA`.
+    * Con credenciales, `VotarLecturasConcurrentes=true` (por defecto), la boleta fuera del cache y una réplica disponible, la boleta se lee en la réplica en paralelo con `asyncio.gather` mientras la sesión de la petición verifica las credenciales (`shared.auth.verificarCredenciales`). Sin réplica se lee en secuencia en la misma sesión: una petición nunca retiene una conexión del primario mientras espera otra del mismo pool, lo que con muchos misses a la vez (al vencer el TTL) podía agotarlo. Si la réplica falla a mitad de la lectura, la boleta se lee después en la sesión de la petición. Los misses concurrentes de la misma pregunta comparten una sola lectura (`shared.boletas.obtenerBoleta`). Con la boleta en cache no hay nada que paralelizar. Los errores de credenciales se reportan después de validar la boleta, en el mismo orden que antes.
+
+3.  **Autenticación de Usuario:**
+    * Con `tokenSesion` (emitido por `sesionVotacion`) se verifica su firma y vencimiento en proceso (`shared.sesion.verificarToken`) y que sea de la votación de la boleta; no se consultan credenciales ni se inserta otra prueba de vida. Token inválido o vencido: `401` `TOKEN_INVALIDO`; de otra votación: `403` `TOKEN_VOTACION`.
+    * Sin token, `shared.auth.verificarCredenciales` hace los pasos siguientes (en paralelo con el paso 2, o después de él con `VotarLecturasConcurrentes=false`).
+    * Se busca al `Usuario` por `cedulaUsuario` junto con su llave activa más reciente (`llaveActiva`) en una sola consulta (`shared.auth.obtenerCredenciales`).
     * Si el usuario no existe, se registra un log y se devuelve un `401 Unauthorized`.
-    * Se obtiene la llave criptográfica `llaveActiva` del usuario desde `pv_llaveUsuario` (`obtenerLlave`).
     * Se intenta **desencriptar** `llaveActiva.llaveCifrada` usando `dto.contrasenia` como frase de paso (`DECRYPTBYPASSPHRASE`).
     * Si la desencriptación falla (retorna `None`), se registra un log de fallo de autenticación y se devuelve `401 Unauthorized`.
     * La `llave_desencriptada` resultante (que debería ser el `usuario.userid` original) se decodifica de `bytes` a `utf-8`.
 
-3.  **Registro de Prueba de Vida:**
-    * Se crea un registro en `pv_documento` (con `tipoDocumentoID=10`) para la prueba de vida del usuario, incluyendo un `checksum` SHA-256 de `dto.prueba_vida`.
+4.  **Registro de Prueba de Vida:**
+    * `shared.auth.registrarPruebaVida` agrega a la sesión de escritura un registro en `pv_documento` (con `tipoDocumentoID=10`) para la prueba de vida del usuario, incluyendo un `checksum` SHA-256 de `dto.prueba_vida`.
 
-4.  **Validación de Votación y Pregunta:**
-    * Se obtiene la información completa de la votación (`votacionJSON`) asociada a la `dto.preguntaID` (`getVotacionPorPreguntaID`).
-    * Se valida que la votación esté activa según sus fechas de inicio y fin (`validarFechas`). Si no lo está, se retorna un `500 Internal Server Error` (este código de estado podría ser más apropiado como `400 Bad Request` o `403 Forbidden`).
-    * **CRÍTICO: Verificación de voto duplicado (lógica con error):**
-        * Se llama a `obtenerRespuestasParticipantes(session, llave_desencriptada, usuario)` que devuelve una `List[dict]` de respuestas ya verificadas del usuario.
-        * Esta lista se pasa como el primer argumento a `validarVotoUsuario`. **Esto causará un `TypeError`** porque `validarVotoUsuario` espera un solo `dict` (una única `respuesta_participante`) y no una lista.
-        * **Para corregir esto, la lógica de `validarVotoUsuario` debe iterar sobre la lista de respuestas obtenidas para verificar si alguna de ellas coincide con la votación y pregunta actual, o `obtenerRespuestasParticipantes` debería filtrar por la pregunta/votación específica que se intenta registrar.** Si la intención es verificar que el usuario **no haya votado antes en esta pregunta**, la lógica debe ser revisada para:
-            1.  Consultar `pv_respuestaParticipante` para ver si ya existe un registro para `usuario.userid` y `dto.preguntaID`.
-            2.  Si existe, retornar el error apropiado.
-        * Actualmente, si la llamada a `validarVotoUsuario` (una vez corregido el `TypeError`) determina que la respuesta es "inválida" según su lógica interna, se devuelve un `500 Internal Server Error` con el mensaje "Este usuario ya votó para esta pregunta." (el código de estado `500` debería ser `409 Conflict` o `403 Forbidden`).
+5.  **Verificación de voto duplicado:**
+    * Cada voto lleva `huellaVotante` = HMAC(usuario, pregunta) con el secreto `HuellaVotanteSecreto` (`shared/huella.py`), protegida por un índice único. El voto se inserta dentro de un savepoint; si el índice rechaza la fila, el usuario ya votó en esa pregunta y se retorna `500` con el mensaje "Este usuario ya votó para esta pregunta." (código `506`), sin perder la prueba de vida. No hace falta una consulta previa. También lleva `huellaUsuario` = HMAC(usuario), con la que `listarVotos` encuentra los votos del usuario.
+    * Con `HuellaVotanteRespaldoLegado=true` (mientras haya votos sin huella; por defecto apagado) antes de insertar se ejecuta `completarHuellas` limitado a `dto.preguntaID`, que asigna huella a los votos anteriores del usuario en esa pregunta para que también choquen con el índice.
 
-5.  **Registro del Voto:**
-    * Se ejecuta una consulta SQL para **cifrar** el `usuario.userid` (convertido a `str`) usando `llave_desencriptada` (la contraseña del usuario) como frase de paso (`ENCRYPTBYPASSPHRASE`). El resultado es binario.
-    * **Corrección aplicada:** La línea `ncRespuesta = result.scalar_one()` ahora extrae correctamente el valor binario del `CursorResult`.
+6.  **Registro del Voto:**
+    * Se **cifra** el `usuario.userid` (convertido a `str`) con `llave_desencriptada` en proceso con AES-256-GCM (`shared.cifrado.cifrarUsuario`), sin ida a la base de datos. El valor guardado empieza con un byte de versión (`0xA1`); los votos anteriores, cifrados con `ENCRYPTBYPASSPHRASE`, se siguen descifrando en SQL Server. Con `CifradoNcRespuesta=sqlserver` se usa `ENCRYPTBYPASSPHRASE` como antes.
     * **Consideración de Tipo de Columna `ncRespuesta`:** Si la columna `ncRespuesta` en la tabla `pv_respuestaParticipante` es de tipo `INT`, esta asignación de un valor binario (`VARBINARY` desde SQL Server) resultará en un error de conversión de tipo en la base de datos. Para que esto funcione, `ncRespuesta` debe ser una columna de tipo `VARBINARY` en la base de datos (lo cual es lo usual para datos cifrados).
+    * El peso del voto (`pesoRespuesta`) no se toma del cliente: `shared.participacion.segmentosYPeso` lo resuelve con los segmentos del votante y `pv_votacionPeso` (el de su segmento de mayor multiplicador, si no el de la votación, si no `VotosPesoPorDefecto`), en la misma consulta que busca sus segmentos dirigidos. Así los resultados, el escrutinio y la exportación solo ven pesos asignados por el servidor.
     * Se crea una nueva instancia de `Voto` (que mapea a `pv_respuestaParticipante`) con los datos proporcionados y el `ncRespuesta` cifrado.
-    * Se añade el `voto` a la sesión y se realiza un `await session.commit()`.
+    * Se añade el `voto` a la sesión. La prueba de vida y el voto se confirman juntos en un solo flush y commit al cerrar `unidadDeTrabajo()`; si algo falla, no se guarda ninguno.
+    * Dentro del mismo savepoint, después del INSERT, el voto se suma a los contadores de resultados (`shared.resultados.sumarVotos`, una cubeta al azar de `pv_conteoRespuesta`) y a la participación del minuto (`shared.participacion`), en el total y en cada segmento dirigido de la votación al que pertenece el votante; un voto duplicado no se cuenta.
+    * Con `VotosEscrituraDiferida=true` el voto no se inserta en la petición: se revisa su huella contra el diario y la base de datos (`diarioVotos.yaRegistrado`), se confirma la prueba de vida y el voto se anexa con fsync al diario local (`shared/diario.py`). Una tarea de fondo lo inserta en lote con los demás.
 
-6.  **Respuesta Final:**
-    * Si todo es exitoso, se devuelve un `200 OK` con un mensaje de "Voto registrado".
+7.  **Respuesta Final:**
+    * Si todo es exitoso, se devuelve un `200 OK` con un mensaje de "Voto registrado" y el `tokenGUID` del voto.
+    * En escritura diferida se devuelve `202 Accepted` con "Voto recibido" y el `tokenGUID` en cuanto el voto está en el diario. Si después no se puede insertar (falla persistente o choque con otro voto del mismo votante), el voto va a la cuarentena del diario, se registra un error en `pv_logs` con su `tokenGUID` y el recibo no aparece en `verificarRecibo` (ver `shared/diario.py`).
 
 ### 4. Estructura de Respuesta Exitosa (HTTP 200 OK)
 
@@ -489,6 +308,7 @@ En caso de éxito, la función devuelve un JSON con el siguiente formato:
 
 ```json
 {
-    "msg": "Voto registrado"
+    "msg": "Voto registrado",
+    "tokenGUID": "5f0c7a8e-3c1b-4d2a-9e8f-1a2b3c4d5e6f"
 }
 """
\ No newline at end of file
@@ -0,0 +1,268 @@
+import azure.functions as func
+from shared.codec import leerDto, aJson
+from shared.dtos import BoletaDTO
+from shared.database import unidadDeTrabajo
+from shared.auth import autenticarVotante, CredencialesInvalidas, ErrorVerificacion
+from shared.sesion import verificarToken, tokenDeSolicitud, TokenInvalido
+from shared.instrumentacion import marcarEtapa
+from shared.huella import huellaVotante, huellaUsuario, completarHuellas, RESPALDO_LEGADO
+from shared.boletas import obtenerBoleta, PreguntaEnVariasVotaciones
+from shared.diario import diarioVotos, HABILITADO as ESCRITURA_DIFERIDA
+from shared.recibos import indiceRecibos
+from shared.resultados import sumarVotos
+from shared.participacion import segmentosYPeso, sumarParticipacion
+from shared.restricciones import ipDeSolicitud
+from shared.cifrado import cifradoLocal, cifrarUsuario, cifrarUsuarioSql
+from shared.models import RespuestaParticipante
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+import logging
+from datetime import datetime
+import hashlib
+import uuid
+
+# SQL Server admite como máximo 2100 parámetros por sentencia (9 columnas por fila)
+FILAS_POR_INSERT = 200
+
+
+def respuestaYaVoto() -> func.HttpResponse:
+    return func.HttpResponse(
+        aJson({
+            "error": "Este usuario ya votó en alguna pregunta de esta votación.",
+            "codigo": "506"
+        }),
+        status_code=500,
+        mimetype="application/json"
+    )
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        dto = leerDto(req, BoletaDTO)
+    except ValidationError as e:
+        return func.HttpResponse(e.json(), status_code=400, mimetype="application/json")
+    tokenSesion = tokenDeSolicitud(req) or dto.tokenSesion
+    if not tokenSesion and not (dto.cedulaUsuario and dto.contrasenia and dto.prueba_vida):
+        return func.HttpResponse(
+            aJson({"error": "Se requiere tokenSesion o cedulaUsuario, contrasenia y prueba_vida"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        async with unidadDeTrabajo() as session:
+            # Cualquier pregunta de la boleta sirve para obtener la votación completa del cache
+            try:
+                boleta = await obtenerBoleta(session, dto.respuestas[0].preguntaID)
+            except PreguntaEnVariasVotaciones as e:
+                return func.HttpResponse(
+                    aJson({"error": str(e), "codigo": "PREGUNTA_EN_VARIAS_VOTACIONES"}),
+                    status_code=409,
+                    mimetype="application/json"
+                )
+            marcarEtapa("votacion")
+            if boleta is None or boleta.votacionID != dto.votacionID or not boleta.abierta():
+                return func.HttpResponse(
+                    aJson({
+                        "error": "Votación invalida, la fecha ya pasó, o la fecha de inicio no ha llegado.",
+                        "codigo": "404"
+                    }),
+                    status_code=500,
+                    mimetype="application/json"
+                )
+            rechazo = boleta.restricciones.rechazo(ipDeSolicitud(req))
+            if rechazo is not None:
+                return func.HttpResponse(
+                    aJson({"error": "La votación no admite votos desde esta red o a esta hora.", "codigo": rechazo}),
+                    status_code=403,
+                    mimetype="application/json"
+                )
+            errores = boleta.validarSelecciones((r.preguntaID, r.respuestaID) for r in dto.respuestas)
+            if errores:
+                return func.HttpResponse(
+                    aJson({"error": "La boleta no es válida.", "codigo": "BOLETA_INVALIDA", "detalle": errores}),
+                    status_code=400,
+                    mimetype="application/json"
+                )
+
+            if tokenSesion:
+                try:
+                    sesion = verificarToken(tokenSesion)
+                except TokenInvalido as e:
+                    return func.HttpResponse(
+                        aJson({"error": str(e), "codigo": "TOKEN_INVALIDO"}),
+                        status_code=401,
+                        mimetype="application/json"
+                    )
+                if sesion.votacionID != boleta.votacionID:
+                    return func.HttpResponse(
+                        aJson({"error": "El token no corresponde a esta votación", "codigo": "TOKEN_VOTACION"}),
+                        status_code=403,
+                        mimetype="application/json"
+                    )
+                usuarioID, llave_desencriptada = sesion.usuarioID, sesion.llave
+                marcarEtapa("token")
+            else:
+                try:
+                    usuario, llave_desencriptada = await autenticarVotante(
+                        session,
+                        dto.cedulaUsuario,
+                        dto.contrasenia.get_secret_value(),
+                        dto.prueba_vida,
+                        "votarBoleta/endpoint",
+                    )
+                except CredencialesInvalidas as e:
+                    return func.HttpResponse(
+                        aJson({"error": str(e), "codigo": e.codigo} if e.codigo else {"error": str(e)}),
+                        status_code=401,
+                        mimetype="application/json"
+                    )
+                except ErrorVerificacion:
+                    return func.HttpResponse(
+                        aJson({
+                            "error": "Error interno en verificación",
+                            "codigo": "INTERNAL_ERROR"
+                        }),
+                        status_code=500,
+                        mimetype="application/json"
+                    )
+                usuarioID = usuario.userid
+
+            if RESPALDO_LEGADO:
+                await completarHuellas(session, usuarioID, llave_desencriptada)
+            marcarEtapa("duplicado")
+            segmentos, pesoID = await segmentosYPeso(session, usuarioID, boleta)
+            if any(r.pesoRespuesta is not None and r.pesoRespuesta != pesoID for r in dto.respuestas):
+                return func.HttpResponse(
+                    aJson({"error": "El votante no tiene ese peso en esta votación", "codigo": "PESO_NO_PERMITIDO"}),
+                    status_code=403,
+                    mimetype="application/json"
+                )
+
+            ahora = datetime.now()
+            checksum = hashlib.sha256("RespuestaParticipante".encode('utf-8')).digest()
+            propia = huellaUsuario(usuarioID)
+            seleccion = {}
+            filas = []
+            for respuesta in dto.respuestas:
+                # Posición de la respuesta dentro de su pregunta: la primera lleva la huella de un voto simple
+                posicion = seleccion[respuesta.preguntaID] = seleccion.get(respuesta.preguntaID, -1) + 1
+                if cifradoLocal():
+                    ncRespuesta = cifrarUsuario(llave_desencriptada, usuarioID)
+                else:
+                    ncRespuesta = await cifrarUsuarioSql(session, llave_desencriptada, usuarioID)
+                filas.append({
+                    "preguntaID": respuesta.preguntaID,
+                    "respuestaID": respuesta.respuestaID,
+                    "checksum": checksum,
+                    "valor": respuesta.valor,
+                    "fechaRespuesta": ahora,
+                    "ncRespuesta": ncRespuesta,
+                    "tokenGUID": str(uuid.uuid4()),
+                    "pesoRespuesta": pesoID,
+                    "huellaVotante": huellaVotante(usuarioID, respuesta.preguntaID, posicion),
+                    "huellaUsuario": propia,
+                })
+            marcarEtapa("cifrado")
+            if ESCRITURA_DIFERIDA and diarioVotos.pendientes(fila["huellaVotante"] for fila in filas):
+                return respuestaYaVoto()
+            try:
+                # Todas las respuestas o ninguna; el savepoint conserva la prueba de vida si hay duplicado
+                async with session.begin_nested():
+                    for inicio in range(0, len(filas), FILAS_POR_INSERT):
+                        await session.execute(insert(RespuestaParticipante).values(filas[inicio:inicio + FILAS_POR_INSERT]))
+                    await sumarVotos(session, filas)
+                    await sumarParticipacion(session, [(boleta.votacionID, segmentos, fila["fechaRespuesta"]) for fila in filas])
+            except IntegrityError:
+                return respuestaYaVoto()
+        marcarEtapa("commit")
+        for fila in filas:
+            indiceRecibos.agregar(fila["tokenGUID"])
+        return func.HttpResponse(
+            aJson({
+                "msg": "Boleta registrada",
+                "votacionID": boleta.votacionID,
+                "respuestas": [
+                    {"preguntaID": fila["preguntaID"], "respuestaID": fila["respuestaID"], "tokenGUID": fila["tokenGUID"]}
+                    for fila in filas
+                ],
+            }),
+            mimetype="application/json"
+        )
+    except Exception as ex:
+        logging.error(f"Error al registrar boleta: {str(ex)}", exc_info=True)
+        return func.HttpResponse(
+            aJson({"error": str(ex)}),
+            mimetype="application/json",
+            status_code=500,
+        )
+
+
+"""
+Función principal: main(req: func.HttpRequest) -> func.HttpResponse
+Nombre: votarBoleta
+
+Ruta: POST /api/votarBoleta
+
+Descripción general:
+    Registra la boleta completa de una votación en una sola petición: una
+    autenticación (o un token de `sesionVotacion`), una validación contra la
+    definición de la boleta y un único INSERT de varias filas en
+    `pv_respuestaParticipante` dentro de una transacción. Con `votar` hacían
+    falta una petición, una autenticación y una transacción por pregunta.
+
+Parámetros de entrada (JSON en el body, `BoletaDTO`):
+    - votacionID (int)
+    - respuestas (list): una entrada por respuesta elegida, con preguntaID,
+      respuestaID, valor y, opcional, pesoRespuesta. Una pregunta con
+      `maxSelecciones > 1` puede aparecer varias veces. El peso lo resuelve el
+      servidor para todas las filas (`Boleta.pesoDelVotante`); un
+      pesoRespuesta distinto se rechaza con `403` `PESO_NO_PERMITIDO`.
+    - cedulaUsuario, contrasenia, prueba_vida: credenciales, o bien
+    - tokenSesion: token de `sesionVotacion` (también en `Authorization: Bearer`)
+
+Ejemplo:
+{
+    "votacionID": 1,
+    "respuestas": [
+        {"preguntaID": 1, "respuestaID": 11, "valor": "Sí", "pesoRespuesta": 1},
+        {"preguntaID": 2, "respuestaID": 21, "valor": "Transporte", "pesoRespuesta": 1},
+        {"preguntaID": 2, "respuestaID": 22, "valor": "Salud", "pesoRespuesta": 1}
+    ],
+    "cedulaUsuario": "100000000",
+    "contrasenia": "JUGAHE0000",
+    "prueba_vida": "Prueba de Vida"
+}
+
+Lógica interna:
+    1. Obtiene la `Boleta` desde el cache de `shared.boletas` y verifica que sea
+       de `votacionID` y esté dentro de sus fechas. Si la pregunta está en
+       varias votaciones no se elige ninguna: `409`
+       `PREGUNTA_EN_VARIAS_VOTACIONES`.
+    2. Aplica las restricciones de IP y horario de la votación (`403`
+       `IP_NO_PERMITIDA` / `HORARIO_NO_PERMITIDO`) y `Boleta.validarSelecciones`: toda pregunta de la votación contestada,
+       respuestas permitidas y sin repetir, y a lo sumo `maxSelecciones` por
+       pregunta. Los errores se devuelven todos juntos en `detalle`.
+    3. Autentica con el token o con `autenticarVotante` (prueba de vida incluida).
+    4. Cifra `ncRespuesta` por fila y calcula `huellaVotante` por posición
+       dentro de la pregunta y `huellaUsuario`, igual en todas las filas (ver
+       `shared.huella`).
+    5. Inserta todas las filas con un INSERT multi-fila dentro de un savepoint:
+       si alguna choca con el índice único de `huellaVotante` no se guarda
+       ninguna respuesta, pero sí la prueba de vida. En el mismo savepoint se
+       suman a los contadores de resultados (`shared.resultados`) y a la
+       participación por minuto (`shared.participacion`).
+
+La boleta se inserta siempre en la transacción de la petición, también con
+`VotosEscrituraDiferida=true`, para que sea todo o nada; en ese modo se revisa
+además que ninguna huella esté pendiente en el diario.
+
+Flujo de respuesta:
+    - 200 OK: boleta registrada, con el tokenGUID de cada respuesta
+    - 400 Bad Request: error de validación o boleta inválida (BOLETA_INVALIDA)
+    - 401 Unauthorized: credenciales o token inválidos
+    - 403 Forbidden: token de otra votación, o IP u horario no permitidos
+    - 500: votación inexistente o cerrada (codigo 404), voto duplicado
+      (codigo 506) o error interno
+"""
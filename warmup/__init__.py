@@ -0,0 +1,20 @@
+import logging
+import azure.functions as func
+from api import asegurarInicio
+from shared.database import estadoPool
+
+
+async def main(warmupContext: func.Context) -> None:
+    await asegurarInicio()
+    logging.info(f"Worker precalentado: {estadoPool()['libres']} conexiones libres")
+
+"""
+Función principal: main(warmupContext: func.Context) -> None
+Nombre: warmup
+
+Descripción general:
+    Se ejecuta cuando el host agrega una instancia nueva (planes Premium/Elastic)
+    antes de que reciba tráfico. Dispara el startup de la app ASGI de `api`
+    (configura los mappers del ORM, crea el engine y abre `SqlPoolPrecalentar`
+    conexiones) para que las primeras peticiones no esperen el login a SQL Server.
+"""